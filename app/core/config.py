@@ -1,5 +1,8 @@
+import logging
 import os
+import secrets
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from dotenv import load_dotenv
@@ -15,11 +18,136 @@ SMTP_PORT = os.getenv('SMTP_PORT')
 class Settings(BaseSettings):
     APP_NAME: str = "ToDoList"
     DEBUG: bool = True
+    # Ключ подписи сессионных токенов — один на все процессы и перезапуски. Обязателен при DEBUG=false;
+    # в режиме отладки без него создаётся случайный ключ процесса (сессии не переживут перезапуск)
+    SECRET_KEY: str | None = None
+    # Срок жизни сессии: с "Запомнить меня" и без (сек.)
+    SESSION_MAX_AGE: int = 60 * 60 * 24 * 30
+    SESSION_SHORT_MAX_AGE: int = 60 * 60 * 24
+    # Кэш пользователей для сессий: размер и время жизни записи (сек.)
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: float = 60.0
     SMTP_SERVER: str = SMTP_SERVER
     SMTP_PORT: int = SMTP_PORT
     SMTP_USER: str = SMTP_USER
     SMTP_PASSWORD: str = SMTP_PASSWORD
+    SMTP_USE_SSL: bool = True
+    # Соединение с SMTP закрывается, если простаивает дольше (сек.)
+    SMTP_IDLE_TIMEOUT: float = 60.0
+    # Профиль SQLite: путь к файлу (по умолчанию app/database/DataBase.db), логирование SQL и PRAGMA
+    DB_PATH: str | None = None
+    DB_ECHO: bool = False
+    DB_JOURNAL_MODE: str = "WAL"
+    DB_SYNCHRONOUS: str = "NORMAL"
+    DB_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_CACHE_SIZE: int = -64000  # отрицательное значение — размер в КиБ
+    DB_BUSY_TIMEOUT: int = 5000  # мс
+    # Размер пула соединений только для чтения (запись идёт через одно соединение)
+    DB_READ_POOL_SIZE: int = 4
+    # Групповая фиксация: записи запросов копятся до WINDOW секунд (не больше MAX_BATCH) и фиксируются одним COMMIT.
+    # Выключена по умолчанию: запросы всё равно занимают писателя по одному, и в benchmarks.bench_group_commit
+    # она не быстрее фиксации на каждый запрос — включать, только если бенчмарк на своём диске показывает выигрыш
+    DB_GROUP_COMMIT: bool = False
+    DB_GROUP_COMMIT_WINDOW: float = 0.002
+    DB_GROUP_COMMIT_MAX_BATCH: int = 64
+    # Аренда места в пачке: сессия, не зафиксировавшая запись за LEASE секунд, теряет её, а пачка идёт дальше
+    DB_GROUP_COMMIT_LEASE: float = 1.0
+    # Шардирование по пользователям: число файлов БД (шард 0 — DB_PATH, шард N — DataBase.shardN.db рядом с ним)
+    # и кэш каталога «пользователь → шард»: размер и время жизни записи (сек.)
+    DB_SHARDS: int = 1
+    SHARD_CACHE_SIZE: int = 10000
+    SHARD_CACHE_TTL: float = 300.0
+    # Размер страницы списка задач (по умолчанию и максимальный)
+    TODOS_PAGE_SIZE: int = 20
+    TODOS_MAX_PAGE_SIZE: int = 100
+    # Теги задачи: не больше TODO_TAGS_MAX на задачу, длина имени — до TAG_MAX_LENGTH символов
+    TODO_TAGS_MAX: int = 20
+    TAG_MAX_LENGTH: int = 50
+    # Кэш байткода шаблонов (каталог по умолчанию — во временной папке пользователя)
+    TEMPLATE_BYTECODE_CACHE: bool = True
+    TEMPLATE_CACHE_DIR: str | None = None
+    # Кэш отрендеренных списков задач: общий предел памяти и предел одного фрагмента (байт)
+    RENDER_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RENDER_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024
+    # Размер страницы результатов поиска
+    SEARCH_PAGE_SIZE: int = 20
+    # Максимум элементов в одном пакетном запросе
+    TODOS_BULK_MAX: int = 1000
+    # Пул процессов для bcrypt: число воркеров, предел очереди и таймаут (сек.)
+    HASH_WORKERS: int = 2
+    HASH_MAX_PENDING: int = 64
+    HASH_TIMEOUT: float = 5.0
+    # Очередь исходящих писем: размер пачки, период опроса, число попыток и backoff (сек.)
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_POLL_INTERVAL: float = 5.0
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BASE: float = 30.0
+    OUTBOX_RETRY_MAX: float = 3600.0
+    OUTBOX_LEASE: float = 120.0
+    # Ограничение частоты запросов к входу, регистрации и восстановлению пароля:
+    # запросов за период (сек.) с одного IP и на одно имя пользователя / email; 0 — без ограничения
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PERIOD: float = 60.0
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    RATE_LIMIT_LOGIN_PER_IP: int = 20
+    RATE_LIMIT_LOGIN_PER_USER: int = 5
+    RATE_LIMIT_REGISTER_PER_IP: int = 10
+    RATE_LIMIT_RECOVERY_PER_IP: int = 5
+    RATE_LIMIT_RECOVERY_PER_EMAIL: int = 3
+    RATE_LIMIT_RESET_PER_IP: int = 10
+    # Адаптивное ограничение одновременных запросов по классам маршрутов (вход/регистрация, чтение, запись):
+    # начальный и наибольший лимит, длина очереди ожидания; таймаут ожидания в очереди (сек.)
+    # и во сколько раз задержка может превысить базовую, прежде чем лимит начнёт снижаться
+    CONCURRENCY_LIMIT_ENABLED: bool = True
+    CONCURRENCY_AUTH_LIMIT: int = 4
+    CONCURRENCY_AUTH_MAX_LIMIT: int = 16
+    CONCURRENCY_AUTH_QUEUE: int = 32
+    CONCURRENCY_READ_LIMIT: int = 32
+    CONCURRENCY_READ_MAX_LIMIT: int = 256
+    CONCURRENCY_READ_QUEUE: int = 256
+    CONCURRENCY_WRITE_LIMIT: int = 16
+    CONCURRENCY_WRITE_MAX_LIMIT: int = 64
+    CONCURRENCY_WRITE_QUEUE: int = 128
+    CONCURRENCY_QUEUE_TIMEOUT: float = 2.0
+    CONCURRENCY_LATENCY_TOLERANCE: float = 2.0
+    # Экспорт: строк на одну выборку курсора; импорт: строк в одном INSERT, предел сообщений об ошибках
+    # и длина одной строки файла (символов)
+    EXPORT_BATCH_SIZE: int = 1000
+    IMPORT_CHUNK_SIZE: int = 500
+    IMPORT_MAX_ERRORS: int = 100
+    IMPORT_MAX_LINE_LENGTH: int = 1024 * 1024
+    # Живые обновления (SSE): очередь подписчика, подключений на пользователя, интервал heartbeat (сек.)
+    SSE_QUEUE_SIZE: int = 100
+    SSE_MAX_SUBSCRIBERS_PER_USER: int = 5
+    SSE_HEARTBEAT: float = 15.0
+    # Напоминания: окно в памяти (сек. вперёд и число напоминаний), пачка писем, полная пересинхронизация (сек.)
+    REMINDERS_ENABLED: bool = True
+    REMINDER_HORIZON: float = 3600.0
+    REMINDER_HEAP_SIZE: int = 1000
+    REMINDER_BATCH_SIZE: int = 100
+    REMINDER_RESYNC_INTERVAL: float = 600.0
+    # Архивация выполненных задач: возраст с момента выполнения (дни), размер пачки и период запуска (сек.)
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_AFTER_DAYS: float = 30.0
+    ARCHIVE_BATCH_SIZE: int = 500
+    ARCHIVE_INTERVAL: float = 3600.0
+    # Метрики в формате Prometheus на /metrics; порог повторов одного SQL-запроса для признака N+1
+    METRICS_ENABLED: bool = True
+    # Токен для опроса /metrics (Authorization: Bearer <token>); пока он не задан, /metrics отвечает 404
+    METRICS_TOKEN: str = ""
+    METRICS_N_PLUS_ONE_THRESHOLD: int = 10
 
+    @model_validator(mode="after")
+    def _check_secret_key(self):
+        if not self.SECRET_KEY:
+            if not self.DEBUG:
+                raise ValueError("SECRET_KEY must be set when DEBUG is false")
+            logging.getLogger(__name__).warning(
+                "SECRET_KEY is not set: using a random per-process key, sessions will not survive a restart "
+                "and will not work across several workers"
+            )
+            self.SECRET_KEY = secrets.token_urlsafe(32)
+        return self
 
     model_config = SettingsConfigDict(
         env_file=".env",
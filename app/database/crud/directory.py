@@ -0,0 +1,41 @@
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import User, UserDirectory
+
+
+# Операции с каталогом пользователей (только сессии шарда 0)
+
+# Номер шарда пользователя или None, если записи в каталоге нет
+async def get_user_shard_number(db: AsyncSession, user_id: int) -> int | None:
+    result = await db.execute(select(UserDirectory.shard).where(UserDirectory.user_id == user_id))
+    return result.scalar_one_or_none()
+
+# Поиск по имени или email: (id пользователя, номер шарда) или None
+async def find_directory_entry(db: AsyncSession, username: str | None = None, email: str | None = None) -> tuple[int, int] | None:
+    query = select(UserDirectory.user_id, UserDirectory.shard)
+    query = query.where(UserDirectory.username == username) if username is not None else query.where(UserDirectory.email == email)
+    row = (await db.execute(query)).one_or_none()
+    return tuple(row) if row else None
+
+# Пользователь без записи в каталоге (создан в обход регистрации) ищется в таблице users шарда 0
+async def find_unlisted_user(db: AsyncSession, username: str | None = None, email: str | None = None) -> int | None:
+    query = select(User.id)
+    query = query.where(User.username == username) if username is not None else query.where(User.email == email)
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+# Запись нового пользователя; занятые имя или email дают IntegrityError
+async def add_directory_entry(db: AsyncSession, user_id: int, username: str, email: str, shard: int) -> None:
+    await db.execute(insert(UserDirectory).values(user_id=user_id, username=username, email=email, shard=shard))
+    await db.commit()
+
+# Смена имени, email или шарда; False — записи нет
+async def update_directory_entry(db: AsyncSession, user_id: int, **values) -> bool:
+    result = await db.execute(update(UserDirectory).where(UserDirectory.user_id == user_id).values(**values))
+    await db.commit()
+    return result.rowcount > 0
+
+async def delete_directory_entry(db: AsyncSession, user_id: int) -> None:
+    await db.execute(delete(UserDirectory).where(UserDirectory.user_id == user_id))
+    await db.commit()
@@ -0,0 +1,79 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+import datetime
+from datetime import UTC
+
+from app.database.models import EmailOutbox
+
+
+
+
+
+# Постановка письма в очередь отправки; commit=False — письмо фиксируется вместе с данными,
+# ради которых оно отправляется (одним COMMIT вызывающего)
+async def enqueue_email(db: AsyncSession, to_email: str, subject: str, body: str, commit: bool = True) -> EmailOutbox:
+    now = datetime.datetime.now(UTC)
+    message = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    )
+    db.add(message)
+    if commit:
+        await db.commit()
+    else:
+        await db.flush()
+    return message
+
+# Захват пачки писем, готовых к отправке
+# next_attempt_at сдвигается на время аренды — если процесс упадёт, письма снова станут доступны
+async def claim_due_emails(db: AsyncSession, limit: int, lease: datetime.timedelta) -> list[EmailOutbox]:
+    now = datetime.datetime.now(UTC)
+    due_ids = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+    )
+    result = await db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due_ids))
+        .values(next_attempt_at=now + lease, attempts=EmailOutbox.attempts + 1)
+        .returning(EmailOutbox)
+    )
+    messages = list(result.scalars())
+    await db.commit()
+    return messages
+
+# Отметка писем как отправленных; commit=False — в одной транзакции с отметкой неудачных
+async def mark_emails_sent(db: AsyncSession, ids: list[int], commit: bool = True) -> None:
+    if ids:
+        await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids))
+            .values(status="sent", sent_at=datetime.datetime.now(UTC), last_error=None)
+        )
+    if commit:
+        await db.commit()
+
+# Отметка неудачных попыток пачки одной транзакцией. failures — (id, ошибка, next_attempt_at):
+# повтор в next_attempt_at или окончательная ошибка, если он None
+async def mark_emails_failed(
+    db: AsyncSession, failures: list[tuple[int, str, datetime.datetime | None]], commit: bool = True
+) -> None:
+    retries = [
+        {"id": id, "last_error": error, "next_attempt_at": next_attempt_at}
+        for id, error, next_attempt_at in failures
+        if next_attempt_at is not None
+    ]
+    failed = [{"id": id, "last_error": error, "status": "failed"} for id, error, next_attempt_at in failures if next_attempt_at is None]
+    # Пакетный UPDATE по первичному ключу: один executemany на каждую группу
+    for rows in (retries, failed):
+        if rows:
+            await db.execute(update(EmailOutbox), rows)
+    if commit:
+        await db.commit()
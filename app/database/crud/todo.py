@@ -1,52 +1,598 @@
+import base64
+import datetime
+import json
+import logging
+from collections.abc import AsyncIterable, AsyncIterator
+from datetime import UTC
+from itertools import starmap
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Boolean, DateTime, String, and_, bindparam, exists, func, select, insert, update, delete, literal, null, text, tuple_, type_coerce
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.core.config import settings
+from app.database.fts import FTS_TABLE, build_match_query
+from app.database.models import EmailOutbox, Tag, ToDo, ToDoArchive, ToDoTag, User, UserTodoStats
+from app.schemas.todo import (
+    ToDoCreate,
+    ToDoUpdate,
+    ToDoRead,
+    ToDoRow,
+    ToDoPage,
+    ToDoFilter,
+    TagRead,
+    ToDoSearchPage,
+    ToDoStats,
+    ToDoCounterDrift,
+    ToDoImportError,
+    ToDoImportResult,
+    ArchivedToDoRow,
+    ArchivedToDoPage,
+)
+from app.utils.email import reminder_email
+
+logger = logging.getLogger(__name__)
 
-from app.database.models import ToDo
-from app.schemas.todo import ToDoCreate, ToDoUpdate, ToDoRead
 
+# Колонки, которые читают и возвращают (RETURNING) запросы — поля ToDoRead и ToDoRow, кроме
+# тегов (их подставляет _attach_tags одним запросом на страницу)
+_READ_COLUMNS = (ToDo.id, ToDo.title, ToDo.description, ToDo.completed, ToDo.due_at, ToDo.remind_at)
 
+# Колонки архива — поля ArchivedToDoRow в том же порядке
+_ARCHIVE_COLUMNS = (
+    ToDoArchive.id,
+    ToDoArchive.title,
+    ToDoArchive.description,
+    ToDoArchive.completed,
+    ToDoArchive.due_at,
+    ToDoArchive.completed_at,
+    ToDoArchive.archived_at,
+)
 
 
+# Строки списка задач из кортежей результата; колонки после _READ_COLUMNS (ключ сортировки) отбрасываются
+def _todo_rows(rows) -> list[ToDoRow]:
+    width = len(_READ_COLUMNS)
+    return list(starmap(ToDoRow, (row[:width] for row in rows)))
+
 
 # CRUD операции для модели ToDo
-async def get_all_todos(db: AsyncSession) -> list[ToDoRead]:
-    result = await db.execute(select(ToDo))
-    todos = result.scalars().all()
-    return [ToDoRead.from_orm(todo) for todo in todos]
-
-# Создание новой задачи
-async def create_todo(db: AsyncSession, todo: ToDoCreate) -> ToDoRead:
-    new_todo = ToDo(**todo.dict())
-    db.add(new_todo)
-    await db.commit()
-    await db.refresh(new_todo)
-    return ToDoRead.from_orm(new_todo)
-
-# Обновление задачи
-async def update_todo(db: AsyncSession, todo_id: int, todo: ToDoUpdate) -> ToDoRead | None:
-    result = await db.execute(select(ToDo).where(ToDo.id == todo_id))
-    existing_todo = result.scalar_one_or_none()
-    if not existing_todo:
+# Все задачи (пользователя) только для чтения: кортежи строк сразу превращаются в ToDoRow —
+# ни объектов ORM, ни словарей строк, ни моделей pydantic. Теги приходят вторым запросом
+# одним проходом по тегам пользователя, а не по списку id
+async def get_all_todos(db: AsyncSession, user_id: int | None = None) -> list[ToDoRow]:
+    query = select(*_READ_COLUMNS).order_by(ToDo.id)
+    tags_query = select(ToDoTag.todo_id, Tag.name).join(Tag, Tag.id == ToDoTag.tag_id).order_by(Tag.name)
+    if user_id is not None:
+        query = query.where(ToDo.user_id == user_id)
+        tags_query = tags_query.where(Tag.user_id == user_id)
+    result = await db.execute(query)
+    todos = list(starmap(ToDoRow, result.tuples()))
+    tags: dict[int, list[str]] = {}
+    for todo_id, name in await db.execute(tags_query):
+        tags.setdefault(todo_id, []).append(name)
+    if tags:
+        for todo in todos:
+            if todo.id in tags:
+                todo.tags = tags[todo.id]
+    return todos
+
+# Счётчики и версия списка задач пользователя одним чтением по первичному ключу
+# (нули — задач ещё не было)
+async def get_todo_stats(db: AsyncSession, user_id: int) -> ToDoStats:
+    result = await db.execute(
+        select(UserTodoStats.total, UserTodoStats.completed, UserTodoStats.version).where(UserTodoStats.user_id == user_id)
+    )
+    row = result.mappings().one_or_none()
+    return ToDoStats.model_validate(dict(row)) if row else ToDoStats()
+
+# Фактические счётчики по todos — один проход по индексу (user_id, ...)
+_ACTUAL_COUNTS = """
+    WITH actual AS (
+        SELECT user_id, count(*) AS total, sum(completed IS 1) AS completed
+        FROM todos WHERE user_id IS NOT NULL GROUP BY user_id
+    )
+    SELECT s.user_id, s.total AS stored_total, s.completed AS stored_completed,
+           coalesce(a.total, 0) AS actual_total, coalesce(a.completed, 0) AS actual_completed
+    FROM user_todo_stats s LEFT JOIN actual a ON a.user_id = s.user_id
+    WHERE s.total != coalesce(a.total, 0) OR s.completed != coalesce(a.completed, 0)
+    UNION ALL
+    SELECT a.user_id, 0, 0, a.total, a.completed
+    FROM actual a WHERE NOT EXISTS (SELECT 1 FROM user_todo_stats s WHERE s.user_id = a.user_id)
+"""
+
+# Пользователи, у которых счётчики разошлись с фактическим числом задач
+async def find_todo_counter_drift(db: AsyncSession) -> list[ToDoCounterDrift]:
+    result = await db.execute(text(_ACTUAL_COUNTS))
+    return [ToDoCounterDrift.model_validate(dict(row)) for row in result.mappings()]
+
+# Пересчёт разошедшихся счётчиков в одной транзакции писателя; версия увеличивается,
+# чтобы закэшированные страницы со старыми счётчиками стали неактуальны
+async def repair_todo_counters(db: AsyncSession) -> list[ToDoCounterDrift]:
+    drift = await find_todo_counter_drift(db)
+    if drift:
+        statement = sqlite_insert(UserTodoStats)
+        await db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[UserTodoStats.user_id],
+                set_={
+                    "total": statement.excluded.total,
+                    "completed": statement.excluded.completed,
+                    "version": UserTodoStats.version + 1,
+                },
+            ),
+            [{"user_id": d.user_id, "version": 1, "total": d.actual_total, "completed": d.actual_completed} for d in drift],
+        )
+    await db.commit()
+    return drift
+
+# Курсорная пагинация по ключу columns (последняя колонка — id): after — вперёд от курсора,
+# before — назад (тогда порядок обратный, строки разворачивает _keyset_page). Курсор — значение
+# единственной колонки или кортеж значений всех колонок. Читаем на одну строку больше, чтобы
+# узнать о следующей странице
+def _keyset_query(query, columns: tuple, after, before, limit: int, descending: bool = False):
+    key = columns[0] if len(columns) == 1 else tuple_(*columns)
+    cursor = before if before is not None else after
+    ascending = (before is None) != descending
+    if cursor is not None:
+        bound = cursor if len(columns) == 1 else tuple_(*cursor)
+        query = query.where(key > bound if ascending else key < bound)
+    return query.order_by(*(column if ascending else column.desc() for column in columns)).limit(limit + 1)
+
+# Выполнение запроса _keyset_query: возвращает (строки-кортежи, next, prev); курсоры строк — cursor_of
+async def _keyset_page(db: AsyncSession, query, after, before, limit: int, cursor_of=lambda row: row.id):
+    result = await db.execute(query)
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        return rows, cursor_of(rows[-1]) if rows else None, cursor_of(rows[0]) if has_more else None
+    return rows, cursor_of(rows[-1]) if has_more else None, cursor_of(rows[0]) if after is not None and rows else None
+
+# Курсор страницы. Для сортировки по созданию это id задачи (как и до появления сортировок),
+# для остальных — ключ сортировки и id в base64 от JSON. Неверный курсор — ValueError
+def encode_cursor(key: int | tuple[str, int]) -> int | str:
+    if isinstance(key, int):
+        return key
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode()).decode().rstrip("=")
+
+def decode_cursor(sort: str, cursor: int | str | None) -> int | tuple[str, int] | None:
+    if cursor is None:
+        return None
+    if sort == "created":
+        return int(cursor)
+    try:
+        value, todo_id = json.loads(base64.urlsafe_b64decode(str(cursor) + "=" * (-len(str(cursor)) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(value, str) or not isinstance(todo_id, int):
+        raise ValueError("Invalid cursor")
+    return value, todo_id
+
+# id тега пользователя по имени — скалярный подзапрос по ix_tags_user_name, который SQLite
+# вычисляет один раз, после чего выборка идёт по индексам todo_tags с известным tag_id
+def _tag_id(user_id: int, name: str):
+    return select(Tag.id).where(Tag.user_id == user_id, Tag.name == name).scalar_subquery()
+
+# Теги задач одним запросом по первичному ключу todo_tags (в порядке имён)
+async def _attach_tags(db: AsyncSession, items: list[ToDoRow | ToDoRead]) -> list[ToDoRow | ToDoRead]:
+    if items:
+        result = await db.execute(
+            select(ToDoTag.todo_id, Tag.name)
+            .join(Tag, Tag.id == ToDoTag.tag_id)
+            .where(ToDoTag.todo_id.in_([item.id for item in items]))
+            .order_by(Tag.name)
+        )
+        tags: dict[int, list[str]] = {}
+        for todo_id, name in result:
+            tags.setdefault(todo_id, []).append(name)
+        for item in items:
+            item.tags = tags.get(item.id, [])
+    return items
+
+# Построитель запроса страницы списка задач (limit + 1 строк, чтобы узнать о следующей).
+# Без тегов выборка идёт по todos и индексам (user_id, [completed,] ключ, id). С тегами — от
+# todo_tags первого тега по индексам (tag_id, [completed,] ключ, todo_id), где выполненность,
+# время изменения и заголовок задачи продублированы; остальные теги проверяются по первичному
+# ключу todo_tags, а строки todos читаются только для задач страницы.
+# Курсор — ключ (значение сортировки, id) или просто id для сортировки по созданию: after —
+# вперёд от него, before — назад (порядок обратный, строки разворачивает _keyset_page).
+# Время изменения сравнивается как строка в том виде, в каком хранится, — так курсор совпадает с индексом
+def build_todos_query(
+    user_id: int,
+    filters: ToDoFilter,
+    after: int | tuple[str, int] | None = None,
+    before: int | tuple[str, int] | None = None,
+    limit: int = settings.TODOS_PAGE_SIZE,
+):
+    if filters.tags:
+        first, *others = filters.tags
+        keys = {"created": ToDoTag.todo_id, "updated": ToDoTag.updated_at, "title": ToDoTag.title}
+        query = (
+            select(*_READ_COLUMNS)
+            .select_from(ToDoTag)
+            .join(ToDo, ToDo.id == ToDoTag.todo_id)
+            .where(ToDoTag.tag_id == _tag_id(user_id, first), ToDo.user_id == user_id)
+        )
+        if filters.completed is not None:
+            query = query.where(ToDoTag.completed == filters.completed)
+        for name in others:
+            link = aliased(ToDoTag)
+            query = query.where(exists().where(link.todo_id == ToDoTag.todo_id, link.tag_id == _tag_id(user_id, name)))
+        id_column = ToDoTag.todo_id
+    else:
+        keys = {"created": ToDo.id, "updated": ToDo.updated_at, "title": ToDo.title}
+        query = select(*_READ_COLUMNS).where(ToDo.user_id == user_id)
+        if filters.completed is not None:
+            query = query.where(ToDo.completed == filters.completed)
+        id_column = ToDo.id
+    if filters.sort == "created":
+        columns = (id_column,)
+    else:
+        sort_key = type_coerce(keys[filters.sort], String)
+        query = query.add_columns(sort_key.label("sort_key"))
+        columns = (sort_key, id_column)
+    return _keyset_query(query, columns, after, before, limit, filters.descending)
+
+# Страница задач пользователя (только горячая таблица todos) с фильтром и сортировкой.
+# after/before — курсоры из next_cursor/prev_cursor той же сортировки; неверный курсор — ValueError
+async def get_todos_page(
+    db: AsyncSession,
+    user_id: int,
+    after: int | str | None = None,
+    before: int | str | None = None,
+    limit: int = settings.TODOS_PAGE_SIZE,
+    filters: ToDoFilter | None = None,
+) -> ToDoPage:
+    filters = filters or ToDoFilter()
+    after = decode_cursor(filters.sort, after)
+    before = decode_cursor(filters.sort, before)
+
+    def cursor_of(row) -> int | str:
+        return encode_cursor(row.id if filters.sort == "created" else (row.sort_key, row.id))
+
+    query = build_todos_query(user_id, filters, after, before, limit)
+    rows, next_cursor, prev_cursor = await _keyset_page(db, query, after, before, limit, cursor_of)
+    return ToDoPage(
+        items=await _attach_tags(db, _todo_rows(rows)),
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+    )
+
+# Теги пользователя по имени со счётчиками задач — чтение одного диапазона ix_tags_user_name
+# (счётчики ведут триггеры, задачи не просматриваются)
+async def get_tags(db: AsyncSession, user_id: int) -> list[TagRead]:
+    result = await db.execute(
+        select(Tag.name, Tag.total, Tag.completed).where(Tag.user_id == user_id).order_by(Tag.name)
+    )
+    return [TagRead.model_validate(dict(row)) for row in result.mappings()]
+
+# Привязка тегов к задачам: пары (id задачи, имена тегов). Недостающие теги создаются,
+# связи копируют поля задачи одним INSERT ... SELECT на связь; существующие связи не дублируются
+async def _link_tags(db: AsyncSession, user_id: int, links: list[tuple[int, list[str]]]) -> None:
+    names = sorted({name for _, tags in links for name in tags})
+    if not names:
+        return
+    await db.execute(
+        sqlite_insert(Tag).on_conflict_do_nothing(index_elements=[Tag.user_id, Tag.name]),
+        [{"user_id": user_id, "name": name, "total": 0, "completed": 0} for name in names],
+    )
+    statement = insert(ToDoTag.__table__).prefix_with("OR IGNORE").from_select(
+        ["todo_id", "tag_id", "completed", "updated_at", "title"],
+        select(ToDo.id, Tag.id, func.coalesce(ToDo.completed, False), ToDo.updated_at, ToDo.title)
+        .join(Tag, and_(Tag.user_id == user_id, Tag.name == bindparam("link_name")))
+        .where(ToDo.id == bindparam("link_todo_id")),
+    )
+    await db.execute(
+        statement, [{"link_todo_id": todo_id, "link_name": name} for todo_id, tags in links for name in tags]
+    )
+
+# Замена набора тегов задачи: лишние связи удаляются (триггеры уменьшают счётчики), новые добавляются
+async def _set_todo_tags(db: AsyncSession, user_id: int, todo_id: int, tags: list[str]) -> None:
+    kept = select(Tag.id).where(Tag.user_id == user_id, Tag.name.in_(tags))
+    await db.execute(
+        delete(ToDoTag)
+        .where(ToDoTag.todo_id == todo_id, ToDoTag.tag_id.not_in(kept))
+        .execution_options(synchronize_session=False)
+    )
+    await _link_tags(db, user_id, [(todo_id, tags)])
+
+# Страница архива задач пользователя
+async def get_archived_todos_page(
+    db: AsyncSession,
+    user_id: int,
+    after: int | None = None,
+    before: int | None = None,
+    limit: int = settings.TODOS_PAGE_SIZE,
+) -> ArchivedToDoPage:
+    query = select(*_ARCHIVE_COLUMNS).where(ToDoArchive.user_id == user_id)
+    query = _keyset_query(query, (ToDoArchive.id,), after, before, limit)
+    rows, next_cursor, prev_cursor = await _keyset_page(db, query, after, before, limit)
+    return ArchivedToDoPage(items=list(starmap(ArchivedToDoRow, rows)), next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+# Перенос пачки выполненных до cutoff задач в архив: DELETE ... RETURNING и вставка в одной
+# транзакции. Триггеры удаления уменьшают счётчики и убирают задачи из поиска.
+# Возвращает число перенесённых задач и id их владельцев
+async def archive_completed_todos(db: AsyncSession, cutoff: datetime.datetime, limit: int) -> tuple[int, set[int]]:
+    due_ids = (
+        select(ToDo.id)
+        .where(ToDo.completed.is_(True), ToDo.completed_at < cutoff)
+        .order_by(ToDo.completed_at)
+        .limit(limit)
+    )
+    result = await db.execute(
+        delete(ToDo)
+        .where(ToDo.id.in_(due_ids))
+        .returning(
+            ToDo.id, ToDo.title, ToDo.description, ToDo.completed, ToDo.user_id, ToDo.due_at, ToDo.completed_at
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.mappings().all()
+    if rows:
+        archived_at = datetime.datetime.now(UTC)
+        await db.execute(insert(ToDoArchive), [{**row, "archived_at": archived_at} for row in rows])
+    await db.commit()
+    return len(rows), {row["user_id"] for row in rows if row["user_id"] is not None}
+
+# Колонки экспорта: задачи и архив приводятся к одному набору полей, archived их различает
+_EXPORT_COLUMNS = (*_READ_COLUMNS, ToDo.completed_at, literal(False).label("archived"))
+_EXPORT_ARCHIVE_COLUMNS = (
+    *_ARCHIVE_COLUMNS[:5],
+    null().label("remind_at"),
+    ToDoArchive.completed_at,
+    literal(True).label("archived"),
+)
+
+# Выгрузка всех задач пользователя пачками по batch_size строк через серверный курсор (db.stream):
+# в памяти одновременно не больше одной пачки, сколько бы задач ни было. Теги пачки читаются
+# одним запросом по диапазону её id (пачки идут по возрастанию id); у архивных задач тегов нет
+async def stream_todos(
+    db: AsyncSession,
+    user_id: int,
+    include_archived: bool = False,
+    batch_size: int = settings.EXPORT_BATCH_SIZE,
+) -> AsyncIterator[list[dict]]:
+    query = select(*_EXPORT_COLUMNS).where(ToDo.user_id == user_id).order_by(ToDo.id)
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for partition in result.mappings().partitions():
+        tags: dict[int, list[str]] = {}
+        for todo_id, name in await db.execute(
+            select(ToDoTag.todo_id, Tag.name)
+            .join(Tag, Tag.id == ToDoTag.tag_id)
+            .where(Tag.user_id == user_id, ToDoTag.todo_id.between(partition[0]["id"], partition[-1]["id"]))
+            .order_by(Tag.name)
+        ):
+            tags.setdefault(todo_id, []).append(name)
+        yield [{**row, "tags": tags.get(row["id"], [])} for row in partition]
+    if include_archived:
+        query = select(*_EXPORT_ARCHIVE_COLUMNS).where(ToDoArchive.user_id == user_id).order_by(ToDoArchive.id)
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.mappings().partitions():
+            yield [{**row, "tags": []} for row in partition]
+
+# Ожидающие напоминания не позже until в порядке срабатывания, после курсора (remind_at, id) —
+# дочитывание окна планировщика по частичному индексу ix_todos_remind_at
+async def get_pending_reminders(
+    db: AsyncSession,
+    until: datetime.datetime,
+    after: tuple[datetime.datetime, int] | None,
+    limit: int,
+) -> list[tuple[datetime.datetime, int]]:
+    query = select(ToDo.remind_at, ToDo.id).where(ToDo.remind_at.is_not(None), ToDo.remind_at <= until)
+    if after is not None:
+        query = query.where(tuple_(ToDo.remind_at, ToDo.id) > tuple_(*after))
+    result = await db.execute(query.order_by(ToDo.remind_at, ToDo.id).limit(limit))
+    return [(row.remind_at, row.id) for row in result]
+
+# Сработавшие напоминания: remind_at обнуляется (только если оно всё ещё наступило — задачу
+# могли изменить) и письма ставятся в очередь в той же транзакции, по одному на пользователя.
+# Выполненным задачам напоминание не отправляется. Возвращает число писем
+async def enqueue_todo_reminders(db: AsyncSession, ids: list[int], now: datetime.datetime) -> int:
+    result = await db.execute(
+        update(ToDo)
+        .where(ToDo.id.in_(ids), ToDo.remind_at <= now)
+        .values(remind_at=None)
+        .returning(ToDo.user_id, ToDo.title, ToDo.due_at, ToDo.completed)
+        .execution_options(synchronize_session=False)
+    )
+    by_user: dict[int, list[tuple[str, datetime.datetime | None]]] = {}
+    for row in result:
+        if not row.completed and row.user_id is not None:
+            by_user.setdefault(row.user_id, []).append((row.title, row.due_at))
+    messages = []
+    if by_user:
+        users = await db.execute(select(User.id, User.email, User.first_name).where(User.id.in_(by_user)))
+        created_at = datetime.datetime.now(UTC)
+        for user in users:
+            subject, body = reminder_email(user.first_name, by_user[user.id])
+            messages.append({
+                "to_email": user.email,
+                "subject": subject,
+                "body": body,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": created_at,
+                "created_at": created_at,
+            })
+    if messages:
+        await db.execute(insert(EmailOutbox), messages)
+    await db.commit()
+    return len(messages)
+
+# Полнотекстовый поиск по задачам пользователя, ранжирование bm25 (заголовок весит больше описания)
+_SEARCH_SQL = text(f"""
+    SELECT t.id, t.title, t.description, t.completed, t.due_at, t.remind_at
+    FROM {FTS_TABLE} AS f
+    JOIN todos AS t ON t.id = f.rowid
+    WHERE {FTS_TABLE} MATCH :match
+    ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 0.0), t.id
+    LIMIT :limit OFFSET :offset
+""").columns(completed=Boolean, due_at=DateTime, remind_at=DateTime)
+
+async def search_todos(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    page: int = 1,
+    limit: int = settings.SEARCH_PAGE_SIZE,
+) -> ToDoSearchPage:
+    match = build_match_query(user_id, query)
+    if match is None:
+        return ToDoSearchPage(items=[], query=query, page=page)
+    result = await db.execute(_SEARCH_SQL, {"match": match, "limit": limit + 1, "offset": (page - 1) * limit})
+    rows = result.all()
+    return ToDoSearchPage(
+        items=await _attach_tags(db, _todo_rows(rows[:limit])),
+        query=query,
+        page=page,
+        has_next=len(rows) > limit,
+    )
+
+# Условие на задачу; user_id ограничивает выборку задачами владельца
+def _todo_filter(todo_id: int, user_id: int | None):
+    if user_id is None:
+        return (ToDo.id == todo_id,)
+    return (ToDo.id == todo_id, ToDo.user_id == user_id)
+
+# Получение задачи
+async def get_todo(db: AsyncSession, todo_id: int, user_id: int | None = None) -> ToDoRead | None:
+    result = await db.execute(select(*_READ_COLUMNS).where(*_todo_filter(todo_id, user_id)))
+    row = result.mappings().one_or_none()
+    if row is None:
         return None
-    for key, value in todo.dict(exclude_unset=True).items():
-        setattr(existing_todo, key, value)
+    return (await _attach_tags(db, [ToDoRead.model_validate(dict(row))]))[0]
+
+# Время изменения задачи в UTC без пояса (как остальные отметки времени)
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(UTC).replace(tzinfo=None)
+
+# Создание новой задачи (INSERT ... RETURNING, без отдельного refresh) и её тегов
+async def create_todo(db: AsyncSession, todo: ToDoCreate, user_id: int | None = None) -> ToDoRead:
+    result = await db.execute(
+        insert(ToDo).values(**todo.model_dump(exclude={"tags"}), user_id=user_id).returning(*_READ_COLUMNS)
+    )
+    created = ToDoRead.model_validate(dict(result.mappings().one()))
+    if todo.tags and user_id is not None:
+        await _link_tags(db, user_id, [(created.id, todo.tags)])
+        created.tags = sorted(todo.tags)
     await db.commit()
-    await db.refresh(existing_todo)
-    return ToDoRead.from_orm(existing_todo)
+    return created
 
-# Удаление задачи
-async def delete_todo(db: AsyncSession, todo_id: int) -> bool:
-    result = await db.execute(select(ToDo).where(ToDo.id == todo_id))
-    existing_todo = result.scalar_one_or_none()
-    if not existing_todo:
-        return False
-    await db.delete(existing_todo)
+# Обновление задачи одним UPDATE ... RETURNING (время изменения ставится здесь же) и замена
+# тегов, если они переданы; None — задача не найдена (или чужая)
+async def update_todo(db: AsyncSession, todo_id: int, todo: ToDoUpdate, user_id: int | None = None) -> ToDoRead | None:
+    values = todo.model_dump(exclude_unset=True)
+    tags = values.pop("tags", None)
+    if not values and tags is None:
+        return await get_todo(db, todo_id, user_id)
+    result = await db.execute(
+        update(ToDo)
+        .where(*_todo_filter(todo_id, user_id))
+        .values(**values, updated_at=_utcnow())
+        .returning(*_READ_COLUMNS, ToDo.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.mappings().one_or_none()
+    if row is None:
+        await db.commit()
+        return None
+    if tags is not None and row["user_id"] is not None:
+        await _set_todo_tags(db, row["user_id"], todo_id, tags)
     await db.commit()
-    return True
+    updated = ToDoRead.model_validate(dict(row))
+    if tags is None:
+        return (await _attach_tags(db, [updated]))[0]
+    updated.tags = sorted(tags)
+    return updated
 
+# Удаление задачи одним DELETE ... RETURNING
+async def delete_todo(db: AsyncSession, todo_id: int, user_id: int | None = None) -> bool:
+    result = await db.execute(
+        delete(ToDo)
+        .where(*_todo_filter(todo_id, user_id))
+        .returning(ToDo.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.first() is not None
+    await db.commit()
+    return deleted
 
+# Пакетное создание задач пользователя одним INSERT (и их тегов); возвращает id новых задач
+async def create_todos(db: AsyncSession, user_id: int, todos: list[ToDoCreate]) -> list[int]:
+    result = await db.execute(
+        insert(ToDo)
+        .values([{**todo.model_dump(exclude={"tags"}), "user_id": user_id} for todo in todos])
+        .returning(ToDo.id)
+    )
+    # Строки одного INSERT получают id подряд в порядке VALUES
+    ids = sorted(result.scalars())
+    await _link_tags(db, user_id, [(todo_id, todo.tags) for todo_id, todo in zip(ids, todos) if todo.tags])
+    await db.commit()
+    return ids
 
+# Импорт задач из потока (номер строки, задача или текст ошибки): корректные строки
+# копятся и пишутся пачками по chunk_size через create_todos, каждая пачка — своя транзакция,
+# так что при обрыве загрузки уже записанные пачки сохраняются. Ошибки строк не прерывают
+# импорт; в результат попадают первые max_errors из них
+async def import_todos(
+    db: AsyncSession,
+    user_id: int,
+    rows: AsyncIterable[tuple[int, ToDoCreate | str]],
+    chunk_size: int = settings.IMPORT_CHUNK_SIZE,
+    max_errors: int = settings.IMPORT_MAX_ERRORS,
+) -> ToDoImportResult:
+    summary = ToDoImportResult()
+    chunk: list[ToDoCreate] = []
 
+    async def flush():
+        summary.imported += len(await create_todos(db, user_id, chunk))
+        summary.chunks += 1
+        chunk.clear()
+        logger.info("Todo import for user %s: %d rows imported, %d failed", user_id, summary.imported, summary.failed)
 
+    async for line, row in rows:
+        if isinstance(row, str):
+            summary.failed += 1
+            if len(summary.errors) < max_errors:
+                summary.errors.append(ToDoImportError(line=line, error=row))
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+    return summary
 
+# Пакетная смена статуса задач; чужие задачи отсекаются условием на user_id в том же UPDATE
+async def set_todos_completed(db: AsyncSession, user_id: int, ids: list[int], completed: bool = True) -> int:
+    result = await db.execute(
+        update(ToDo)
+        .where(ToDo.user_id == user_id, ToDo.id.in_(ids))
+        .values(completed=completed, updated_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
 
+# Пакетное удаление задач пользователя
+async def delete_todos(db: AsyncSession, user_id: int, ids: list[int]) -> int:
+    result = await db.execute(
+        delete(ToDo)
+        .where(ToDo.user_id == user_id, ToDo.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+# Удаление всех завершённых задач пользователя
+async def delete_completed_todos(db: AsyncSession, user_id: int) -> int:
+    result = await db.execute(
+        delete(ToDo)
+        .where(ToDo.user_id == user_id, ToDo.completed.is_(True))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
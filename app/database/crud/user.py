@@ -1,63 +1,215 @@
+from itertools import starmap
+
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, func, literal
 import datetime
 
-from app.database.models import User, PasswordResetToken
-from app.schemas.user import UserRead, UserCreate, UserUpdate
+from app.database.db import USER_ID_RANGE
+from app.database.models import User, PasswordResetToken, Tag, ToDo, ToDoArchive, UserDirectory, UserIdSequence, UserTodoStats
+from app.database.sharding import shard_router
+from app.schemas.user import UserRead, UserRow, UserCreate, UserUpdate
+from app.utils.security import hasher
+from app.utils.session import user_cache
+
+
 
 
 
+# Колонки, которые читают запросы — ровно поля UserRead (и UserRow)
+_READ_COLUMNS = (User.id, User.username, User.email)
 
 
 # CRUD операции для модели User
-async def get_all_users(db: AsyncSession) -> list[UserRead]:
-    result = await db.execute(select(User))
-    users = result.scalars().all()
-    return [UserRead.from_orm(user) for user in users]
-
-# Создание нового пользователя
-async def create_user(db: AsyncSession, user: UserCreate) -> UserRead:
-    new_user = User(**user.dict())
-    db.add(new_user)
+# Все пользователи только для чтения — кортежи строк сразу в UserRow, как get_all_todos
+async def get_all_users(db: AsyncSession) -> list[UserRow]:
+    result = await db.execute(select(*_READ_COLUMNS).order_by(User.id))
+    return list(starmap(UserRow, result.tuples()))
+
+# Следующий id из диапазона шарда (low, high] по счётчику user_id_sequence в той же транзакции,
+# что и INSERT пользователя. Счётчик только растёт: id удалённого или перенесённого пользователя
+# не выдаётся повторно (каталог держит id уникальным во всех шардах). Строку счётчика создаёт
+# первая выдача — с наибольшего id диапазона среди пользователей шарда и записей каталога;
+# пользователи, вставленные в обход create_user (сидер бенчмарков), счётчик пропускает
+async def _next_user_id(db: AsyncSession, low: int, high: int) -> int:
+    in_users = select(func.max(User.id)).where(User.id > low, User.id <= high).scalar_subquery()
+    in_directory = (
+        select(func.max(UserDirectory.user_id))
+        .where(UserDirectory.user_id > low, UserDirectory.user_id <= high)
+        .scalar_subquery()
+    )
+    await db.execute(
+        insert(UserIdSequence.__table__).prefix_with("OR IGNORE").from_select(
+            ["range_start", "last_id"],
+            select(literal(low), func.max(func.coalesce(in_users, low), func.coalesce(in_directory, low))),
+        )
+    )
+    result = await db.execute(
+        update(UserIdSequence)
+        .where(UserIdSequence.range_start == low)
+        .values(last_id=func.max(UserIdSequence.last_id, func.coalesce(in_users, low)) + 1)
+        .returning(UserIdSequence.last_id)
+    )
+    return result.scalar_one()
+
+# Создание нового пользователя (пароль хэшируется в пуле процессов). id — следующий по счётчику
+# диапазона шарда (low, high]; profile — имя и фамилия из формы
+async def create_user(db: AsyncSession, user: UserCreate, id_range: tuple[int, int] = (0, USER_ID_RANGE), **profile) -> UserRead:
+    low, high = id_range
+    values = user.model_dump(exclude={"password"})
+    values.update(profile)
+    values["hashed_password"] = await hasher.hash(user.password)
+    values["id"] = await _next_user_id(db, low, high)
+    result = await db.execute(insert(User).values(**values).returning(*_READ_COLUMNS))
+    row = result.mappings().one()
     await db.commit()
-    await db.refresh(new_user)
-    return UserRead.from_orm(new_user)
+    return UserRead.model_validate(dict(row))
+
+# Регистрация: пользователь создаётся в шарде, выбранном по имени, и заносится в каталог.
+# Каталог держит имя и email уникальными во всех шардах: при конфликте строка в шарде удаляется
+# и IntegrityError уходит вызывающему, как при конфликте уникального индекса
+async def register_user(user: UserCreate, **profile) -> UserRead:
+    shard = shard_router.place(user.username)
+    async with shard.session() as session:
+        created = await create_user(session, user, shard.user_ids, **profile)
+    try:
+        await shard_router.register(created.id, created.username, created.email, shard)
+    except IntegrityError:
+        async with shard.session() as session:
+            await delete_user_rows(session, created.id)
+        raise
+    return created
 
 
 # Получение пользователя по ID
 async def get_user_by_id(db: AsyncSession, user_id: int) -> UserRead | None:
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if not user:
-        return None
-    return UserRead.from_orm(user)
+    result = await db.execute(select(*_READ_COLUMNS).where(User.id == user_id))
+    row = result.mappings().one_or_none()
+    return UserRead.model_validate(dict(row)) if row else None
 
-# Удаление пользователя
-async def delete_user(db: AsyncSession, user_id: int) -> bool:
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if not user:
+# Удаление строк пользователя в шарде: DELETE ... RETURNING, затем его задачи и токены в той же
+# транзакции. Каталог не меняется — так шард чистит ребалансировка; пользователя целиком удаляет delete_user
+async def delete_user_rows(db: AsyncSession, user_id: int) -> bool:
+    result = await db.execute(
+        delete(User).where(User.id == user_id).returning(User.id).execution_options(synchronize_session=False)
+    )
+    if result.first() is None:
+        await db.rollback()
         return False
-    await db.delete(user)
+    await db.execute(delete(ToDo).where(ToDo.user_id == user_id).execution_options(synchronize_session=False))
+    # Связи с тегами удалили триггеры удаления задач
+    await db.execute(delete(Tag).where(Tag.user_id == user_id).execution_options(synchronize_session=False))
+    await db.execute(delete(ToDoArchive).where(ToDoArchive.user_id == user_id).execution_options(synchronize_session=False))
+    await db.execute(delete(UserTodoStats).where(UserTodoStats.user_id == user_id).execution_options(synchronize_session=False))
+    await db.execute(
+        delete(PasswordResetToken).where(PasswordResetToken.user_id == user_id).execution_options(synchronize_session=False)
+    )
     await db.commit()
+    user_cache.invalidate(user_id)
     return True
 
-# Обновление пользователя
-async def update_user(db: AsyncSession, user_id: int, user: UserUpdate) -> UserRead | None:
-    result = await db.execute(select(User).where(User.id == user_id))
-    existing_user = result.scalar_one_or_none()
-    if not existing_user:
+# Удаление пользователя: строки в его шарде и запись каталога (имя и email снова свободны)
+async def delete_user(user_id: int) -> bool:
+    shard = await shard_router.shard_for_user(user_id)
+    async with shard.session() as session:
+        deleted = await delete_user_rows(session, user_id)
+    await shard_router.unregister(user_id)
+    return deleted
+
+# Изменение пользователя. Пароль хэшируется до любых записей; новые имя и email сначала занимаются
+# в каталоге (он проверяет уникальность во всех шардах), затем одним UPDATE ... RETURNING меняется
+# строка в шарде. При конфликте в шарде каталог возвращается к прежним значениям — уже после
+# закрытия сессии шарда, чтобы не ждать её соединения писателя. Конфликт — IntegrityError
+async def update_user(user_id: int, user: UserUpdate) -> UserRead | None:
+    values = user.model_dump(exclude_unset=True, exclude_none=True)
+    if "password" in values:
+        values["hashed_password"] = await hasher.hash(values.pop("password"))
+        # Смена пароля завершает все выпущенные сессии
+        values["session_version"] = User.session_version + 1
+    shard = await shard_router.shard_for_user(user_id)
+    async with shard.read_session() as session:
+        current = await get_user_by_id(session, user_id)
+    if current is None or not values:
+        return current
+    names = (values.get("username") or current.username, values.get("email") or current.email)
+    renamed = names != (current.username, current.email)
+    if renamed:
+        await shard_router.rename(user_id, *names)
+    try:
+        async with shard.session() as session:
+            return await _update_user_row(session, user_id, values)
+    except IntegrityError:
+        if renamed:
+            await shard_router.rename(user_id, current.username, current.email)
+        raise
+
+# Обновление строки пользователя одним UPDATE ... RETURNING (values — колонки, пароль уже в виде хэша)
+async def _update_user_row(db: AsyncSession, user_id: int, values: dict) -> UserRead | None:
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(*_READ_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.mappings().one_or_none()
+    await db.commit()
+    if row is None:
         return None
-    for key, value in user.dict(exclude_unset=True).items():
-        setattr(existing_user, key, value)
+    user_cache.invalidate(user_id)
+    return UserRead.model_validate(dict(row))
+
+# Новая версия сессий пользователя (выход на всех устройствах): выпущенные токены перестают
+# действовать. Возвращает новую версию или None, если пользователя нет
+async def bump_session_version(db: AsyncSession, user_id: int) -> int | None:
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(session_version=User.session_version + 1)
+        .returning(User.session_version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
     await db.commit()
-    await db.refresh(existing_user)
-    return UserRead.from_orm(existing_user)
+    user_cache.invalidate(user_id)
+    return version
 
-# Создание токена сброса пароля
-async def create_password_reset_token(db: AsyncSession, user_id: int, token: str, expires_at: datetime.datetime) -> PasswordResetToken:
+# Новый пароль по ссылке сброса: хэш меняется вместе с версией сессий, так что сессии со старым
+# паролем завершаются. commit=False — без фиксации (токен гасится в той же транзакции)
+async def reset_user_password(db: AsyncSession, user_id: int, hashed_password: str, commit: bool = True) -> bool:
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(hashed_password=hashed_password, session_version=User.session_version + 1)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    updated = result.first() is not None
+    if commit:
+        await db.commit()
+        user_cache.invalidate(user_id)
+    return updated
+
+# Замена хэша пароля, только если он не изменился с момента проверки
+async def update_password_hash(db: AsyncSession, user_id: int, old_hash: str, new_hash: str) -> bool:
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.hashed_password == old_hash)
+        .values(hashed_password=new_hash)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+# Создание токена сброса пароля; commit=False — без фиксации (токен и письмо со ссылкой
+# фиксируются одной транзакцией)
+async def create_password_reset_token(
+    db: AsyncSession, user_id: int, token: str, expires_at: datetime.datetime, commit: bool = True
+) -> PasswordResetToken:
     reset_token = PasswordResetToken(user_id=user_id, token=token, expires_at=expires_at)
     db.add(reset_token)
+    if not commit:
+        await db.flush()
+        return reset_token
     await db.commit()
     await db.refresh(reset_token)
     return reset_token
@@ -67,10 +219,21 @@ async def get_password_reset_token(db: AsyncSession, token: str) -> PasswordRese
     result = await db.execute(select(PasswordResetToken).where(PasswordResetToken.token == token))
     return result.scalar_one_or_none()
 
-# Удаление токена сброса пароля
-async def delete_password_reset_token(db: AsyncSession, token: str) -> None:
-    result = await db.execute(select(PasswordResetToken).where(PasswordResetToken.token == token))
-    reset_token = result.scalar_one_or_none()
-    if reset_token:
-        await db.delete(reset_token)
+# Погашение токена сброса пароля одним условным DELETE ... RETURNING: id пользователя или None,
+# если токена нет или он истёк. Из двух одновременных сбросов по одному токену проходит один.
+# Без фиксации — пароль меняется в той же транзакции
+async def consume_password_reset_token(db: AsyncSession, token: str, now: datetime.datetime) -> int | None:
+    result = await db.execute(
+        delete(PasswordResetToken)
+        .where(PasswordResetToken.token == token, PasswordResetToken.expires_at > now)
+        .returning(PasswordResetToken.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none()
+
+# Удаление просроченных токенов сброса пароля; возвращает их количество
+async def delete_expired_password_reset_tokens(db: AsyncSession, now: datetime.datetime, commit: bool = True) -> int:
+    result = await db.execute(delete(PasswordResetToken).where(PasswordResetToken.expires_at < now))
+    if commit:
         await db.commit()
+    return result.rowcount
@@ -1,42 +1,186 @@
 import os
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from collections.abc import AsyncGenerator
 
+from app.core.config import settings
+from app.utils.metrics import instrument_engine
+from app.database.group_commit import GroupCommitCoordinator, GroupCommitSession, WriterSession
+from app.database.migrations import migrate, pending_migrations, record_migration
 
 
 
 
 # Абсолютный путь к БД — работает независимо от того, откуда запущен бот
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # корень проекта
-DB_PATH = os.path.join(BASE_DIR, 'database', "DataBase.db")
+DB_PATH = settings.DB_PATH or os.path.join(BASE_DIR, 'database', "DataBase.db")
 # Абсолютный путь к БД
 DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
 
 
-# Создание асинхронного движка базы данных
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+# Значения PRAGMA из настроек; journal_mode хранится в самом файле БД и задаётся писателем
+def _pragmas(read_only: bool) -> list[str]:
+    pragmas = [
+        f"PRAGMA busy_timeout = {settings.DB_BUSY_TIMEOUT}",
+        f"PRAGMA synchronous = {settings.DB_SYNCHRONOUS}",
+        f"PRAGMA mmap_size = {settings.DB_MMAP_SIZE}",
+        f"PRAGMA cache_size = {settings.DB_CACHE_SIZE}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        pragmas.insert(0, f"PRAGMA journal_mode = {settings.DB_JOURNAL_MODE}")
+    return pragmas
+
+
+# Создание движка SQLite с применением PRAGMA на каждом новом соединении
+def create_sqlite_engine(url: str, pool_size: int, read_only: bool = False) -> AsyncEngine:
+    new_engine = create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+    pragmas = _pragmas(read_only)
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return new_engine
 
 
 # Создание базового класса для моделей
 Base = declarative_base()
 
 
-# Создание асинхронной сессии
-ASYNC_SESSION = async_sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autoflush=False,
-    autocommit=False,
-)
-
-# Функция для инициализации базы данных (создание всех таблиц)
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-# Зависимость для FastAPI — получение сессии
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
-    async with ASYNC_SESSION() as session:
-        yield session
\ No newline at end of file
+# Пользователи шарда N получают id из диапазона (N * USER_ID_RANGE, (N + 1) * USER_ID_RANGE]:
+# id остаётся глобально уникальным и сохраняется при переносе пользователя в другой шард
+USER_ID_RANGE = 2 ** 40
+
+
+# Путь к файлу шарда: шард 0 — основной файл БД, остальные — DataBase.shardN.db рядом с ним
+def shard_path(number: int) -> str:
+    if number == 0:
+        return DB_PATH
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}.shard{number}{ext}"
+
+
+# Шард — отдельный файл SQLite со своими движками, сессиями и групповой фиксацией.
+# Данные пользователя (задачи, архив, счётчики, токены, письма) целиком лежат в одном шарде
+class Shard:
+    def __init__(self, number: int, path: str):
+        self.number = number
+        self.path = path
+        url = f"sqlite+aiosqlite:///{path}"
+        # Движок для записи: SQLite допускает одного писателя, поэтому одно соединение
+        self.engine = create_sqlite_engine(url, pool_size=1)
+        # Движок только для чтения: в режиме WAL читатели не блокируются писателем
+        self.read_engine = create_sqlite_engine(url, pool_size=settings.DB_READ_POOL_SIZE, read_only=True)
+        # Число и время SQL-запросов для /metrics
+        if settings.METRICS_ENABLED:
+            prefix = f"shard{number}_" if number else ""
+            instrument_engine(self.engine, f"{prefix}writer")
+            instrument_engine(self.read_engine, f"{prefix}reader")
+        # Координатор групповой фиксации: каждая сессия запроса пишет в своём SAVEPOINT общей
+        # транзакции, а commit() дожидается общего COMMIT. Место в пачке арендуется на
+        # DB_GROUP_COMMIT_LEASE секунд
+        self.coordinator = GroupCommitCoordinator(
+            self.engine,
+            window=settings.DB_GROUP_COMMIT_WINDOW,
+            max_batch=settings.DB_GROUP_COMMIT_MAX_BATCH,
+            lease=settings.DB_GROUP_COMMIT_LEASE,
+        )
+        # Номер шарда виден в session.info["shard"] — по нему маршруты находят планировщик напоминаний шарда.
+        # Обычная сессия записи знает координатор: запись через неё из задачи, которая держит место
+        # в пачке того же шарда, сразу падает с WriterConflictError, а не ждёт пул до таймаута
+        self.session = async_sessionmaker(
+            bind=self.engine,
+            class_=WriterSession,
+            expire_on_commit=False,
+            autoflush=False,
+            autocommit=False,
+            info={"shard": number, "writer_coordinator": self.coordinator},
+        )
+        self.read_session = async_sessionmaker(
+            bind=self.read_engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autoflush=False,
+            autocommit=False,
+            info={"shard": number},
+        )
+        # Сессии запросов поверх координатора; чтения после commit() идут в пул читателей
+        self.group_commit_session = async_sessionmaker(
+            bind=self.engine,
+            class_=GroupCommitSession,
+            expire_on_commit=False,
+            autoflush=False,
+            autocommit=False,
+            join_transaction_mode="create_savepoint",
+            info={"shard": number, "group_commit": self.coordinator, "group_commit_reader": self.read_engine},
+        )
+
+    # Фабрика сессий записи для запросов (с групповой фиксацией, если она включена)
+    @property
+    def request_session(self) -> async_sessionmaker:
+        return self.group_commit_session if settings.DB_GROUP_COMMIT else self.session
+
+    # Диапазон id новых пользователей шарда: (low, high]
+    @property
+    def user_ids(self) -> tuple[int, int]:
+        return self.number * USER_ID_RANGE, (self.number + 1) * USER_ID_RANGE
+
+    async def dispose(self) -> None:
+        await self.coordinator.stop()
+        await self.engine.dispose()
+        await self.read_engine.dispose()
+
+
+shards = [Shard(number, shard_path(number)) for number in range(max(settings.DB_SHARDS, 1))]
+
+# Шард 0 — основной файл БД; в нём же каталог пользователей (user_directory).
+# Имена ниже — его движки и сессии: их используют утилиты, бенчмарки и тесты
+directory_shard = shards[0]
+engine = directory_shard.engine
+read_engine = directory_shard.read_engine
+ASYNC_SESSION = directory_shard.session
+READ_SESSION = directory_shard.read_session
+write_coordinator = directory_shard.coordinator
+GROUP_COMMIT_SESSION = directory_shard.group_commit_session
+
+# Инициализация базы данных: проверка версии схемы и применение недостающих миграций в каждом шарде.
+# При актуальной схеме это один запрос к schema_migrations на шард, без отражения всех таблиц
+async def init_db() -> list[int]:
+    applied = set()
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            applied.update(await conn.run_sync(migrate, shard.number))
+    return sorted(applied)
+
+# Фоновые (ONLINE) миграции — построение индексов после старта приложения, шард за шардом.
+# Соединение писателя у шарда одно, поэтому оно берётся на каждый шаг миграции (один индекс)
+# и возвращается в пул сразу после его COMMIT: записи запросов выполняются между шагами.
+# До завершения миграции запросы работают по старым индексам
+async def run_online_migrations(targets: list[Shard] | None = None) -> list[int]:
+    applied = set()
+    for shard in shards if targets is None else targets:
+        async with shard.engine.begin() as conn:
+            pending = await conn.run_sync(pending_migrations, True)
+        for migration in pending:
+            for step in migration.steps:
+                async with shard.engine.begin() as conn:
+                    await conn.run_sync(step)
+            async with shard.engine.begin() as conn:
+                await conn.run_sync(record_migration, migration)
+            applied.add(migration.version)
+    return sorted(applied)
+
+# Закрытие соединений всех пулов
+async def dispose_engines():
+    for shard in shards:
+        await shard.dispose()
@@ -0,0 +1,14 @@
+# Полнотекстовый индекс задач (FTS5); схема и триггеры — в миграции m0003_todos_fts.
+# Колонка owner содержит токен владельца вида "u<id>" — поиск ограничивается
+# пользователем внутри самого индекса, без фильтрации чужих совпадений.
+FTS_TABLE = "todos_fts"
+
+
+# Преобразование пользовательского ввода в безопасный запрос FTS5:
+# каждое слово — отдельная фраза в кавычках, последнее — как префикс; слова без букв и цифр отбрасываются
+def build_match_query(user_id: int, query: str) -> str | None:
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split() if any(ch.isalnum() for ch in term)]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return f'owner:"u{user_id}" AND ({{title description}} : ({" ".join(terms)}))'
@@ -0,0 +1,377 @@
+import asyncio
+import logging
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+
+logger = logging.getLogger(__name__)
+
+
+# Сеанс держал соединение писателя дольше аренды: его изменения откатаны, пачка ушла дальше
+class GroupCommitLeaseExpired(RuntimeError):
+    pass
+
+
+# Задача смешала сеанс групповой фиксации и обычный сеанс записи того же шарда. Соединение
+# писателя одно, и его уже держит эта же задача — вторая запись ждала бы саму себя до таймаута пула
+class WriterConflictError(RuntimeError):
+    pass
+
+
+def _current_task() -> asyncio.Task | None:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+# Место сеанса в пачке: доступ к соединению с общей транзакцией, пока сеанс не зафиксирует
+# или не откатит свои изменения. owner — задача сеанса: только она выполняет запросы на
+# соединении, пока место выдано. released — сеанс отдал соединение; committed — итог общего
+# COMMIT для тех, кто его ждёт; expired — аренда истекла и изменения сеанса откатаны
+class _Slot:
+    def __init__(self, connection: AsyncConnection, owner: asyncio.Task | None):
+        loop = asyncio.get_running_loop()
+        self.connection = connection
+        self.owner = owner
+        self.released = loop.create_future()
+        self.committed = loop.create_future()
+        self.wrote = False
+        self.expired = False
+        self.executing = False
+
+    def release(self, wrote: bool = False):
+        self.wrote = self.wrote or wrote
+        if not self.released.done():
+            self.released.set_result(None)
+
+
+# Пока пачка открыта, запросы на соединении писателя выполняют только задача-владелец
+# выданного места и сам писатель (BEGIN, откат SAVEPOINT, COMMIT). Сеанс с истёкшей
+# арендой получает ошибку, а не пишет в чужой SAVEPOINT или прямо в общую транзакцию.
+# Владельцем становится и задача, которая откатывает или закрывает сеанс места
+# (AsyncSession.__aexit__ закрывает сеанс в отдельной задаче)
+def _guard_slot(conn, cursor, statement, parameters, context, executemany):
+    writer = conn.info.get("group_commit_writer")
+    if writer is None:
+        return
+    task = _current_task()
+    if task is writer:
+        return
+    slot = conn.info.get("group_commit_slot")
+    if slot is None or task is not slot.owner:
+        raise GroupCommitLeaseExpired("Group commit lease expired: the session's changes were rolled back")
+    slot.executing = True
+
+
+def _statement_done(conn, *args):
+    slot = conn.info.get("group_commit_slot")
+    if slot is not None:
+        slot.executing = False
+
+
+# handle_error получает ExceptionContext, а не соединение
+def _statement_failed(ctx):
+    if ctx.connection is not None:
+        _statement_done(ctx.connection)
+
+
+# Откат SAVEPOINT, оставшихся открытыми на соединении писателя; True — что-то было откатано
+def _rollback_savepoints(sync_conn) -> bool:
+    rolled_back = False
+    while (nested := sync_conn.get_nested_transaction()) is not None:
+        nested.rollback()
+        rolled_back = True
+    return rolled_back
+
+
+# Групповая фиксация записи. Единственная задача-писатель открывает транзакцию (BEGIN IMMEDIATE)
+# и по очереди отдаёт соединение ожидающим сеансам; каждый сеанс работает внутри своего
+# SAVEPOINT, так что ошибка одного откатывает только его изменения. Через window секунд
+# после начала пачки (или после max_batch сеансов) выполняется один COMMIT на всех —
+# один fsync вместо одного на запрос.
+# Место выдаётся в аренду на lease секунд: сеанс, который не зафиксировал и не откатил
+# изменения за это время (занят не базой — шаблонами, событиями, внешними вызовами), теряет
+# их, а остальные пишущие запросы шарда идут дальше, не дожидаясь его
+class GroupCommitCoordinator:
+    def __init__(self, engine: AsyncEngine, window: float = 0.002, max_batch: int = 64, lease: float = 1.0):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.lease = lease
+        self.batches = 0
+        self.jobs = 0
+        self.failed_batches = 0
+        self.expired_leases = 0
+        self._loop = None
+        self._task = None
+        self._waiters: deque[tuple[asyncio.Future, asyncio.Task | None]] = deque()
+        self._wakeup: asyncio.Event | None = None
+        # Место, выданное сейчас, и задача, которая держит соединение писателя в обход пачки
+        self._active: _Slot | None = None
+        self._plain_holder: asyncio.Task | None = None
+        sync_engine = engine.sync_engine
+        if not event.contains(sync_engine, "before_cursor_execute", _guard_slot):
+            event.listen(sync_engine, "before_cursor_execute", _guard_slot)
+            event.listen(sync_engine, "after_cursor_execute", _statement_done)
+            event.listen(sync_engine, "handle_error", _statement_failed)
+        event.listen(sync_engine, "checkout", self._on_checkout)
+        event.listen(sync_engine, "checkin", self._on_checkin)
+
+    # Соединение писателя взято не писателем пачки — обычным сеансом или движком напрямую
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        task = _current_task()
+        if task is not None and task is not self._task:
+            self._plain_holder = task
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self._plain_holder = None
+
+    # Держит ли текущая задача место в пачке этого писателя
+    def holds_slot(self) -> bool:
+        return self._active is not None and self._active.owner is _current_task()
+
+    # Держит ли текущая задача соединение писателя в обход пачки
+    def holds_writer(self) -> bool:
+        return self._plain_holder is not None and self._plain_holder is _current_task()
+
+    # Запуск писателя в текущем цикле событий (повторно — если цикл сменился, как в тестах)
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._waiters = deque()
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run(), name="group-commit-writer")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        while self._waiters:
+            waiter, _ = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(RuntimeError("Group commit writer stopped"))
+
+    # Ожидание своей очереди в пачке; при отмене уже выданное место возвращается
+    async def acquire(self) -> _Slot:
+        if self.holds_slot():
+            raise WriterConflictError("This task already holds a group commit slot of this writer in another session")
+        if self.holds_writer():
+            raise WriterConflictError("This task holds the writer connection in a plain session; commit or close it first")
+        self.start()
+        waiter = self._loop.create_future()
+        self._waiters.append((waiter, _current_task()))
+        self._wakeup.set()
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                waiter.result().release()
+            raise
+
+    async def _run(self):
+        while True:
+            while not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self._run_batch()
+
+    # Следующий ожидающий сеанс (future и задача), но не позже deadline; None — окно пачки закрыто
+    async def _next_waiter(self, deadline: float) -> tuple[asyncio.Future, asyncio.Task | None] | None:
+        while True:
+            while self._waiters:
+                waiter, owner = self._waiters.popleft()
+                if not waiter.done():
+                    return waiter, owner
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                return None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                return None
+
+    # Выдача места и ожидание, пока сеанс его отдаст, — не дольше аренды. SAVEPOINT, который
+    # сеанс оставил открытым (не смог откатить), откатывает писатель: в общий COMMIT попадают
+    # только зафиксированные изменения
+    async def _serve(self, conn: AsyncConnection, slot: _Slot) -> None:
+        info = conn.sync_connection.info
+        self._active = slot
+        info["group_commit_slot"] = slot
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(slot.released), self.lease)
+            except TimeoutError:
+                await self._revoke(conn, slot)
+            if not slot.expired and await conn.run_sync(_rollback_savepoints):
+                logger.warning("Group commit session released the writer with an open savepoint; it was rolled back")
+        finally:
+            self._active = None
+            info.pop("group_commit_slot", None)
+
+    # Аренда истекла: SAVEPOINT сеанса откатывается, дальнейшие запросы сеанса получают
+    # GroupCommitLeaseExpired, а его commit() — ту же ошибку
+    async def _revoke(self, conn: AsyncConnection, slot: _Slot) -> None:
+        # Запрос сеанса, выполняющийся прямо сейчас, дорабатывает до конца
+        while slot.executing and not slot.released.done():
+            await asyncio.sleep(0.001)
+        if slot.released.done():
+            return
+        slot.expired = True
+        self.expired_leases += 1
+        conn.sync_connection.info.pop("group_commit_slot", None)
+        await conn.run_sync(_rollback_savepoints)
+        logger.warning("Group commit session held the writer longer than %.2fs; its changes were rolled back", self.lease)
+
+    async def _run_batch(self):
+        slots: list[_Slot] = []
+        error = None
+        try:
+            async with self.engine.connect() as conn:
+                # info принадлежит соединению пула и переживает пачку — метка писателя снимается всегда
+                info = conn.sync_connection.info
+                info["group_commit_writer"] = self._task
+                try:
+                    await conn.begin()
+                    # pysqlite сам не открывает транзакцию перед SAVEPOINT, а RELEASE первого
+                    # SAVEPOINT вне транзакции фиксировал бы изменения сразу
+                    await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    deadline = self._loop.time() + self.window
+                    while len(slots) < self.max_batch:
+                        next_waiter = await self._next_waiter(deadline)
+                        if next_waiter is None:
+                            break
+                        waiter, owner = next_waiter
+                        slot = _Slot(conn, owner)
+                        slots.append(slot)
+                        waiter.set_result(slot)
+                        await self._serve(conn, slot)
+                    await conn.commit()
+                finally:
+                    info.pop("group_commit_writer", None)
+        except Exception as exc:
+            error = exc
+            self.failed_batches += 1
+            logger.exception("Group commit of %d sessions failed", len(slots))
+        except asyncio.CancelledError:
+            error = RuntimeError("Group commit writer stopped")
+            raise
+        finally:
+            self.batches += 1
+            self.jobs += len(slots)
+            for slot in slots:
+                if not slot.wrote or slot.expired:
+                    continue
+                if error is None:
+                    slot.committed.set_result(None)
+                else:
+                    slot.committed.set_exception(error)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "failed_batches": self.failed_batches,
+            "expired_leases": self.expired_leases,
+        }
+
+
+# Синхронная часть сеанса: соединение берётся у координатора при первом обращении к БД,
+# а не при создании сеанса — хэширование пароля и прочая работа до запроса не держат пачку.
+# После commit() или rollback() место возвращается; следующее обращение берёт новое. SELECT
+# после commit(), пока место не занято снова (теги в update_todo и т. п.), идёт в пул
+# читателей (info["group_commit_reader"]): зафиксированные данные он уже видит
+class _GroupCommitSyncSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        coordinator = self.info.get("group_commit")
+        if coordinator is None:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        slot = self.info.get("group_commit_slot")
+        if slot is None:
+            if not in_greenlet():
+                return coordinator.engine.sync_engine
+            reader = self.info.get("group_commit_reader")
+            if reader is not None and self.info.get("group_commit_committed") and getattr(clause, "is_select", False):
+                return reader.sync_engine
+            slot = self.info["group_commit_slot"] = await_only(coordinator.acquire())
+        return slot.connection.sync_connection
+
+
+# Сеанс записи поверх координатора: commit() освобождает свой SAVEPOINT, отдаёт соединение
+# следующему сеансу и ждёт общего COMMIT — ошибка фиксации пачки приходит каждому её участнику.
+# Если аренда места истекла, commit() откатывает состояние сеанса и бросает GroupCommitLeaseExpired.
+# Требует join_transaction_mode="create_savepoint"
+class GroupCommitSession(AsyncSession):
+    sync_session_class = _GroupCommitSyncSession
+
+    def _take_slot(self) -> _Slot | None:
+        return self.sync_session.info.pop("group_commit_slot", None)
+
+    # Откат и закрытие могут идти из другой задачи (__aexit__) — ROLLBACK TO SAVEPOINT своего места ей разрешён
+    def _own_slot(self) -> None:
+        slot = self.sync_session.info.get("group_commit_slot")
+        if slot is not None and not slot.expired:
+            slot.owner = asyncio.current_task()
+
+    async def commit(self) -> None:
+        slot = self.sync_session.info.get("group_commit_slot")
+        if slot is not None and slot.expired:
+            await self.rollback()
+            raise GroupCommitLeaseExpired("Group commit lease expired: the session's changes were rolled back")
+        await super().commit()
+        slot = self._take_slot()
+        if slot is not None:
+            slot.release(wrote=True)
+            await asyncio.shield(slot.committed)
+            self.sync_session.info["group_commit_committed"] = True
+
+    # SAVEPOINT места с истёкшей арендой уже откатан писателем — сеанс только закрывается
+    async def rollback(self) -> None:
+        self._own_slot()
+        slot = self.sync_session.info.get("group_commit_slot")
+        try:
+            if slot is not None and slot.expired:
+                await super().close()
+            else:
+                await super().rollback()
+        finally:
+            if (slot := self._take_slot()) is not None:
+                slot.release()
+
+    async def close(self) -> None:
+        self._own_slot()
+        try:
+            await super().close()
+        finally:
+            if (slot := self._take_slot()) is not None:
+                slot.release()
+
+
+# Синхронная часть обычного сеанса записи шарда: если задача уже держит место в пачке того же
+# писателя, соединение занято ею самой — ошибка сразу, вместо ожидания пула до таймаута
+class _WriterSyncSession(Session):
+    def get_bind(self, mapper=None, **kwargs):
+        coordinator = self.info.get("writer_coordinator")
+        if coordinator is not None and coordinator.holds_slot():
+            raise WriterConflictError(
+                "This task holds a group commit slot of this writer; commit or roll back that session "
+                "before writing through a plain session"
+            )
+        return super().get_bind(mapper, **kwargs)
+
+
+# Обычный сеанс записи шарда (без групповой фиксации) с проверкой на смешение с GroupCommitSession
+class WriterSession(AsyncSession):
+    sync_session_class = _WriterSyncSession
@@ -0,0 +1,126 @@
+import datetime
+import importlib
+import pkgutil
+import re
+from dataclasses import dataclass
+from datetime import UTC
+from types import ModuleType
+
+from sqlalchemy import text
+
+
+# Лёгкие версионированные миграции схемы.
+# Каждая миграция — модуль mNNNN_<имя>.py с функцией upgrade(conn) (синхронное соединение
+# SQLAlchemy); номер задаёт порядок. Применённые версии хранятся в таблице schema_migrations.
+# Миграции с ONLINE = True (построение индексов) не задерживают старт приложения:
+# они выполняются в фоне после запуска и не должны быть нужны остальным миграциям.
+# Такая миграция задаёт вместо upgrade список STATEMENTS: инструкции выполняются по одной
+# в транзакции и должны быть идемпотентными (как CREATE INDEX IF NOT EXISTS).
+# Блокирующие миграции тоже пишутся повторно применимыми: база могла быть создана через create_all.
+# Номер шарда, для которого идёт прогон, лежит в conn.info["shard"].
+
+_MODULE_NAME = re.compile(r"^m(\d{4})_(\w+)$")
+
+_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    module: ModuleType
+
+    @property
+    def online(self) -> bool:
+        return getattr(self.module, "ONLINE", False)
+
+    def upgrade(self, conn) -> None:
+        self.module.upgrade(conn)
+
+    # Шаги фоновой миграции, каждый — своя транзакция: по одной инструкции STATEMENTS
+    @property
+    def steps(self) -> list:
+        return [lambda conn, statement=statement: conn.execute(text(statement)) for statement in self.module.STATEMENTS]
+
+
+# Блокирующая миграция определяется функцией upgrade, фоновая — только списком STATEMENTS
+def _check_migration(migration: Migration) -> None:
+    if migration.online:
+        valid = hasattr(migration.module, "STATEMENTS") and not hasattr(migration.module, "upgrade")
+    else:
+        valid = hasattr(migration.module, "upgrade")
+    if not valid:
+        kind = "ONLINE-миграция должна задавать только STATEMENTS" if migration.online else "нет функции upgrade"
+        raise RuntimeError(f"Миграция {migration.version} ({migration.name}): {kind}")
+
+
+# Есть ли колонка в таблице: ALTER TABLE ... ADD COLUMN в SQLite не знает IF NOT EXISTS,
+# поэтому повторно запускаемые миграции добавляют колонку через add_column
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(text(f"PRAGMA table_info({table})")))
+
+
+def add_column(conn, table: str, column: str, definition: str) -> None:
+    if not column_exists(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+# Загрузка модулей миграций этого пакета в порядке номеров
+def load_migrations() -> list[Migration]:
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _MODULE_NAME.match(info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            migration = Migration(int(match.group(1)), match.group(2), module)
+            _check_migration(migration)
+            migrations.append(migration)
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError("Повторяющиеся номера миграций")
+    return migrations
+
+
+MIGRATIONS = load_migrations()
+LATEST_VERSION = MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+# Номера уже применённых миграций
+def applied_versions(conn) -> set[int]:
+    conn.execute(text(_CREATE_VERSION_TABLE))
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+# Неприменённые миграции: блокирующие (online=False) или фоновые (online=True)
+def pending_migrations(conn, online: bool = False) -> list[Migration]:
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied and m.online == online]
+
+
+def apply_migration(conn, migration: Migration) -> None:
+    migration.upgrade(conn)
+    record_migration(conn, migration)
+
+
+def record_migration(conn, migration: Migration) -> None:
+    conn.execute(
+        text("INSERT INTO schema_migrations(version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": migration.version, "name": migration.name, "applied_at": datetime.datetime.now(UTC)},
+    )
+
+
+# Применение всех блокирующих миграций; при актуальной схеме — один запрос к schema_migrations
+def migrate(conn, shard: int = 0) -> list[int]:
+    conn.info["shard"] = shard
+    applied = []
+    for migration in pending_migrations(conn, online=False):
+        apply_migration(conn, migration)
+        applied.append(migration.version)
+    return applied
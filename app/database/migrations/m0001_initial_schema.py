@@ -0,0 +1,51 @@
+from sqlalchemy import text
+
+
+# Исходная схема: пользователи, задачи и токены сброса пароля.
+# IF NOT EXISTS — база, созданная ранее через create_all, принимается как есть.
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER NOT NULL,
+        first_name VARCHAR,
+        last_name VARCHAR,
+        username VARCHAR NOT NULL,
+        email VARCHAR NOT NULL,
+        hashed_password VARCHAR NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+    "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+    """
+    CREATE TABLE IF NOT EXISTS todos (
+        id INTEGER NOT NULL,
+        title VARCHAR NOT NULL,
+        description VARCHAR,
+        completed BOOLEAN,
+        user_id INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_todos_id ON todos (id)",
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_id_id ON todos (user_id, id)",
+    """
+    CREATE TABLE IF NOT EXISTS password_reset_tokens (
+        id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        token VARCHAR NOT NULL,
+        expires_at DATETIME NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_password_reset_tokens_token ON password_reset_tokens (token)",
+    "CREATE INDEX IF NOT EXISTS ix_password_reset_tokens_id ON password_reset_tokens (id)",
+]
+
+
+def upgrade(conn) -> None:
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
@@ -0,0 +1,28 @@
+from sqlalchemy import text
+
+
+# Очередь исходящих писем
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER NOT NULL,
+        to_email VARCHAR NOT NULL,
+        subject VARCHAR NOT NULL,
+        body VARCHAR NOT NULL,
+        status VARCHAR NOT NULL,
+        attempts INTEGER NOT NULL,
+        next_attempt_at DATETIME NOT NULL,
+        last_error VARCHAR,
+        created_at DATETIME NOT NULL,
+        sent_at DATETIME,
+        PRIMARY KEY (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_email_outbox_status_next_attempt ON email_outbox (status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS ix_email_outbox_id ON email_outbox (id)",
+]
+
+
+def upgrade(conn) -> None:
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
@@ -0,0 +1,56 @@
+from sqlalchemy import text
+
+
+# Полнотекстовый индекс задач (FTS5). Таблица без собственного содержимого (content=''):
+# хранит только индекс, строки берутся из todos по rowid = todos.id.
+# Колонка owner содержит токен владельца вида "u<id>" — поиск ограничивается
+# пользователем внутри самого индекса, без фильтрации чужих совпадений.
+STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+        title, description, owner,
+        content='',
+        prefix='2 3',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Триггеры синхронизации индекса с таблицей todos
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN
+        INSERT INTO todos_fts(rowid, title, description, owner)
+        VALUES (new.id, new.title, coalesce(new.description, ''), 'u' || new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN
+        INSERT INTO todos_fts(todos_fts, rowid, title, description, owner)
+        VALUES ('delete', old.id, old.title, coalesce(old.description, ''), 'u' || old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF title, description, user_id ON todos BEGIN
+        INSERT INTO todos_fts(todos_fts, rowid, title, description, owner)
+        VALUES ('delete', old.id, old.title, coalesce(old.description, ''), 'u' || old.user_id);
+        INSERT INTO todos_fts(rowid, title, description, owner)
+        VALUES (new.id, new.title, coalesce(new.description, ''), 'u' || new.user_id);
+    END
+    """,
+]
+
+# Заполнение индекса по уже существующим задачам
+BACKFILL = """
+    INSERT INTO todos_fts(rowid, title, description, owner)
+    SELECT id, title, coalesce(description, ''), 'u' || user_id FROM todos
+"""
+
+
+# Индекс заполняется только при первом создании таблицы: в базе, где FTS уже был
+# создан прежним init_db, повторная вставка задублировала бы записи
+def upgrade(conn) -> None:
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todos_fts'")
+    ).first()
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
+    if not exists:
+        conn.execute(text(BACKFILL))
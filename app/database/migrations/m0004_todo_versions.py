@@ -0,0 +1,48 @@
+from sqlalchemy import text
+
+
+# Версия списка задач пользователя для ETag и триггеры на todos, увеличивающие её.
+# Срабатывают в той же транзакции для любого пути записи: формы, API, пакетные операции.
+def _bump(ref: str) -> str:
+    return f"""
+        INSERT INTO user_todo_stats(user_id, version) VALUES ({ref}.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+    """
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS user_todo_stats (
+        user_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (user_id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_version_ai AFTER INSERT ON todos BEGIN
+        {_bump("new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_version_ad AFTER DELETE ON todos BEGIN
+        {_bump("old")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_version_au AFTER UPDATE ON todos BEGIN
+        {_bump("new")}
+    END
+    """,
+    # Задача сменила владельца — меняется и список прежнего
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_version_au_owner AFTER UPDATE OF user_id ON todos
+    WHEN old.user_id IS NOT new.user_id BEGIN
+        {_bump("old")}
+    END
+    """,
+]
+
+
+def upgrade(conn) -> None:
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
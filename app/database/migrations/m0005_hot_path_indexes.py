@@ -0,0 +1,13 @@
+# Индексы под частые запросы. SQLite строит индекс под блокировкой записи, поэтому
+# миграция помечена ONLINE: она выполняется в фоне после старта, а не задерживает его.
+ONLINE = True
+
+STATEMENTS = [
+    # Списки задач с фильтром по выполненности: удаление выполненных, массовые операции
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_completed_id ON todos (user_id, completed, id)",
+    # Очистка просроченных токенов сброса пароля
+    "CREATE INDEX IF NOT EXISTS ix_password_reset_tokens_expires_at ON password_reset_tokens (expires_at)",
+    # Удаление токенов вместе с пользователем
+    "CREATE INDEX IF NOT EXISTS ix_password_reset_tokens_user_id ON password_reset_tokens (user_id)",
+]
+
@@ -0,0 +1,70 @@
+from sqlalchemy import text
+
+from app.database.migrations import add_column
+
+
+# Счётчики задач пользователя (всего и выполнено) в user_todo_stats.
+# Триггеры версии из m0004 заменяются триггерами, которые в той же транзакции меняют
+# и версию, и счётчики. completed IS 1 даёт 0/1 и для NULL.
+
+def _upsert(ref: str, total: str, completed: str) -> str:
+    return f"""
+        INSERT INTO user_todo_stats(user_id, version, total, completed)
+        VALUES ({ref}.user_id, 1, max({total}, 0), max({completed}, 0))
+        ON CONFLICT(user_id) DO UPDATE SET
+            version = version + 1,
+            total = total + ({total}),
+            completed = completed + ({completed});
+    """
+
+_SAME_OWNER = "old.user_id IS new.user_id"
+
+STATEMENTS = [
+    "DROP TRIGGER IF EXISTS todos_version_ai",
+    "DROP TRIGGER IF EXISTS todos_version_ad",
+    "DROP TRIGGER IF EXISTS todos_version_au",
+    "DROP TRIGGER IF EXISTS todos_version_au_owner",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_stats_ai AFTER INSERT ON todos WHEN new.user_id IS NOT NULL BEGIN
+        {_upsert("new", "1", "new.completed IS 1")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_stats_ad AFTER DELETE ON todos WHEN old.user_id IS NOT NULL BEGIN
+        {_upsert("old", "-1", "-(old.completed IS 1)")}
+    END
+    """,
+    # Для нового (или того же) владельца: задача добавилась, если владелец сменился,
+    # а выполненные меняются на разницу флага
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_stats_au AFTER UPDATE ON todos WHEN new.user_id IS NOT NULL BEGIN
+        {_upsert(
+            "new",
+            f"NOT ({_SAME_OWNER})",
+            f"(new.completed IS 1) - CASE WHEN {_SAME_OWNER} THEN (old.completed IS 1) ELSE 0 END",
+        )}
+    END
+    """,
+    # Задача сменила владельца — у прежнего она убывает
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_stats_au_owner AFTER UPDATE OF user_id ON todos
+    WHEN old.user_id IS NOT new.user_id AND old.user_id IS NOT NULL BEGIN
+        {_upsert("old", "-1", "-(old.completed IS 1)")}
+    END
+    """,
+]
+
+# Заполнение счётчиков по существующим задачам
+BACKFILL = """
+    INSERT INTO user_todo_stats(user_id, version, total, completed)
+    SELECT user_id, 1, count(*), sum(completed IS 1) FROM todos WHERE user_id IS NOT NULL GROUP BY user_id
+    ON CONFLICT(user_id) DO UPDATE SET total = excluded.total, completed = excluded.completed
+"""
+
+
+def upgrade(conn) -> None:
+    add_column(conn, "user_todo_stats", "total", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "user_todo_stats", "completed", "INTEGER NOT NULL DEFAULT 0")
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
+    conn.execute(text(BACKFILL))
@@ -0,0 +1,45 @@
+from sqlalchemy import text
+
+from app.database.migrations import add_column
+
+
+# Архив выполненных задач: время выполнения в todos и таблица todos_archive.
+# completed_at ставят триггеры при любом пути записи; для уже выполненных задач
+# отсчёт начинается с момента миграции — настоящее время выполнения неизвестно.
+# Повторный прогон (или база из create_all) ничего не ломает: колонка добавляется, только если
+# её нет, а уже заполненное completed_at не перезаписывается
+STATEMENTS = [
+    "UPDATE todos SET completed_at = datetime('now') WHERE completed IS 1 AND completed_at IS NULL",
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_completed_at_ai AFTER INSERT ON todos
+    WHEN new.completed IS 1 AND new.completed_at IS NULL BEGIN
+        UPDATE todos SET completed_at = datetime('now') WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_completed_at_au AFTER UPDATE OF completed ON todos
+    WHEN (new.completed IS 1) != (old.completed IS 1) BEGIN
+        UPDATE todos SET completed_at = CASE WHEN new.completed IS 1 THEN datetime('now') END WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS todos_archive (
+        id INTEGER NOT NULL,
+        title VARCHAR NOT NULL,
+        description VARCHAR,
+        completed BOOLEAN,
+        user_id INTEGER,
+        completed_at DATETIME,
+        archived_at DATETIME NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_todos_archive_user_id_id ON todos_archive (user_id, id)",
+]
+
+
+def upgrade(conn) -> None:
+    add_column(conn, "todos", "completed_at", "DATETIME")
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
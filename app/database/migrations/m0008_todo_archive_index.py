@@ -0,0 +1,6 @@
+# Частичный индекс для выбора задач к архивации: только выполненные, поэтому он мал
+ONLINE = True
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_todos_completed_at ON todos (completed_at) WHERE completed_at IS NOT NULL",
+]
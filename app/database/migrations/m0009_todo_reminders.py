@@ -0,0 +1,10 @@
+from app.database.migrations import add_column
+
+
+# Срок задачи и время напоминания. remind_at обнуляется, когда напоминание поставлено
+# в очередь писем, поэтому индекс по нему (m0010) содержит только ожидающие напоминания.
+# В архиве сохраняется срок; напоминания архивным задачам не нужны
+def upgrade(conn) -> None:
+    add_column(conn, "todos", "due_at", "DATETIME")
+    add_column(conn, "todos", "remind_at", "DATETIME")
+    add_column(conn, "todos_archive", "due_at", "DATETIME")
@@ -0,0 +1,7 @@
+# Частичный индекс ожидающих напоминаний в порядке срабатывания — по нему планировщик
+# дочитывает следующее окно напоминаний, не просматривая todos
+ONLINE = True
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_todos_remind_at ON todos (remind_at, id) WHERE remind_at IS NOT NULL",
+]
@@ -0,0 +1,33 @@
+from sqlalchemy import text
+
+
+# Каталог пользователей для шардирования: имя и email → id пользователя и номер шарда.
+# Используется только в шарде 0; в остальных файлах таблица создаётся для единой схемы и пустует.
+# Уже существующие пользователи заносятся в каталог как жители шарда 0 — до шардирования
+# другого файла не было; в остальных шардах копировать некуда и незачем. Уникальные индексы
+# каталога держат имя и email уникальными во всех шардах
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS user_directory (
+        user_id INTEGER NOT NULL,
+        username VARCHAR NOT NULL,
+        email VARCHAR NOT NULL,
+        shard INTEGER NOT NULL,
+        PRIMARY KEY (user_id)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_user_directory_username ON user_directory (username)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_user_directory_email ON user_directory (email)",
+]
+
+BACKFILL = """
+    INSERT OR IGNORE INTO user_directory (user_id, username, email, shard)
+    SELECT id, username, email, 0 FROM users
+"""
+
+
+def upgrade(conn) -> None:
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
+    if conn.info.get("shard", 0) == 0:
+        conn.execute(text(BACKFILL))
@@ -0,0 +1,82 @@
+from sqlalchemy import text
+
+from app.database.migrations import add_column
+
+
+# Теги задач и время изменения задачи для сортировки.
+# tags — теги пользователя со счётчиками задач (всего и выполнено), их ведут триггеры на todo_tags,
+# так что число задач с тегом читается одной строкой. todo_tags копирует completed, updated_at
+# и title задачи (их держат в актуальном состоянии триггеры на todos): страница задач с тегом
+# фильтруется и сортируется по индексам todo_tags. Таблица новая и пустая, поэтому её индексы
+# строятся здесь же; индексы todos — в фоновой m0013.
+# Существующим задачам updated_at выставляется в момент миграции (в формате, который пишет
+# SQLAlchemy, чтобы строки сравнивались единообразно)
+STATEMENTS = [
+    "UPDATE todos SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') || '000' WHERE updated_at IS NULL",
+    """
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        name VARCHAR NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_tags_user_name ON tags (user_id, name)",
+    """
+    CREATE TABLE IF NOT EXISTS todo_tags (
+        todo_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL,
+        completed BOOLEAN NOT NULL DEFAULT 0,
+        updated_at DATETIME,
+        title VARCHAR NOT NULL,
+        PRIMARY KEY (todo_id, tag_id),
+        FOREIGN KEY(todo_id) REFERENCES todos (id),
+        FOREIGN KEY(tag_id) REFERENCES tags (id)
+    )
+    """,
+    # Каждое сочетание фильтра по выполненности и сортировки (создание, изменение, заголовок)
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_todo ON todo_tags (tag_id, todo_id)",
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_completed_todo ON todo_tags (tag_id, completed, todo_id)",
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_updated_todo ON todo_tags (tag_id, updated_at, todo_id)",
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_completed_updated_todo ON todo_tags (tag_id, completed, updated_at, todo_id)",
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_title_todo ON todo_tags (tag_id, title, todo_id)",
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_completed_title_todo ON todo_tags (tag_id, completed, title, todo_id)",
+    # Счётчики тега: completed IS 1 даёт 0/1
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_tags_count_ai AFTER INSERT ON todo_tags BEGIN
+        UPDATE tags SET total = total + 1, completed = completed + (new.completed IS 1) WHERE id = new.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_tags_count_ad AFTER DELETE ON todo_tags BEGIN
+        UPDATE tags SET total = total - 1, completed = completed - (old.completed IS 1) WHERE id = old.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_tags_count_au AFTER UPDATE OF completed ON todo_tags
+    WHEN (old.completed IS 1) IS NOT (new.completed IS 1) BEGIN
+        UPDATE tags SET completed = completed + (new.completed IS 1) - (old.completed IS 1) WHERE id = new.tag_id;
+    END
+    """,
+    # Копии полей задачи в связях с тегами; удалённая (или архивированная) задача теряет теги
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tags_au AFTER UPDATE OF title, completed, updated_at ON todos BEGIN
+        UPDATE todo_tags SET title = new.title, completed = coalesce(new.completed, 0), updated_at = new.updated_at
+        WHERE todo_id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tags_ad AFTER DELETE ON todos BEGIN
+        DELETE FROM todo_tags WHERE todo_id = old.id;
+    END
+    """,
+]
+
+
+def upgrade(conn) -> None:
+    add_column(conn, "todos", "updated_at", "DATETIME")
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
@@ -0,0 +1,12 @@
+# Индексы сортировок списка задач: по времени изменения и по заголовку, с фильтром по
+# выполненности и без. Сортировку по созданию (id) уже покрывают ix_todos_user_id_id (m0001)
+# и ix_todos_user_completed_id (m0005)
+ONLINE = True
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_updated_id ON todos (user_id, updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_completed_updated_id ON todos (user_id, completed, updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_title_id ON todos (user_id, title, id)",
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_completed_title_id ON todos (user_id, completed, title, id)",
+]
+
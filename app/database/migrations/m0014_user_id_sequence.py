@@ -0,0 +1,20 @@
+from sqlalchemy import text
+
+
+# Счётчик id пользователей шарда: строка на диапазон id (range_start — его нижняя граница,
+# не входящая в диапазон). Строку создаёт первая регистрация после миграции, начиная с
+# наибольшего уже выданного id; дальше id выдаются только из счётчика, а не по MAX(users.id)
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS user_id_sequence (
+        range_start INTEGER NOT NULL,
+        last_id INTEGER NOT NULL,
+        PRIMARY KEY (range_start)
+    )
+    """,
+]
+
+
+def upgrade(conn) -> None:
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
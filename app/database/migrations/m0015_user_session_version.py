@@ -0,0 +1,7 @@
+from app.database.migrations import add_column
+
+
+# Версия сессий пользователя: входит в подписанный токен сессии и увеличивается при сбросе
+# и смене пароля и при выходе на всех устройствах — выпущенные раньше токены перестают действовать
+def upgrade(conn) -> None:
+    add_column(conn, "users", "session_version", "INTEGER NOT NULL DEFAULT 0")
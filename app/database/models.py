@@ -1,11 +1,17 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 import datetime
+from datetime import UTC
 
 from .db import Base
 
 
 
+# Текущее время в UTC без пояса — значение по умолчанию для отметок времени
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(UTC).replace(tzinfo=None)
+
+
 # Модель пользователя (User)
 class User(Base):
     __tablename__ = "users"
@@ -16,6 +22,8 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    # Версия сессий: токены с другой версией недействительны (сброс пароля, выход на всех устройствах)
+    session_version = Column(Integer, nullable=False, default=0, server_default="0")
     todos = relationship("ToDo", back_populates="owner", cascade="all, delete-orphan")
 
 
@@ -27,9 +35,92 @@ class ToDo(Base):
     title = Column(String, nullable=False)
     description = Column(String, nullable=True)
     completed = Column(Boolean, default=False)
+    # Время выполнения ставят триггеры (m0007_todo_archive); по нему задачи уходят в архив
+    completed_at = Column(DateTime, nullable=True)
+    # Срок и время напоминания (UTC); remind_at обнуляется после постановки письма в очередь
+    due_at = Column(DateTime, nullable=True)
+    remind_at = Column(DateTime, nullable=True)
+    # Время последнего изменения содержимого (ставит crud); по нему сортировка «недавно изменённые»
+    updated_at = Column(DateTime, nullable=True, default=_utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="todos")
 
+    # Индексы под курсорную пагинацию (user_id, id) и выборки по выполненности.
+    # Схему создают миграции (app/database/migrations); здесь индексы описаны для справки
+    __table_args__ = (
+        Index("ix_todos_user_id_id", "user_id", "id"),
+        Index("ix_todos_user_completed_id", "user_id", "completed", "id"),
+        Index("ix_todos_completed_at", "completed_at", sqlite_where=completed_at.isnot(None)),
+        Index("ix_todos_remind_at", "remind_at", "id", sqlite_where=remind_at.isnot(None)),
+        Index("ix_todos_user_updated_id", "user_id", "updated_at", "id"),
+        Index("ix_todos_user_completed_updated_id", "user_id", "completed", "updated_at", "id"),
+        Index("ix_todos_user_title_id", "user_id", "title", "id"),
+        Index("ix_todos_user_completed_title_id", "user_id", "completed", "title", "id"),
+    )
+
+
+# Тег пользователя (Tag). Счётчики задач с тегом (всего и выполнено) ведут триггеры на todo_tags
+class Tag(Base):
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_tags_user_name", "user_id", "name", unique=True),)
+
+
+# Связь задачи с тегом (ToDoTag). completed, updated_at и title копируют поля задачи (их
+# обновляют триггеры на todos): фильтр по тегу и выполненности и порядок страницы целиком
+# берутся из индексов (tag_id, [completed,] ключ сортировки, todo_id) без чтения чужих строк
+class ToDoTag(Base):
+    __tablename__ = "todo_tags"
+
+    todo_id = Column(Integer, ForeignKey("todos.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, nullable=True)
+    title = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_todo_tags_tag_todo", "tag_id", "todo_id"),
+        Index("ix_todo_tags_tag_completed_todo", "tag_id", "completed", "todo_id"),
+        Index("ix_todo_tags_tag_updated_todo", "tag_id", "updated_at", "todo_id"),
+        Index("ix_todo_tags_tag_completed_updated_todo", "tag_id", "completed", "updated_at", "todo_id"),
+        Index("ix_todo_tags_tag_title_todo", "tag_id", "title", "todo_id"),
+        Index("ix_todo_tags_tag_completed_title_todo", "tag_id", "completed", "title", "todo_id"),
+    )
+
+
+# Архив задач (ToDoArchive): выполненные задачи старше ARCHIVE_AFTER_DAYS переносятся сюда
+# из todos с тем же id, чтобы списки и индексы горячей таблицы не росли бесконечно
+class ToDoArchive(Base):
+    __tablename__ = "todos_archive"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    description = Column(String, nullable=True)
+    completed = Column(Boolean)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    completed_at = Column(DateTime, nullable=True)
+    due_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_todos_archive_user_id_id", "user_id", "id"),)
+
+
+# Сводка по задачам пользователя (UserTodoStats), которую ведут триггеры на todos в той же
+# транзакции, что и запись: версия списка (основа ETag) и счётчики всего / выполнено
+class UserTodoStats(Base):
+    __tablename__ = "user_todo_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+
 
 # Модель токена восстановления пароля (PasswordResetToken)
 class PasswordResetToken(Base):
@@ -41,3 +132,48 @@ class PasswordResetToken(Base):
     expires_at = Column(DateTime, nullable=False)
 
     user = relationship("User")
+
+    # Очистка просроченных токенов и удаление токенов пользователя
+    __table_args__ = (
+        Index("ix_password_reset_tokens_expires_at", "expires_at"),
+        Index("ix_password_reset_tokens_user_id", "user_id"),
+    )
+
+
+# Модель исходящего письма (EmailOutbox) — очередь доставки email
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending / sent / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    # Индекс под выборку писем, готовых к отправке
+    __table_args__ = (Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),)
+
+
+# Каталог пользователей (UserDirectory) в шарде 0: по имени или email находит id и шард
+# пользователя при входе и регистрации, по id — шард для остальных запросов
+class UserDirectory(Base):
+    __tablename__ = "user_directory"
+
+    user_id = Column(Integer, primary_key=True)
+    username = Column(String, unique=True, nullable=False)
+    email = Column(String, unique=True, nullable=False)
+    shard = Column(Integer, nullable=False)
+
+
+# Счётчик id пользователей (UserIdSequence) в каждом шарде: последний выданный id диапазона
+# шарда. Только растёт — id удалённого или перенесённого в другой шард пользователя не выдаётся снова
+class UserIdSequence(Base):
+    __tablename__ = "user_id_sequence"
+
+    range_start = Column(Integer, primary_key=True)
+    last_id = Column(Integer, nullable=False)
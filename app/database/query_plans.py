@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+import sys
+from datetime import UTC
+
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.sql import Executable
+
+from app.database.db import engine, init_db, run_online_migrations, dispose_engines
+from app.database.crud.todo import build_todos_query
+from app.database.models import EmailOutbox, PasswordResetToken, Tag, ToDo, ToDoArchive, User, UserTodoStats
+from app.schemas.todo import ToDoFilter
+
+
+# Проверка планов основных запросов через EXPLAIN QUERY PLAN.
+# Запрос считается проблемным, если SQLite читает таблицу целиком (SCAN без индекса)
+# или сортирует строки сам (USE TEMP B-TREE FOR ORDER BY) вместо чтения по индексу.
+# Запуск: python -m app.database.query_plans — код возврата 1, если найден полный просмотр.
+
+# Основные запросы приложения в том виде, в каком их строят функции crud
+def main_queries() -> dict[str, Executable]:
+    now = datetime.datetime.now(UTC)
+    todo_columns = (ToDo.id, ToDo.title, ToDo.description, ToDo.completed)
+    return {
+        "todos_page_first": select(*todo_columns).where(ToDo.user_id == 1).order_by(ToDo.id).limit(21),
+        "todos_page_after": select(*todo_columns)
+        .where(ToDo.user_id == 1, ToDo.id > 100)
+        .order_by(ToDo.id)
+        .limit(21),
+        "todos_page_before": select(*todo_columns)
+        .where(ToDo.user_id == 1, ToDo.id < 100)
+        .order_by(ToDo.id.desc())
+        .limit(21),
+        "todos_export": select(*todo_columns, ToDo.completed_at).where(ToDo.user_id == 1).order_by(ToDo.id),
+        "todo_by_id": select(*todo_columns).where(ToDo.id == 1, ToDo.user_id == 1),
+        "todos_archived_page": select(ToDoArchive.id, ToDoArchive.title)
+        .where(ToDoArchive.user_id == 1, ToDoArchive.id > 100)
+        .order_by(ToDoArchive.id)
+        .limit(21),
+        "todos_archive_due": select(ToDo.id)
+        .where(ToDo.completed.is_(True), ToDo.completed_at < now)
+        .order_by(ToDo.completed_at)
+        .limit(500),
+        "reminders_window": select(ToDo.remind_at, ToDo.id)
+        .where(ToDo.remind_at.is_not(None), ToDo.remind_at <= now, tuple_(ToDo.remind_at, ToDo.id) > tuple_(now, 1))
+        .order_by(ToDo.remind_at, ToDo.id)
+        .limit(1000),
+        "todos_delete_completed": delete(ToDo).where(ToDo.user_id == 1, ToDo.completed.is_(True)),
+        "todo_stats": select(UserTodoStats.total, UserTodoStats.completed, UserTodoStats.version)
+        .where(UserTodoStats.user_id == 1),
+        "tags_with_counts": select(Tag.name, Tag.total, Tag.completed).where(Tag.user_id == 1).order_by(Tag.name),
+        **todo_list_queries(),
+        "user_by_username": select(User).where(User.username == "user"),
+        "user_by_email": select(User).where(User.email == "user@example.com"),
+        "reset_token_by_token": select(PasswordResetToken).where(PasswordResetToken.token == "token"),
+        "reset_tokens_expired": delete(PasswordResetToken).where(PasswordResetToken.expires_at < now),
+        "reset_tokens_by_user": delete(PasswordResetToken).where(PasswordResetToken.user_id == 1),
+        "outbox_due": update(EmailOutbox)
+        .where(
+            EmailOutbox.id.in_(
+                select(EmailOutbox.id)
+                .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(50)
+            )
+        )
+        .values(attempts=EmailOutbox.attempts + 1),
+    }
+
+
+# Страницы списка задач в каждом сочетании фильтра, тегов и сортировки — как их строит crud
+def todo_list_queries() -> dict[str, Executable]:
+    queries = {}
+    for sort, cursor in (("created", 100), ("updated", ("2026-01-01 00:00:00.000000", 100)), ("title", ("title", 100))):
+        for status, completed in (("all", None), ("open", False)):
+            for tagged, tags in (("", []), ("_tag", ["a"]), ("_tags", ["a", "b"])):
+                filters = ToDoFilter(completed=completed, tags=tags, sort=sort)
+                name = f"todos_{sort}_{status}{tagged}"
+                queries[name] = build_todos_query(1, filters)
+                queries[f"{name}_before"] = build_todos_query(1, filters, before=cursor)
+    return queries
+
+
+# Строки плана запроса (колонка detail EXPLAIN QUERY PLAN)
+def explain(conn, statement: Executable) -> list[str]:
+    compiled = statement.compile(conn, compile_kwargs={"literal_binds": True})
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")
+    return [row[-1] for row in rows]
+
+
+# Полный просмотр таблицы: "SCAN <table>" без "USING ... INDEX"
+def is_full_scan(detail: str) -> bool:
+    return detail.startswith("SCAN ") and "INDEX" not in detail
+
+
+# Сортировка результата во временном B-дереве: порядок не берётся из индекса
+def is_temp_sort(detail: str) -> bool:
+    return detail.startswith("USE TEMP B-TREE FOR ORDER BY")
+
+
+# Запросы, план которых содержит полный просмотр таблицы: имя -> строки плана
+def find_full_scans(conn) -> dict[str, list[str]]:
+    problems = {}
+    for name, statement in main_queries().items():
+        plan = explain(conn, statement)
+        if any(is_full_scan(detail) or is_temp_sort(detail) for detail in plan):
+            problems[name] = plan
+    return problems
+
+
+async def check_query_plans() -> dict[str, list[str]]:
+    async with engine.connect() as conn:
+        return await conn.run_sync(find_full_scans)
+
+
+async def _main() -> int:
+    await init_db()
+    await run_online_migrations()
+    problems = await check_query_plans()
+    await dispose_engines()
+    for name, plan in problems.items():
+        print(f"{name}: {'; '.join(plan)}")
+    if not problems:
+        print("Все основные запросы используют индексы")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import func, insert, select, update
+
+from app.database.db import Shard, dispose_engines, init_db, shards
+from app.database.models import PasswordResetToken, Tag, ToDo, ToDoArchive, ToDoTag, User, UserTodoStats
+from app.database.sharding import shard_router
+from app.database.crud.user import delete_user_rows
+
+
+# Ребалансировка шардов: перенос всех строк пользователя (профиль, задачи, архив, теги, счётчики,
+# токены сброса пароля) в другой шард и смена шарда в каталоге.
+# id пользователя сохраняется; задачи получают новые id после наибольшего id целевого шарда
+# в прежнем порядке, поэтому курсорная пагинация и сортировка не меняются.
+# Запускается при остановленном приложении: работающий процесс держит шард пользователя в кэше.
+# Запуск: python -m app.database.rebalance --user 42 --to 1
+#         python -m app.database.rebalance --stats — пользователи и задачи по шардам
+
+
+# Перенос пользователя в шард target; возвращает число перенесённых задач (с архивом).
+# Прерванный перенос можно повторить: остатки пользователя в целевом шарде удаляются перед
+# копированием, а в остальных шардах — после смены шарда в каталоге
+async def move_user(user_id: int, target: Shard) -> int:
+    source = await shard_router.shard_for_user(user_id)
+    moved = 0
+    if source is not target:
+        async with source.read_session() as session:
+            user = (await session.execute(select(User.__table__).where(User.id == user_id))).mappings().one_or_none()
+            if user is None:
+                raise ValueError(f"User {user_id} not found in shard {source.number}")
+            todos = (
+                await session.execute(select(ToDo.__table__).where(ToDo.user_id == user_id).order_by(ToDo.id))
+            ).mappings().all()
+            archived = (
+                await session.execute(select(ToDoArchive.__table__).where(ToDoArchive.user_id == user_id).order_by(ToDoArchive.id))
+            ).mappings().all()
+            tags = (
+                await session.execute(select(Tag.id, Tag.name).where(Tag.user_id == user_id).order_by(Tag.id))
+            ).mappings().all()
+            links = (
+                await session.execute(
+                    select(ToDoTag.__table__).join(Tag, Tag.id == ToDoTag.tag_id).where(Tag.user_id == user_id)
+                )
+            ).mappings().all()
+            tokens = (
+                await session.execute(
+                    select(PasswordResetToken.user_id, PasswordResetToken.token, PasswordResetToken.expires_at)
+                    .where(PasswordResetToken.user_id == user_id)
+                )
+            ).mappings().all()
+            version = (
+                await session.execute(select(UserTodoStats.version).where(UserTodoStats.user_id == user_id))
+            ).scalar_one_or_none() or 0
+
+        async with target.session() as session:
+            await delete_user_rows(session, user_id)
+        async with target.session() as session:
+            # Задачи и архив делят одно пространство id (архив сохраняет id задачи)
+            last_todo = (await session.execute(select(func.coalesce(func.max(ToDo.id), 0)))).scalar_one()
+            last_archived = (await session.execute(select(func.coalesce(func.max(ToDoArchive.id), 0)))).scalar_one()
+            start = max(last_todo, last_archived)
+            old_ids = sorted(row["id"] for row in (*todos, *archived))
+            new_ids = {old: start + number for number, old in enumerate(old_ids, 1)}
+            await session.execute(insert(User.__table__), [dict(user)])
+            if todos:
+                await session.execute(insert(ToDo.__table__), [{**row, "id": new_ids[row["id"]]} for row in todos])
+            if archived:
+                await session.execute(insert(ToDoArchive.__table__), [{**row, "id": new_ids[row["id"]]} for row in archived])
+            # Теги получают новые id целевого шарда; их счётчики набирают триггеры вставки связей
+            new_tags = {}
+            for tag in tags:
+                new_tags[tag["id"]] = (
+                    await session.execute(
+                        insert(Tag).values(user_id=user_id, name=tag["name"], total=0, completed=0).returning(Tag.id)
+                    )
+                ).scalar_one()
+            if links:
+                await session.execute(
+                    insert(ToDoTag.__table__),
+                    [{**row, "todo_id": new_ids[row["todo_id"]], "tag_id": new_tags[row["tag_id"]]} for row in links],
+                )
+            if tokens:
+                await session.execute(insert(PasswordResetToken.__table__), [dict(row) for row in tokens])
+            # Счётчики пересчитали триггеры вставки; версия продолжает прежнюю, чтобы старые ETag не совпали
+            await session.execute(
+                update(UserTodoStats).where(UserTodoStats.user_id == user_id).values(version=UserTodoStats.version + version)
+            )
+            await session.commit()
+        # Пользователь без записи в каталоге заносится в него перед сменой шарда
+        await shard_router.rename(user_id, user["username"], user["email"])
+        await shard_router.move(user_id, target)
+        moved = len(old_ids)
+    for shard in shards:
+        if shard is not target:
+            async with shard.session() as session:
+                await delete_user_rows(session, user_id)
+    return moved
+
+
+# Число пользователей и задач в каждом шарде
+async def shard_stats() -> list[tuple[int, int, int]]:
+    stats = []
+    for shard in shards:
+        async with shard.read_session() as session:
+            users = (await session.execute(select(func.count()).select_from(User))).scalar_one()
+            todos = (await session.execute(select(func.coalesce(func.sum(UserTodoStats.total), 0)))).scalar_one()
+        stats.append((shard.number, users, todos))
+    return stats
+
+
+async def _main(args) -> int:
+    await init_db()
+    try:
+        if args.stats:
+            for number, users, todos in await shard_stats():
+                print(f"shard {number}: {users} users, {todos} todos")
+            return 0
+        if not 0 <= args.to < len(shards):
+            print(f"Нет шарда {args.to}: DB_SHARDS={len(shards)}")
+            return 1
+        try:
+            moved = await move_user(args.user, shards[args.to])
+        except ValueError as exc:
+            print(exc)
+            return 1
+        print(f"Пользователь {args.user} в шарде {args.to}, перенесено задач: {moved}")
+        return 0
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", type=int, help="id пользователя")
+    parser.add_argument("--to", type=int, help="номер целевого шарда")
+    parser.add_argument("--stats", action="store_true", help="показать распределение по шардам")
+    args = parser.parse_args()
+    if not args.stats and (args.user is None or args.to is None):
+        parser.error("нужны --user и --to или --stats")
+    sys.exit(asyncio.run(_main(args)))
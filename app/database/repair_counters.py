@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import sys
+
+from app.database.db import dispose_engines, init_db, shards
+from app.database.crud.todo import find_todo_counter_drift, repair_todo_counters
+
+
+# Проверка и пересчёт счётчиков задач в user_todo_stats по фактическим данным todos.
+# Триггеры держат счётчики точными; расхождение возможно после ручных правок базы
+# или восстановления из копии. Проверяются все шарды.
+# Запуск: python -m app.database.repair_counters [--check] — с --check только отчёт и код возврата 1 при расхождении.
+
+async def _main(check: bool) -> int:
+    await init_db()
+    drift = []
+    for shard in shards:
+        if check:
+            async with shard.read_session() as session:
+                drift += await find_todo_counter_drift(session)
+        else:
+            async with shard.session() as session:
+                drift += await repair_todo_counters(session)
+    await dispose_engines()
+    for d in drift:
+        print(
+            f"user {d.user_id}: total {d.stored_total} -> {d.actual_total}, "
+            f"completed {d.stored_completed} -> {d.actual_completed}"
+        )
+    if not drift:
+        print("Счётчики задач совпадают с данными")
+    elif not check:
+        print(f"Исправлено пользователей: {len(drift)}")
+    return 1 if drift and check else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="только проверить, не исправляя")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.check)))
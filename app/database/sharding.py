@@ -0,0 +1,83 @@
+import zlib
+
+from app.core.config import settings
+from app.database.db import USER_ID_RANGE, Shard, shards
+from app.database.crud.directory import (
+    add_directory_entry,
+    delete_directory_entry,
+    find_directory_entry,
+    find_unlisted_user,
+    get_user_shard_number,
+    update_directory_entry,
+)
+from app.utils.cache import TTLCache
+
+
+# Маршрутизация пользователей по шардам. Каталог в шарде 0 хранит шард каждого пользователя;
+# ответы по id кэшируются в процессе. Пользователь без записи в каталоге (созданный до
+# шардирования или в обход регистрации) живёт в шарде, из диапазона которого выдан его id
+class ShardRouter:
+    def __init__(self, shards: list[Shard], cache_size: int, cache_ttl: float):
+        self.shards = shards
+        self.directory = shards[0]
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    # Шард, выдавший id (по диапазону USER_ID_RANGE)
+    def home_shard(self, user_id: int) -> Shard:
+        number = (user_id - 1) // USER_ID_RANGE
+        return self.shards[number] if 0 <= number < len(self.shards) else self.directory
+
+    # Шард для нового пользователя — по хэшу имени, чтобы пользователи распределялись равномерно
+    def place(self, username: str) -> Shard:
+        return self.shards[zlib.crc32(username.encode()) % len(self.shards)]
+
+    async def shard_for_user(self, user_id: int) -> Shard:
+        number = self._cache.get(user_id)
+        if number is None:
+            async with self.directory.read_session() as session:
+                number = await get_user_shard_number(session, user_id)
+            if number is None:
+                number = self.home_shard(user_id).number
+            self._cache.set(user_id, number)
+        return self.shards[number]
+
+    # Поиск пользователя по имени или email для входа, регистрации и восстановления пароля:
+    # (id, шард) или None
+    async def find(self, username: str | None = None, email: str | None = None) -> tuple[int, Shard] | None:
+        async with self.directory.read_session() as session:
+            entry = await find_directory_entry(session, username=username, email=email)
+            if entry is None:
+                user_id = await find_unlisted_user(session, username=username, email=email)
+                return (user_id, self.directory) if user_id is not None else None
+        user_id, number = entry
+        return user_id, self.shards[number]
+
+    # Регистрация в каталоге; занятые имя или email дают IntegrityError
+    async def register(self, user_id: int, username: str, email: str, shard: Shard) -> None:
+        async with self.directory.session() as session:
+            await add_directory_entry(session, user_id, username, email, shard.number)
+        self._cache.set(user_id, shard.number)
+
+    # Смена имени или email; пользователь без записи в каталоге при этом в него заносится
+    async def rename(self, user_id: int, username: str, email: str) -> None:
+        async with self.directory.session() as session:
+            if not await update_directory_entry(session, user_id, username=username, email=email):
+                shard = await self.shard_for_user(user_id)
+                await add_directory_entry(session, user_id, username, email, shard.number)
+
+    async def unregister(self, user_id: int) -> None:
+        async with self.directory.session() as session:
+            await delete_directory_entry(session, user_id)
+        self._cache.invalidate(user_id)
+
+    # Перевод пользователя в другой шард после переноса его строк (app/database/rebalance.py)
+    async def move(self, user_id: int, shard: Shard) -> None:
+        async with self.directory.session() as session:
+            await update_directory_entry(session, user_id, shard=shard.number)
+        self._cache.set(user_id, shard.number)
+
+    def stats(self) -> dict:
+        return {"shards": len(self.shards), "hits": self._cache.hits, "misses": self._cache.misses}
+
+
+shard_router = ShardRouter(shards, cache_size=settings.SHARD_CACHE_SIZE, cache_ttl=settings.SHARD_CACHE_TTL)
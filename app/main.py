@@ -1,3 +1,5 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
@@ -6,16 +8,65 @@ from contextlib import asynccontextmanager
 
 
 from app.routes import router
-from app.database.db import init_db
+from app.database.db import init_db, dispose_engines, run_online_migrations
 from app.core.config import settings
+from app.utils.security import hasher
+from app.utils.outbox import outbox_worker
+from app.utils.archiver import archiver
+from app.utils.events import todo_events
+from app.utils.reminders import reminder_schedulers
+from app.utils.rate_limit import RateLimitMiddleware, default_rules, rate_limit_backend
+from app.utils.concurrency import ConcurrencyLimitMiddleware, auth_paths, concurrency_limiters
+from app.utils.metrics import MetricsMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    # Индексы строятся в фоне: приложение принимает запросы, не дожидаясь их
+    online_migrations = asyncio.create_task(run_online_migrations())
+    outbox_worker.start()
+    if settings.ARCHIVE_ENABLED:
+        archiver.start()
+    if settings.REMINDERS_ENABLED:
+        for scheduler in reminder_schedulers:
+            scheduler.start()
     yield
+    # Открытые SSE-потоки завершаем первыми, иначе сервер ждёт их при выключении
+    todo_events.close()
+    for scheduler in reminder_schedulers:
+        await scheduler.stop()
+    await archiver.stop()
+    await outbox_worker.stop()
+    # Незавершённое построение индекса дожидаемся — прерванная миграция повторится при следующем старте
+    await online_migrations
+    hasher.shutdown()
+    await dispose_engines()
 
 app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 
+# Ограничение одновременных запросов — внутренний слой: запросы сверх частоты
+# отклоняются раньше и места в очередях не занимают
+if settings.CONCURRENCY_LIMIT_ENABLED:
+    app.add_middleware(ConcurrencyLimitMiddleware, limiters=concurrency_limiters, auth_paths=auth_paths())
+
+# Ограничение частоты запросов к маршрутам с bcrypt и отправкой писем
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        backend=rate_limit_backend,
+        rules=default_rules(),
+        period=settings.RATE_LIMIT_PERIOD,
+    )
+
+# Метрики запросов — внешний слой, чтобы учитывались и ответы 429 и 503.
+# Долгоживущий поток SSE в гистограммы задержек не попадает
+if settings.METRICS_ENABLED:
+    app.add_middleware(
+        MetricsMiddleware,
+        n_plus_one_threshold=settings.METRICS_N_PLUS_ONE_THRESHOLD,
+        exclude=("/metrics", "/todos/events"),
+    )
+
 
 
 # Подключаем роутеры API
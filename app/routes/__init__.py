@@ -3,6 +3,9 @@ from fastapi import APIRouter
 from app.routes.todo import router as todo_router
 from app.routes.user import router as user_router
 from app.routes.auth import router as auth_router
+from app.routes.api import router as api_router
+from app.routes.metrics import router as metrics_router
+from app.core.config import settings
 
 
 router = APIRouter()
@@ -13,3 +16,6 @@ router = APIRouter()
 router.include_router(todo_router, prefix='/todos', tags=['todos'])
 router.include_router(user_router, prefix='/users', tags=['users'])
 router.include_router(auth_router, prefix='/auth', tags=['auth'])
+router.include_router(api_router, prefix='/api/v1', tags=['api'])
+if settings.METRICS_ENABLED:
+    router.include_router(metrics_router, tags=['metrics'])
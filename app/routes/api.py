@@ -0,0 +1,315 @@
+import math
+from collections.abc import AsyncIterator
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database.db import Shard
+from app.database.models import User
+from app.database.sharding import shard_router
+from app.database.crud.todo import (
+    get_todo,
+    get_todo_stats,
+    get_archived_todos_page,
+    get_todos_page,
+    get_tags,
+    search_todos,
+    stream_todos,
+    import_todos,
+    create_todo,
+    update_todo,
+    delete_todo,
+)
+from app.database.crud.user import bump_session_version, register_user, update_user, delete_user
+from app.schemas.todo import (
+    ToDoCreate,
+    ToDoUpdate,
+    ToDoRead,
+    ToDoPage,
+    ToDoFilter,
+    TagRead,
+    ToDoSearchPage,
+    ToDoStats,
+    ToDoImportResult,
+    ArchivedToDoPage,
+)
+from app.schemas.user import UserCreate, UserRead, UserUpdate
+from app.utils.events import publish_todo_event, publish_todo_reload
+from app.utils.reminders import reminders_for
+from app.utils.render_cache import render_cache
+from app.utils.responses import FastJSONResponse
+from app.utils.security import hasher, HashingUnavailableError
+from app.utils.session import create_session_token, get_read_session, get_session, get_user_shard, require_user
+from app.utils.todo_io import (
+    FORMATS,
+    ImportLineTooLongError,
+    detect_format,
+    encode_csv,
+    encode_ndjson,
+    iter_lines,
+    parse_csv,
+    parse_ndjson,
+)
+
+
+# JSON API v1 поверх crud-слоя. Ответы возвращаются готовым FastJSONResponse,
+# response_model нужен только для схемы OpenAPI
+router = APIRouter(default_response_class=FastJSONResponse)
+
+
+# Пул хэширования паролей перегружен: 503 и повтор не раньше, чем истечёт таймаут хэширования
+def server_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(math.ceil(settings.HASH_TIMEOUT))})
+
+
+# Запрос токена для клиентов API
+class TokenRequest(BaseModel):
+    username: str
+    password: str
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+
+# Выдача токена по имени пользователя и паролю (передаётся в Authorization: Bearer).
+# Шард пользователя находится по каталогу
+@router.post("/auth/token", response_model=TokenResponse)
+async def issue_token(payload: TokenRequest):
+    row = None
+    found = await shard_router.find(username=payload.username)
+    if found is not None:
+        user_id, shard = found
+        async with shard.read_session() as session:
+            result = await session.execute(
+                select(User.id, User.hashed_password, User.session_version).where(User.id == user_id)
+            )
+            row = result.one_or_none()
+    try:
+        valid = row is not None and await hasher.verify(payload.password, row.hashed_password)
+    except HashingUnavailableError:
+        raise server_busy()
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    token = create_session_token(row.id, remember=True, version=row.session_version)
+    return FastJSONResponse(TokenResponse(access_token=token))
+
+
+# Выход на всех устройствах: все выпущенные токены пользователя (и этот) перестают действовать
+@router.post("/auth/logout-all", status_code=204)
+async def api_logout_all(user: UserRead = Depends(require_user), shard: Shard = Depends(get_user_shard)):
+    async with shard.session() as session:
+        await bump_session_version(session, user.id)
+    return Response(status_code=204)
+
+
+# Регистрация пользователя
+@router.post("/users", response_model=UserRead, status_code=201)
+async def api_create_user(payload: UserCreate):
+    try:
+        user = await register_user(payload)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Username or email already exists")
+    except HashingUnavailableError:
+        raise server_busy()
+    return FastJSONResponse(user, status_code=201)
+
+# Текущий пользователь
+@router.get("/users/me", response_model=UserRead)
+async def api_get_me(user: UserRead = Depends(require_user)):
+    return FastJSONResponse(user)
+
+# Изменение текущего пользователя (каталог имён и email ведёт crud-слой)
+@router.patch("/users/me", response_model=UserRead)
+async def api_update_me(payload: UserUpdate, user: UserRead = Depends(require_user)):
+    try:
+        updated = await update_user(user.id, payload)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Username or email already exists")
+    except HashingUnavailableError:
+        raise server_busy()
+    if updated is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return FastJSONResponse(updated)
+
+# Удаление текущего пользователя вместе с задачами и записью каталога
+@router.delete("/users/me", status_code=204)
+async def api_delete_me(user: UserRead = Depends(require_user)):
+    await delete_user(user.id)
+    render_cache.invalidate_user(user.id)
+    return Response(status_code=204)
+
+
+# Список задач с курсорной пагинацией: фильтр по выполненности и тегам (tag можно повторять —
+# задача должна иметь все), сортировка по созданию, изменению или заголовку. Курсор годится
+# только для той сортировки, в которой получен
+@router.get("/todos", response_model=ToDoPage)
+async def api_list_todos(
+    after: str | None = None,
+    before: str | None = None,
+    limit: int = Query(settings.TODOS_PAGE_SIZE, ge=1, le=settings.TODOS_MAX_PAGE_SIZE),
+    completed: bool | None = None,
+    tag: list[str] = Query([]),
+    sort: Literal["created", "updated", "title"] = "created",
+    order: Literal["asc", "desc"] = "asc",
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    filters = ToDoFilter(completed=completed, tags=tag, sort=sort, descending=order == "desc")
+    try:
+        page = await get_todos_page(session, user.id, after=after, before=before, limit=limit, filters=filters)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return FastJSONResponse(page)
+
+# Теги пользователя с числом задач (счётчики хранятся в самих тегах)
+@router.get("/tags", response_model=list[TagRead])
+async def api_list_tags(user: UserRead = Depends(require_user), session: AsyncSession = Depends(get_read_session)):
+    return FastJSONResponse(await get_tags(session, user.id))
+
+# Полнотекстовый поиск
+@router.get("/todos/search", response_model=ToDoSearchPage)
+async def api_search_todos(
+    q: str = Query(..., max_length=200),
+    page: int = Query(1, ge=1),
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    return FastJSONResponse(await search_todos(session, user.id, q, page=page))
+
+# Счётчики задач: всего и выполнено (без подсчёта строк todos)
+@router.get("/todos/stats", response_model=ToDoStats)
+async def api_todo_stats(user: UserRead = Depends(require_user), session: AsyncSession = Depends(get_read_session)):
+    return FastJSONResponse(await get_todo_stats(session, user.id))
+
+# Архив выполненных задач с курсорной пагинацией
+@router.get("/todos/archived", response_model=ArchivedToDoPage)
+async def api_list_archived_todos(
+    after: int | None = None,
+    before: int | None = None,
+    limit: int = Query(settings.TODOS_PAGE_SIZE, ge=1, le=settings.TODOS_MAX_PAGE_SIZE),
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    return FastJSONResponse(await get_archived_todos_page(session, user.id, after=after, before=before, limit=limit))
+
+# Экспорт всех задач потоком NDJSON или CSV. Сессия открывается внутри генератора:
+# тело ответа отдаётся уже после выхода из обработчика и закрытия зависимостей
+@router.get("/todos/export", response_class=StreamingResponse)
+async def api_export_todos(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_archived: bool = False,
+    user: UserRead = Depends(require_user),
+    shard: Shard = Depends(get_user_shard),
+):
+    async def partitions():
+        async with shard.read_session() as session:
+            async for rows in stream_todos(session, user.id, include_archived=include_archived):
+                yield rows
+
+    encode = encode_csv if format == "csv" else encode_ndjson
+    return StreamingResponse(
+        encode(partitions()),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="todos.{format}"'},
+    )
+
+# Импорт задач из NDJSON или CSV: файл в multipart-поле file либо сырое тело запроса.
+# Строки разбираются по мере чтения и пишутся пачками; ответ — итог с ошибками по строкам
+@router.post("/todos/import", response_model=ToDoImportResult)
+async def api_import_todos(
+    request: Request,
+    format: str | None = Query(None, pattern="^(ndjson|csv)$"),
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session),
+):
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=422, detail="File field is required")
+        file_format = detect_format(format, upload.filename, upload.content_type)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            while chunk := await upload.read(64 * 1024):
+                yield chunk
+    else:
+        file_format = detect_format(format, content_type=content_type)
+        chunks = request.stream
+    if file_format is None:
+        raise HTTPException(status_code=415, detail="Unsupported import format, expected ndjson or csv")
+
+    parse = parse_csv if file_format == "csv" else parse_ndjson
+    try:
+        summary = await import_todos(session, user.id, parse(iter_lines(chunks())))
+    except ImportLineTooLongError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    finally:
+        # Пачки, записанные до обрыва загрузки, тоже должны попасть на страницу
+        render_cache.invalidate_user(user.id)
+        publish_todo_reload(user.id)
+        reminders_for(session).request_resync()
+    return FastJSONResponse(summary)
+
+# Одна задача
+@router.get("/todos/{todo_id}", response_model=ToDoRead)
+async def api_get_todo(
+    todo_id: int,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    todo = await get_todo(session, todo_id, user_id=user.id)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="ToDo not found")
+    return FastJSONResponse(todo)
+
+# Создание задачи
+@router.post("/todos", response_model=ToDoRead, status_code=201)
+async def api_create_todo(
+    payload: ToDoCreate,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session),
+):
+    todo = await create_todo(session, payload, user_id=user.id)
+    render_cache.invalidate_user(user.id)
+    reminders_for(session).notify(todo.id, todo.remind_at)
+    await publish_todo_event(user.id, "todo-created", todo)
+    return FastJSONResponse(todo, status_code=201)
+
+# Частичное обновление задачи
+@router.patch("/todos/{todo_id}", response_model=ToDoRead)
+async def api_update_todo(
+    todo_id: int,
+    payload: ToDoUpdate,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session),
+):
+    todo = await update_todo(session, todo_id, payload, user_id=user.id)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="ToDo not found")
+    render_cache.invalidate_user(user.id)
+    reminders_for(session).notify(todo.id, todo.remind_at)
+    await publish_todo_event(user.id, "todo-updated", todo)
+    return FastJSONResponse(todo)
+
+# Удаление задачи
+@router.delete("/todos/{todo_id}", status_code=204)
+async def api_delete_todo(
+    todo_id: int,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session),
+):
+    if not await delete_todo(session, todo_id, user_id=user.id):
+        raise HTTPException(status_code=404, detail="ToDo not found")
+    render_cache.invalidate_user(user.id)
+    reminders_for(session).notify(todo_id, None)
+    await publish_todo_event(user.id, "todo-deleted", todo_id=todo_id)
+    return Response(status_code=204)
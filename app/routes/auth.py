@@ -2,18 +2,23 @@ import datetime
 from datetime import UTC
 import secrets
 
-from fastapi import APIRouter, Request, Form, Depends
+from fastapi import APIRouter, Request, Form
 from fastapi.responses import HTMLResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-
 from app.utils.templates import templates
-from app.database.db import get_session
-from app.database.models import User
-from app.utils.security import get_password_hash
-from app.utils.email import send_email
-from app.core.config import settings
-from app.database.crud.user import create_password_reset_token, get_password_reset_token, delete_password_reset_token
+from app.database.db import Shard, shards
+from app.database.models import PasswordResetToken
+from app.database.sharding import shard_router
+from app.utils.security import hasher, HashingUnavailableError
+from app.utils.outbox import outbox_worker
+from app.utils.session import user_cache
+from app.database.crud.outbox import enqueue_email
+from app.database.crud.user import (
+    create_password_reset_token,
+    get_password_reset_token,
+    consume_password_reset_token,
+    delete_expired_password_reset_tokens,
+    reset_user_password,
+)
 
 
 router = APIRouter()
@@ -38,46 +43,56 @@ async def recovery_page(request: Request):
 async def recovery_post(
     request: Request,
     email: str = Form(...),
-    session: AsyncSession = Depends(get_session),
 ):
-    result = await session.execute(select(User).where(User.email == email))
-    user = result.scalar_one_or_none()
-    if not user:
+    # Токен и письмо пишутся в шард пользователя
+    found = await shard_router.find(email=email)
+    if not found:
         return templates.TemplateResponse(
             request,
             "auth/recovery.html",
             {"error": "Пользователь с таким email не найден"},
         )
-    # Генерируем токен и сохраняем его
-    token = secrets.token_urlsafe(32)
-    expires_at = datetime.datetime.now(UTC) + datetime.timedelta(hours=1)
-    await create_password_reset_token(session, user.id, token, expires_at)
-    # Формируем ссылку для сброса пароля динамически
-    base_url = str(request.base_url).rstrip('/')
-    reset_link = f"{base_url}/auth/reset-password?token={token}"
-    # Отправляем ссылку на email
-    try:
-        send_email(
+    user_id, shard = found
+    # Чистка, токен и письмо — одна транзакция: токен без письма в очереди не сохранится
+    async with shard.request_session() as session:
+        # Попутно удаляем просроченные токены, чтобы таблица не росла
+        now = datetime.datetime.now(UTC)
+        await delete_expired_password_reset_tokens(session, now, commit=False)
+        # Генерируем токен и сохраняем его
+        token = secrets.token_urlsafe(32)
+        expires_at = now + datetime.timedelta(hours=1)
+        await create_password_reset_token(session, user_id, token, expires_at, commit=False)
+        # Формируем ссылку для сброса пароля динамически
+        base_url = str(request.base_url).rstrip('/')
+        reset_link = f"{base_url}/auth/reset-password?token={token}"
+        # Ставим письмо в очередь — его доставит фоновый воркер
+        await enqueue_email(
+            session,
             to_email=email,
             subject="Восстановление пароля ToDoList",
             body=f"Для сброса пароля перейдите по ссылке: {reset_link}",
-            smtp_server=settings.SMTP_SERVER,
-            smtp_port=settings.SMTP_PORT,
-            smtp_user=settings.SMTP_USER,
-            smtp_password=settings.SMTP_PASSWORD,
-        )
-        return templates.TemplateResponse(
-            request, "auth/recovery.html", {"success": "Ссылка для сброса пароля отправлена на ваш email."}
-        )
-    except Exception as e:
-        return templates.TemplateResponse(
-            request, "auth/recovery.html", {"error": f"Ошибка отправки email: {e}"}
+            commit=False,
         )
+        await session.commit()
+    outbox_worker.notify()
+    return templates.TemplateResponse(
+        request, "auth/recovery.html", {"success": "Ссылка для сброса пароля отправлена на ваш email."}
+    )
+
+# Токен сброса пароля и его шард. Ссылка не несёт номер шарда, поэтому токен ищется
+# во всех шардах — по уникальному индексу, сброс пароля редок
+async def find_password_reset_token(token: str) -> tuple[PasswordResetToken | None, Shard | None]:
+    for shard in shards:
+        async with shard.read_session() as session:
+            reset_token = await get_password_reset_token(session, token)
+        if reset_token is not None:
+            return reset_token, shard
+    return None, None
 
 # Сброс пароля
 @router.get("/reset-password", response_class=HTMLResponse)
-async def reset_password_get(request: Request, token: str, session: AsyncSession = Depends(get_session)):
-    reset_token = await get_password_reset_token(session, token)
+async def reset_password_get(request: Request, token: str):
+    reset_token, _ = await find_password_reset_token(token)
     now = datetime.datetime.now(UTC)
     if not reset_token or to_utc_aware(reset_token.expires_at) < now:
         return templates.TemplateResponse(request, "auth/reset_password.html", {"error": "Ссылка недействительна или истекла."})
@@ -90,23 +105,32 @@ async def reset_password_post(
     token: str = Form(...),
     password: str = Form(...),
     confirm_password: str = Form(...),
-    session: AsyncSession = Depends(get_session),
 ):
-    reset_token = await get_password_reset_token(session, token)
+    # Проверки — через читателя, чтобы не держать соединение писателя во время хэширования
+    reset_token, shard = await find_password_reset_token(token)
     now = datetime.datetime.now(UTC)
     if not reset_token or to_utc_aware(reset_token.expires_at) < now:
         return templates.TemplateResponse(request, "auth/reset_password.html", {"error": "Ссылка недействительна или истекла."})
     if password != confirm_password:
         return templates.TemplateResponse(request, "auth/reset_password.html", {"error": "Пароли не совпадают.", "token": token})
-    # Обновляем пароль пользователя
-    result = await session.execute(select(User).where(User.id == reset_token.user_id))
-    user = result.scalar_one_or_none()
-    if not user:
-        return templates.TemplateResponse(request, "auth/reset_password.html", {"error": "Пользователь не найден."})
-    user.hashed_password = get_password_hash(password)
-    session.add(user)
-    await delete_password_reset_token(session, token)
-    await session.commit()
+    try:
+        hashed_password = await hasher.hash(password)
+    except HashingUnavailableError:
+        return templates.TemplateResponse(
+            request, "auth/reset_password.html", {"error": "Сервер перегружен, попробуйте позже.", "token": token}, status_code=503
+        )
+    # Токен гасится условным DELETE, и пароль меняется в той же транзакции: одним токеном
+    # сбрасывают пароль один раз, а сессии со старым паролем завершаются (новая версия сессий)
+    async with shard.request_session() as session:
+        user_id = await consume_password_reset_token(session, token, datetime.datetime.now(UTC))
+        if user_id is None:
+            await session.rollback()
+            return templates.TemplateResponse(request, "auth/reset_password.html", {"error": "Ссылка недействительна или истекла."})
+        if not await reset_user_password(session, user_id, hashed_password, commit=False):
+            await session.rollback()
+            return templates.TemplateResponse(request, "auth/reset_password.html", {"error": "Пользователь не найден."})
+        await session.commit()
+    user_cache.invalidate(user_id)
     return templates.TemplateResponse(request, "auth/reset_password.html", {"success": "Пароль успешно изменён. Теперь вы можете войти."})
 
 # Утилита для приведения времени к UTC с учётом часового пояса
@@ -0,0 +1,103 @@
+import secrets
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.database.db import shards
+from app.database.sharding import shard_router
+from app.utils.events import todo_events
+from app.utils.concurrency import concurrency_limiters
+from app.utils.metrics import registry
+from app.utils.reminders import reminder_schedulers
+from app.utils.security import hasher
+from app.utils.render_cache import render_cache
+from app.utils.rate_limit import rate_limit_backend
+from app.utils.session import user_cache
+
+
+router = APIRouter()
+
+
+def _sum_stats(stats) -> dict:
+    total = {}
+    for item in stats:
+        for key, value in item.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+# Состояние пула хэширования, кэшей и ограничителей — снимается в момент опроса
+def _component_stats():
+    hashing = hasher.stats()
+    yield "password_hash_pending", "gauge", "bcrypt jobs queued or running", {(): hashing["pending"]}
+    yield "password_hash_rejected_total", "counter", "bcrypt jobs rejected (queue full or timeout)", {(): hashing["rejected"]}
+    cache = render_cache.stats()
+    yield "render_cache_entries", "gauge", "Cached todo list fragments", {(): cache["entries"]}
+    yield "render_cache_bytes", "gauge", "Memory used by cached fragments", {(): cache["bytes"]}
+    yield "render_cache_lookups_total", "counter", "Render cache lookups", {
+        (("result", "hit"),): cache["hits"],
+        (("result", "miss"),): cache["misses"],
+    }
+    yield "user_cache_lookups_total", "counter", "Session user cache lookups", {
+        (("result", "hit"),): user_cache.hits,
+        (("result", "miss"),): user_cache.misses,
+    }
+    # Групповая фиксация и напоминания работают в каждом шарде — отдаются суммой
+    group_commit = _sum_stats(shard.coordinator.stats() for shard in shards)
+    yield "db_group_commit_batches_total", "counter", "Write transactions committed by the group commit writer", {
+        (("result", "ok"),): group_commit["batches"] - group_commit["failed_batches"],
+        (("result", "failed"),): group_commit["failed_batches"],
+    }
+    yield "db_group_commit_sessions_total", "counter", "Request sessions served by the group commit writer", {(): group_commit["jobs"]}
+    events = todo_events.stats()
+    yield "sse_subscribers", "gauge", "Open live update streams", {(): events["subscribers"]}
+    yield "sse_events_total", "counter", "Live update events by outcome", {
+        (("result", "published"),): events["published"],
+        (("result", "dropped"),): events["dropped"],
+    }
+    yield "sse_rejected_total", "counter", "Live update connections over the per-user limit", {(): events["rejected"]}
+    reminders = _sum_stats(scheduler.stats() for scheduler in reminder_schedulers)
+    yield "reminders_scheduled", "gauge", "Reminders held in the scheduler window", {(): reminders["scheduled"]}
+    yield "reminders_fired_total", "counter", "Reminders that came due", {(): reminders["fired"]}
+    yield "reminder_emails_total", "counter", "Reminder emails queued", {(): reminders["emails"]}
+    routing = shard_router.stats()
+    yield "db_shards", "gauge", "Database shards", {(): routing["shards"]}
+    yield "shard_directory_lookups_total", "counter", "User to shard lookups", {
+        (("result", "hit"),): routing["hits"],
+        (("result", "miss"),): routing["misses"],
+    }
+    yield "rate_limit_decisions_total", "counter", "Rate limiter decisions", {
+        (("result", "allowed"),): rate_limit_backend.allowed,
+        (("result", "rejected"),): rate_limit_backend.rejected,
+    }
+    limiters = {name: limiter.stats() for name, limiter in concurrency_limiters.items()}
+    yield "concurrency_limit", "gauge", "Adaptive in-flight request limit by route class", {
+        (("class", name),): stats["limit"] for name, stats in limiters.items()
+    }
+    yield "concurrency_in_flight", "gauge", "Requests in flight by route class", {
+        (("class", name),): stats["in_flight"] for name, stats in limiters.items()
+    }
+    yield "concurrency_queued", "gauge", "Requests waiting for a slot by route class", {
+        (("class", name),): stats["queued"] for name, stats in limiters.items()
+    }
+    yield "concurrency_decisions_total", "counter", "Concurrency limiter decisions", {
+        (("class", name), ("result", result)): stats[result]
+        for name, stats in limiters.items()
+        for result in ("admitted", "rejected")
+    }
+
+
+registry.add_collector(_component_stats)
+
+
+# Метрики в текстовом формате Prometheus — только по METRICS_TOKEN: в них маршруты, SQL-нагрузка и
+# состояние кэшей, которые не стоит показывать любому посетителю
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(request: Request):
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
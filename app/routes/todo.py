@@ -1,26 +1,168 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Form
-from fastapi.responses import RedirectResponse
-from sqlalchemy import select
+import datetime
+from typing import Literal
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Form, Query
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from markupsafe import Markup
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.db import get_session
-from app.database.models import ToDo, User
+from app.core.config import settings
+from app.database.crud.todo import (
+    get_todos_page,
+    get_tags,
+    get_todo_stats,
+    get_archived_todos_page,
+    search_todos,
+    create_todo,
+    update_todo,
+    delete_todo,
+    create_todos,
+    set_todos_completed,
+    delete_todos,
+    delete_completed_todos,
+)
+from app.schemas.todo import TagList, ToDoCreate, ToDoUpdate, ToDoFilter, ToDoBulkCreate, ToDoBulkIds, ToDoBulkResult
+from app.schemas.user import UserRead
+from app.utils.session import get_current_user, get_read_session, get_session, require_user
+from app.utils.etag import etag_matches, make_etag, template_fingerprint
+from app.utils.events import publish_todo_event, publish_todo_reload, todo_events
+from app.utils.reminders import reminders_for
+from app.utils.render_cache import render_cache, render_fragment
 from app.utils.templates import templates
 
 router = APIRouter()
 
-# Показ всех задач
+_INDEX_FINGERPRINT = template_fingerprint("index.html", "partials/todo_list.html", "partials/todo_item.html")
+
+# Ответ формы: страница со скриптом отправляет формы через fetch и получает изменения
+# по SSE — ей хватает 204; обычная отправка формы по-прежнему получает редирект на список
+def _form_done(request: Request) -> Response:
+    if request.headers.get("x-requested-with") == "fetch":
+        return Response(status_code=204)
+    return RedirectResponse(url="/todos/html", status_code=303)
+
+# Дата из поля datetime-local (UTC); пустое поле — None
+def _form_datetime(value: str) -> datetime.datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid date")
+
+# Фильтр выполненности в адресе страницы
+_STATUS_FILTERS = {"all": None, "open": False, "done": True}
+
+# Теги из поля формы через запятую; неверные (слишком длинные, слишком много) — 422
+_TAG_LIST = TypeAdapter(TagList)
+
+def _form_tags(value: str) -> list[str]:
+    try:
+        return _TAG_LIST.validate_python(value)
+    except ValidationError:
+        raise HTTPException(status_code=422, detail="Invalid tags")
+
+# Показ задач постранично: фильтр по выполненности и тегу, сортировка
 @router.get("/html")
-async def todos_html(request: Request, session: AsyncSession = Depends(get_session)):
-    user_id = request.cookies.get("user_id")
-    user = None
-    todos = []
-    if user_id:
-        user = await session.get(User, int(user_id))
-        if user:
-            result = await session.execute(select(ToDo).where(ToDo.user_id == user.id))
-            todos = result.scalars().all()
-    return templates.TemplateResponse(request, "index.html", {"user": user, "todos": todos})
+async def todos_html(
+    request: Request,
+    after: str | None = None,
+    before: str | None = None,
+    limit: int = Query(settings.TODOS_PAGE_SIZE, ge=1, le=settings.TODOS_MAX_PAGE_SIZE),
+    status: Literal["all", "open", "done"] = "all",
+    tag: str = Query("", max_length=settings.TAG_MAX_LENGTH),
+    sort: Literal["created", "updated", "title"] = "created",
+    order: Literal["asc", "desc"] = "asc",
+    user: UserRead | None = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    if not user:
+        return templates.TemplateResponse(request, "index.html", {"user": None, "todos": [], "page": None, "limit": limit})
+    view = {"status": status, "tag": tag, "sort": sort, "order": order}
+    # Параметры вида, отличные от умолчаний, — для ссылок пагинации
+    view_query = urlencode({name: value for name, value in view.items() if value not in ("all", "", "created", "asc")})
+    # ETag из версии списка задач: если у клиента актуальная копия — 304 без выборки задач и рендера.
+    # Счётчики приходят тем же запросом и меняются только вместе с версией
+    stats = await get_todo_stats(session, user.id)
+    version = stats.version
+    etag = make_etag(user.id, user.username, version, after, before, limit, view_query, _INDEX_FINGERPRINT)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # Отрендеренный список берём из кэша по версии данных — без выборки задач и рендера
+    key = (user.id, version, after, before, limit, view_query)
+    todo_list_html = render_cache.get(key)
+    if todo_list_html is None:
+        filters = ToDoFilter(completed=_STATUS_FILTERS[status], tags=tag, sort=sort, descending=order == "desc")
+        try:
+            page = await get_todos_page(session, user.id, after=after, before=before, limit=limit, filters=filters)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid cursor")
+        todo_list_html, render_time = render_fragment(
+            templates.env,
+            "partials/todo_list.html",
+            {"todos": page.items, "page": page, "limit": limit, "view_query": view_query},
+        )
+        render_cache.put(user.id, key, todo_list_html, render_time)
+    return templates.TemplateResponse(
+        request,
+        "index.html",
+        {
+            "user": user,
+            "todo_list_html": Markup(todo_list_html),
+            "stats": stats,
+            "view": view,
+            "tags": await get_tags(session, user.id),
+        },
+        headers=headers,
+    )
+
+# Полнотекстовый поиск по задачам
+@router.get("/search")
+async def search_todos_html(
+    request: Request,
+    q: str = Query("", max_length=200),
+    page: int = Query(1, ge=1),
+    user: UserRead | None = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    if not user:
+        return RedirectResponse(url="/auth/login.html", status_code=303)
+    results = await search_todos(session, user.id, q, page=page)
+    return templates.TemplateResponse(
+        request,
+        "index.html",
+        {"user": user, "todos": results.items, "search": results},
+    )
+
+# Архив выполненных задач, постранично
+@router.get("/archived")
+async def archived_todos_html(
+    request: Request,
+    after: int | None = None,
+    before: int | None = None,
+    limit: int = Query(settings.TODOS_PAGE_SIZE, ge=1, le=settings.TODOS_MAX_PAGE_SIZE),
+    user: UserRead | None = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    if not user:
+        return RedirectResponse(url="/auth/login.html", status_code=303)
+    archived = await get_archived_todos_page(session, user.id, after=after, before=before, limit=limit)
+    return templates.TemplateResponse(request, "index.html", {"user": user, "archived": archived, "limit": limit})
+
+# Поток живых обновлений списка задач (Server-Sent Events)
+@router.get("/events")
+async def todo_events_stream(user: UserRead = Depends(require_user)):
+    subscription = todo_events.subscribe(user.id)
+    if subscription is None:
+        raise HTTPException(status_code=429, detail="Too many live update connections")
+    return StreamingResponse(
+        todo_events.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Создание задачи через форму
 @router.post("/create")
@@ -28,46 +170,145 @@ async def create_todo_html(
     request: Request,
     title: str = Form(...),
     description: str = Form(""),
+    due_at: str = Form(""),
+    remind_at: str = Form(""),
+    tags: str = Form(""),
+    user: UserRead | None = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
+    if not user:
         return RedirectResponse(url="/auth/login.html", status_code=303)
-    new_todo = ToDo(title=title, description=description, user_id=int(user_id))
-    session.add(new_todo)
-    await session.commit()
-    return RedirectResponse(url="/todos/html", status_code=303)
+    todo = await create_todo(
+        session,
+        ToDoCreate(
+            title=title,
+            description=description,
+            due_at=_form_datetime(due_at),
+            remind_at=_form_datetime(remind_at),
+            tags=_form_tags(tags),
+        ),
+        user_id=user.id,
+    )
+    render_cache.invalidate_user(user.id)
+    reminders_for(session).notify(todo.id, todo.remind_at)
+    await publish_todo_event(user.id, "todo-created", todo)
+    return _form_done(request)
 
 # Обновление задачи через форму
 @router.post("/update/{todo_id}")
 async def update_todo_html(
+    request: Request,
     todo_id: int,
     title: str = Form(...),
     description: str = Form(""),
     completed: str = Form(None),
+    due_at: str = Form(""),
+    remind_at: str = Form(""),
+    tags: str = Form(""),
+    user: UserRead | None = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    result = await session.execute(select(ToDo).where(ToDo.id == todo_id))
-    todo = result.scalar_one_or_none()
+    if not user:
+        return RedirectResponse(url="/auth/login.html", status_code=303)
+    todo = await update_todo(
+        session,
+        todo_id,
+        ToDoUpdate(
+            title=title,
+            description=description,
+            completed=completed == "true",
+            due_at=_form_datetime(due_at),
+            remind_at=_form_datetime(remind_at),
+            tags=_form_tags(tags),
+        ),
+        user_id=user.id,
+    )
     if not todo:
         raise HTTPException(status_code=404, detail="ToDo not found")
-    todo.title = title
-    todo.description = description
-    todo.completed = completed == "true"
-    session.add(todo)
-    await session.commit()
-    return RedirectResponse(url="/todos/html", status_code=303)
+    render_cache.invalidate_user(user.id)
+    # Новое время напоминания сразу попадает в планировщик, без ожидания пересинхронизации
+    reminders_for(session).notify(todo.id, todo.remind_at)
+    await publish_todo_event(user.id, "todo-updated", todo)
+    return _form_done(request)
 
 # Удаление задачи через форму
 @router.post("/delete/{todo_id}")
 async def delete_todo_html(
+    request: Request,
     todo_id: int,
+    user: UserRead | None = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    result = await session.execute(select(ToDo).where(ToDo.id == todo_id))
-    todo = result.scalar_one_or_none()
-    if not todo:
+    if not user:
+        return RedirectResponse(url="/auth/login.html", status_code=303)
+    if not await delete_todo(session, todo_id, user_id=user.id):
         raise HTTPException(status_code=404, detail="ToDo not found")
-    await session.delete(todo)
-    await session.commit()
-    return RedirectResponse(url="/todos/html", status_code=303)
+    render_cache.invalidate_user(user.id)
+    reminders_for(session).notify(todo_id, None)
+    await publish_todo_event(user.id, "todo-deleted", todo_id=todo_id)
+    return _form_done(request)
+
+# Удаление всех завершённых задач через форму
+@router.post("/delete-completed")
+async def delete_completed_html(
+    request: Request,
+    user: UserRead | None = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    if not user:
+        return RedirectResponse(url="/auth/login.html", status_code=303)
+    await delete_completed_todos(session, user.id)
+    render_cache.invalidate_user(user.id)
+    publish_todo_reload(user.id)
+    return _form_done(request)
+
+
+# Пакетное создание задач (JSON); каждая пакетная операция — один SQL-запрос и одна транзакция
+@router.post("/bulk/create", response_model=ToDoBulkResult)
+async def bulk_create(
+    payload: ToDoBulkCreate,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    ids = await create_todos(session, user.id, payload.items)
+    render_cache.invalidate_user(user.id)
+    if any(item.remind_at for item in payload.items):
+        reminders_for(session).request_resync()
+    publish_todo_reload(user.id)
+    return ToDoBulkResult(count=len(ids), ids=ids)
+
+# Пакетная отметка задач завершёнными
+@router.post("/bulk/complete", response_model=ToDoBulkResult)
+async def bulk_complete(
+    payload: ToDoBulkIds,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    count = await set_todos_completed(session, user.id, payload.ids)
+    render_cache.invalidate_user(user.id)
+    publish_todo_reload(user.id)
+    return ToDoBulkResult(count=count)
+
+# Пакетное удаление задач
+@router.post("/bulk/delete", response_model=ToDoBulkResult)
+async def bulk_delete(
+    payload: ToDoBulkIds,
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    count = await delete_todos(session, user.id, payload.ids)
+    render_cache.invalidate_user(user.id)
+    publish_todo_reload(user.id)
+    return ToDoBulkResult(count=count)
+
+# Удаление всех завершённых задач
+@router.post("/bulk/delete-completed", response_model=ToDoBulkResult)
+async def bulk_delete_completed(
+    user: UserRead = Depends(require_user),
+    session: AsyncSession = Depends(get_session)
+):
+    count = await delete_completed_todos(session, user.id)
+    render_cache.invalidate_user(user.id)
+    publish_todo_reload(user.id)
+    return ToDoBulkResult(count=count)
+
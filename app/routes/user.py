@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, Request, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, Request, Form
 from fastapi.responses import RedirectResponse
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 
-from app.database.db import get_session
 from app.database.models import User
+from app.database.sharding import shard_router
+from app.database.crud.user import bump_session_version, register_user, update_password_hash
+from app.schemas.user import UserCreate, UserRead
 from app.utils.templates import templates
-from app.utils.security import get_password_hash, verify_password
+from app.utils.security import hasher, HashingUnavailableError
+from app.utils.session import SESSION_COOKIE, get_current_user, set_session_cookie
 
 
 
@@ -29,36 +32,33 @@ async def register_post(
     email: str = Form(...),
     password: str = Form(...),
     confirm_password: str = Form(...),
-    session: AsyncSession = Depends(get_session)
 ):
     # Проверка совпадения паролей
     if password != confirm_password:
         return templates.TemplateResponse(request, "auth/register.html", {"error": "Пароли не совпадают"})
-    # Проверка уникальности email и username (раздельно)
-    result_email = await session.execute(select(User).where(User.email == email))
-    result_username = await session.execute(select(User).where(User.username == username))
-    existing_email = result_email.scalar_one_or_none()
-    existing_username = result_username.scalar_one_or_none()
+    # Проверка уникальности email и username (раздельно) по каталогу всех шардов
+    existing_email = await shard_router.find(email=email)
+    existing_username = await shard_router.find(username=username)
     if existing_email and existing_username:
         return templates.TemplateResponse(request, "auth/register.html", {"error": "Пользователь с таким email и именем уже существует"})
     elif existing_email:
         return templates.TemplateResponse(request, "auth/register.html", {"error": "Email уже используется"})
     elif existing_username:
         return templates.TemplateResponse(request, "auth/register.html", {"error": "Имя пользователя уже используется"})
-    # Хеширование пароля
-    hashed_password = get_password_hash(password)
-
-    # Создание пользователя
-    new_user = User(
-        first_name=first_name,
-        last_name=last_name,
-        username=username,
-        email=email,
-        hashed_password=hashed_password
-    )
-    session.add(new_user)
-    await session.commit()
-    await session.refresh(new_user)
+    # Создание пользователя в его шарде (пароль хэшируется в пуле процессов)
+    try:
+        await register_user(
+            UserCreate(username=username, email=email, password=password),
+            first_name=first_name,
+            last_name=last_name,
+        )
+    except HashingUnavailableError:
+        return templates.TemplateResponse(
+            request, "auth/register.html", {"error": "Сервер перегружен, попробуйте позже"}, status_code=503
+        )
+    except IntegrityError:
+        # Имя или email заняли между проверкой и записью
+        return templates.TemplateResponse(request, "auth/register.html", {"error": "Пользователь с таким email или именем уже существует"})
     return RedirectResponse(url="/auth/login.html", status_code=303)
 
 
@@ -73,28 +73,64 @@ async def login_get(request: Request):
 @router.post("/login")
 async def login_post(
     request: Request,
+    background_tasks: BackgroundTasks,
     username: str = Form(...),
     password: str = Form(...),
     remember: str = Form(None),
-    session: AsyncSession = Depends(get_session)
 ):
-    result = await session.execute(select(User).where(User.username == username))
-    user = result.scalar_one_or_none()
-    if not user or not verify_password(password, user.hashed_password):
+    # Шард пользователя — по каталогу
+    user = None
+    found = await shard_router.find(username=username)
+    if found is not None:
+        user_id, shard = found
+        async with shard.read_session() as session:
+            result = await session.execute(select(User).where(User.id == user_id))
+            user = result.scalar_one_or_none()
+    valid, needs_rehash = False, False
+    if user:
+        try:
+            valid, needs_rehash = await hasher.verify_and_check(password, user.hashed_password)
+        except HashingUnavailableError:
+            return templates.TemplateResponse(
+                request, "auth/login.html", {"error": "Сервер перегружен, попробуйте позже"}, status_code=503
+            )
+    if not valid:
         return templates.TemplateResponse(
             "auth/login.html",
             {"request": request, "error": "Неверное имя пользователя или пароль"}
         )
+    # Устаревший хэш обновляем уже после отправки ответа
+    if needs_rehash:
+        background_tasks.add_task(rehash_password, user.id, user.hashed_password, password)
     redirect = RedirectResponse(url="/todos/html", status_code=303)
-    if remember:
-        redirect.set_cookie("user_id", str(user.id), httponly=True, max_age=60*60*24*30)  # 30 дней
-    else:
-        redirect.set_cookie("user_id", str(user.id), httponly=True)
+    # Подписанный токен с ограниченным сроком (30 дней с "Запомнить меня")
+    set_session_cookie(redirect, user.id, remember=bool(remember), version=user.session_version)
     return redirect
 
 # Логаут пользователя
 @router.post("/logout")
 async def logout_post(request: Request):
     redirect = RedirectResponse(url="/auth/login.html", status_code=303)
-    redirect.delete_cookie("user_id")
+    redirect.delete_cookie(SESSION_COOKIE)
     return redirect
+
+# Выход на всех устройствах: новая версия сессий делает недействительными все выпущенные токены
+@router.post("/logout-all")
+async def logout_all_post(user: UserRead | None = Depends(get_current_user)):
+    if user is not None:
+        shard = await shard_router.shard_for_user(user.id)
+        async with shard.session() as session:
+            await bump_session_version(session, user.id)
+    redirect = RedirectResponse(url="/auth/login.html", status_code=303)
+    redirect.delete_cookie(SESSION_COOKIE)
+    return redirect
+
+# Перехэширование пароля с актуальными параметрами (фоновая задача после входа)
+async def rehash_password(user_id: int, old_hash: str, password: str):
+    try:
+        new_hash = await hasher.hash(password)
+    except HashingUnavailableError:
+        return
+    shard = await shard_router.shard_for_user(user_id)
+    async with shard.session() as session:
+        await update_password_hash(session, user_id, old_hash, new_hash)
@@ -1,4 +1,35 @@
-from pydantic import BaseModel, ConfigDict
+import datetime
+from dataclasses import dataclass, field
+from typing import Annotated, Literal
+
+from pydantic import AfterValidator, BaseModel, BeforeValidator, ConfigDict, Field
+
+from app.core.config import settings
+
+
+# Время хранится в UTC без часового пояса, как его пишут триггеры (datetime('now')).
+# Время с поясом переводится в UTC, без пояса — считается уже заданным в UTC
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.UTC).replace(tzinfo=None)
+    return value
+
+
+UtcDateTime = Annotated[datetime.datetime, AfterValidator(_as_utc)]
+
+
+# Теги задачи: список или строка через запятую (формы, CSV). Пробелы по краям и пустые
+# имена отбрасываются, повторы схлопываются с сохранением порядка
+def _split_tags(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, list):
+        value = list(dict.fromkeys(name.strip() for name in value if isinstance(name, str) and name.strip()))
+    return value
+
+
+TagName = Annotated[str, Field(min_length=1, max_length=settings.TAG_MAX_LENGTH, pattern=r"^[^,]+$")]
+TagList = Annotated[list[TagName], BeforeValidator(_split_tags), Field(max_length=settings.TODO_TAGS_MAX)]
 
 
 # Базовая модель задачи
@@ -6,11 +37,13 @@ class ToDoBase(BaseModel):
     title: str
     description: str | None = None
     completed: bool = False
+    due_at: UtcDateTime | None = None
+    remind_at: UtcDateTime | None = None
 
 
 # Создание задачи - все поля обязательны, кроме description
 class ToDoCreate(ToDoBase):
-    pass
+    tags: TagList = []
 
 
 # Обновление задачи - все поля необязательны
@@ -18,9 +51,129 @@ class ToDoUpdate(BaseModel):
     title: str | None = None
     description: str | None = None
     completed: bool | None = None
+    due_at: UtcDateTime | None = None
+    remind_at: UtcDateTime | None = None
+    # Новый набор тегов целиком (None — теги не меняются)
+    tags: TagList | None = None
 
 
 # Чтение задачи - включает id и использует ORM режим
 class ToDoRead(ToDoBase):
     id: int
+    tags: list[str] = []
     model_config = ConfigDict(from_attributes=True)
+
+
+# Строка задачи для чтения списков (страницы, поиск, полный список): dataclass со __slots__
+# создаётся прямо из кортежа строки результата, без промежуточного словаря, валидации pydantic
+# и словаря атрибутов у каждого объекта. Поля — как у ToDoRead, в порядке колонок запроса;
+# шаблоны читают те же атрибуты, FastJSONResponse сериализует в тот же JSON
+@dataclass(slots=True)
+class ToDoRow:
+    id: int
+    title: str
+    description: str | None
+    completed: bool
+    due_at: datetime.datetime | None
+    remind_at: datetime.datetime | None
+    tags: list[str] = field(default_factory=list)
+
+
+# Фильтр и порядок списка задач: выполненность (None — все), теги (задача должна иметь все),
+# сортировка по созданию, изменению или заголовку
+class ToDoFilter(BaseModel):
+    completed: bool | None = None
+    tags: Annotated[list[str], BeforeValidator(_split_tags)] = []
+    sort: Literal["created", "updated", "title"] = "created"
+    descending: bool = False
+
+
+# Страница задач для курсорной пагинации. Курсор сортировки по созданию — id задачи,
+# остальных сортировок — непрозрачная строка. Строки ToDoRow pydantic принимает как есть
+class ToDoPage(BaseModel):
+    items: list[ToDoRow]
+    next_cursor: int | str | None = None
+    prev_cursor: int | str | None = None
+
+
+# Тег пользователя с числом задач (всего и выполнено)
+class TagRead(BaseModel):
+    name: str
+    total: int = 0
+    completed: int = 0
+
+
+# Задача из архива — строка, как ToDoRow, в порядке колонок запроса архива
+# (напоминаний и тегов у архивных задач нет)
+@dataclass(slots=True)
+class ArchivedToDoRow:
+    id: int
+    title: str
+    description: str | None
+    completed: bool
+    due_at: datetime.datetime | None
+    completed_at: datetime.datetime | None
+    archived_at: datetime.datetime
+    remind_at: datetime.datetime | None = None
+    tags: list[str] = field(default_factory=list)
+
+
+# Страница архива, курсорная пагинация как у ToDoPage
+class ArchivedToDoPage(BaseModel):
+    items: list[ArchivedToDoRow]
+    next_cursor: int | None = None
+    prev_cursor: int | None = None
+
+
+# Страница результатов полнотекстового поиска (по номеру страницы — порядок задаёт ранг bm25)
+class ToDoSearchPage(BaseModel):
+    items: list[ToDoRow]
+    query: str
+    page: int = 1
+    has_next: bool = False
+
+
+# Счётчики задач пользователя; version меняется при любом изменении его задач
+class ToDoStats(BaseModel):
+    total: int = 0
+    completed: int = 0
+    version: int = 0
+
+
+# Расхождение счётчиков с фактическим числом задач
+class ToDoCounterDrift(BaseModel):
+    user_id: int
+    stored_total: int
+    stored_completed: int
+    actual_total: int
+    actual_completed: int
+
+
+# Ошибка в строке импортируемого файла
+class ToDoImportError(BaseModel):
+    line: int
+    error: str
+
+
+# Итог импорта: добавлено, отклонено, число записанных пачек; ошибки — первые IMPORT_MAX_ERRORS
+class ToDoImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    chunks: int = 0
+    errors: list[ToDoImportError] = []
+
+
+# Пакетное создание задач
+class ToDoBulkCreate(BaseModel):
+    items: list[ToDoCreate] = Field(min_length=1, max_length=settings.TODOS_BULK_MAX)
+
+
+# Пакетная операция над задачами по id
+class ToDoBulkIds(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=settings.TODOS_BULK_MAX)
+
+
+# Результат пакетной операции: число затронутых задач и (для создания) их id
+class ToDoBulkResult(BaseModel):
+    count: int
+    ids: list[int] = []
@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+
 from pydantic import BaseModel, ConfigDict
 
 
@@ -22,6 +24,14 @@ class UserRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+# Строка пользователя для чтения больших списков — как ToDoRow, поля UserRead
+@dataclass(slots=True)
+class UserRow:
+    id: int
+    username: str
+    email: str
+
+
 # Обновление пользователя - все поля необязательны
 class UserUpdate(BaseModel):
     username: str | None = None
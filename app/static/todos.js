@@ -0,0 +1,94 @@
+// Живое обновление списка задач: изменения приходят по SSE (/todos/events) и применяются
+// к отдельным строкам, формы отправляются через fetch без перезагрузки страницы.
+// Без JavaScript страница работает как раньше — формы получают редирект на список.
+(function () {
+    "use strict";
+
+    const list = document.querySelector(".todo-list");
+    if (!list || !window.EventSource || !window.fetch) {
+        return;
+    }
+    const source = new EventSource("/todos/events");
+
+    function parseRow(html) {
+        const template = document.createElement("template");
+        template.innerHTML = html.trim();
+        return template.content.firstElementChild;
+    }
+
+    function findRow(id) {
+        return list.querySelector('.todo-item[data-id="' + id + '"]');
+    }
+
+    function updateStats(stats) {
+        const block = document.querySelector(".todo-stats");
+        if (!block || !stats) {
+            return;
+        }
+        block.querySelector(".todo-stats-count").textContent =
+            "Выполнено " + stats.completed + " из " + stats.total;
+        block.hidden = stats.total === 0;
+    }
+
+    function on(event, handler) {
+        source.addEventListener(event, function (message) {
+            const data = JSON.parse(message.data);
+            handler(data);
+            updateStats(data.stats);
+        });
+    }
+
+    // Новая задача получает наибольший id, поэтому её место — в конце последней страницы.
+    // В списке с фильтром или другой сортировкой место новой задачи неизвестно — она появится после перехода
+    on("todo-created", function (data) {
+        if (findRow(data.id) || "filtered" in list.dataset || document.querySelector(".pagination .next")) {
+            return;
+        }
+        list.querySelectorAll("li:not([data-id])").forEach(function (placeholder) {
+            placeholder.remove();
+        });
+        list.appendChild(parseRow(data.html));
+    });
+
+    on("todo-updated", function (data) {
+        const row = findRow(data.id);
+        if (row) {
+            row.replaceWith(parseRow(data.html));
+        }
+    });
+
+    on("todo-deleted", function (data) {
+        const row = findRow(data.id);
+        if (row) {
+            row.remove();
+        }
+    });
+
+    // Пакетные изменения или переполненная очередь на сервере — перечитываем страницу
+    source.addEventListener("reload", function () {
+        window.location.reload();
+    });
+
+    document.querySelector(".todo-section").addEventListener("submit", function (event) {
+        const form = event.target;
+        if (form.method.toLowerCase() !== "post" || !new URL(form.action).pathname.startsWith("/todos/")) {
+            return;
+        }
+        event.preventDefault();
+        fetch(form.action, {
+            method: "POST",
+            body: new FormData(form),
+            headers: {"X-Requested-With": "fetch"},
+        }).then(function (response) {
+            if (response.redirected) {
+                window.location.href = response.url;
+            } else if (!response.ok || source.readyState !== EventSource.OPEN) {
+                window.location.reload();
+            } else if (form.classList.contains("todo-form")) {
+                form.reset();
+            }
+        }, function () {
+            form.submit();
+        });
+    });
+})();
@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+import logging
+from datetime import UTC
+
+from app.core.config import settings
+from app.database.db import shards
+from app.database.crud.todo import archive_completed_todos
+from app.utils.events import publish_todo_reload
+from app.utils.render_cache import render_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+# Фоновый перенос выполненных задач старше age_days из todos в todos_archive.
+# Работает пачками по batch_size в отдельных транзакциях, уступая соединение писателя
+# другим запросам между пачками; после прохода по всем шардам ждёт interval секунд.
+class TodoArchiver:
+    def __init__(
+        self,
+        session_factories=tuple(shard.session for shard in shards),
+        age_days: float = settings.ARCHIVE_AFTER_DAYS,
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+        interval: float = settings.ARCHIVE_INTERVAL,
+    ):
+        self.session_factories = session_factories
+        self.age = datetime.timedelta(days=age_days)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.archived = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                archived = await self.run_once()
+                if archived:
+                    logger.info("Archived %d completed todos", archived)
+            except Exception:
+                logger.exception("Todo archiving failed")
+            await asyncio.sleep(self.interval)
+
+    # Один проход по всем шардам: пачки до тех пор, пока находятся задачи старше порога.
+    # Возвращает число перенесённых
+    async def run_once(self) -> int:
+        cutoff = datetime.datetime.now(UTC) - self.age
+        total = 0
+        for session_factory in self.session_factories:
+            total += await self._archive_shard(session_factory, cutoff)
+        return total
+
+    async def _archive_shard(self, session_factory, cutoff: datetime.datetime) -> int:
+        total = 0
+        while True:
+            async with session_factory() as session:
+                count, user_ids = await archive_completed_todos(session, cutoff, self.batch_size)
+            # Версии списков уже сменились триггерами; старые фрагменты только занимают память
+            for user_id in user_ids:
+                render_cache.invalidate_user(user_id)
+                publish_todo_reload(user_id)
+            total += count
+            self.archived += count
+            if count < self.batch_size:
+                return total
+            await asyncio.sleep(0)
+
+
+archiver = TodoArchiver()
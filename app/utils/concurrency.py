@@ -0,0 +1,216 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.utils.rate_limit import default_rules
+
+
+# Адаптивное ограничение одновременных запросов (load shedding). У каждого класса маршрутов
+# (вход и регистрация, чтение, запись) свой лимит запросов в работе и своя ограниченная очередь
+# ожидания: перегруженный bcrypt на /users/login не занимает места, нужные /todos/html.
+# Лимит подстраивается под задержку (градиентный алгоритм): пока короткая средняя задержка
+# не выходит за tolerance от базовой (долгой средней), лимит растёт на sqrt(лимита), при росте
+# задержки — уменьшается пропорционально. Когда очередь полна или ожидание в ней дольше
+# queue_timeout, запрос сразу получает 503 с Retry-After вместо того, чтобы копиться до таймаута.
+class AdaptiveLimiter:
+    # Сглаживание короткой и долгой средней задержки и шага изменения лимита
+    SHORT_WEIGHT = 0.2
+    LONG_WEIGHT = 0.02
+    SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        min_limit: int = 1,
+        tolerance: float = 2.0,
+    ):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._short_latency: float | None = None
+        self._long_latency: float | None = None
+
+    # Сколько запросов может выполняться одновременно
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    # Место для запроса: сразу, если лимит не исчерпан, иначе — в очереди не дольше queue_timeout.
+    # False — очередь полна или ожидание истекло (запрос нужно отклонить)
+    async def acquire(self) -> bool:
+        if self.in_flight < self.capacity and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # asyncio.wait не отменяет future по таймауту: место, выданное в последний момент, не теряется
+            await asyncio.wait((waiter,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._abandon(waiter)
+            raise
+        if waiter.done():
+            return True
+        self._abandon(waiter)
+        self.rejected += 1
+        return False
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    # Освобождение места; latency — время обработки запроса (без ожидания в очереди) или None,
+    # если запрос завершился ошибкой и его задержка ничего не говорит о нагрузке
+    def release(self, latency: float | None = None) -> None:
+        if latency is not None:
+            self.observe(latency)
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < self.capacity:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+                self.admitted += 1
+
+    # Пересчёт лимита по задержке очередного запроса (вызывается, пока запрос ещё учтён в in_flight)
+    def observe(self, latency: float) -> None:
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += (latency - self._short_latency) * self.SHORT_WEIGHT
+            self._long_latency += (latency - self._long_latency) * self.LONG_WEIGHT
+        # После перегрузки долгая средняя остаётся завышенной — возвращаем её к текущей задержке
+        if self._long_latency > 2 * self._short_latency:
+            self._long_latency *= 0.95
+        gradient = max(0.5, min(1.0, self.tolerance * self._long_latency / max(self._short_latency, 1e-9)))
+        new_limit = self.limit * gradient if gradient < 1 else self.limit + math.sqrt(self.limit)
+        # Лимит, который не выбирается и наполовину, не растёт: нагрузки, которая его подтвердит, нет
+        if new_limit > self.limit and self.in_flight * 2 < self.limit:
+            return
+        self.limit = min(self.max_limit, max(self.min_limit, self.limit + (new_limit - self.limit) * self.SMOOTHING))
+
+    # Через сколько секунд повторить отклонённый запрос: примерное время разбора текущей очереди
+    def retry_after(self) -> int:
+        latency = self._short_latency or 1.0
+        return max(1, math.ceil((len(self._waiters) + 1) * latency / self.capacity))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+# Класс маршрута: POST на вход, регистрацию и восстановление пароля (bcrypt, письма) — auth,
+# GET/HEAD — read, остальное — write. Статика, метрики и поток SSE не ограничиваются:
+# поток живёт столько, сколько открыта страница, и занимал бы место всё это время
+class ConcurrencyLimitMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiters: dict[str, AdaptiveLimiter],
+        auth_paths: tuple[str, ...],
+        exempt: tuple[str, ...] = ("/static/", "/metrics", "/todos/events"),
+    ):
+        self.app = app
+        self.limiters = limiters
+        self.auth_paths = frozenset(auth_paths)
+        self.exempt = exempt
+
+    def classify(self, scope: Scope) -> str | None:
+        path = scope["path"]
+        if path.startswith(self.exempt):
+            return None
+        method = scope["method"]
+        if method == "POST" and path in self.auth_paths:
+            return "auth"
+        return "read" if method in ("GET", "HEAD") else "write"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = self.limiters.get(self.classify(scope)) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        if not await limiter.acquire():
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+        # Задержка — до начала ответа: потоковый экспорт держит место до конца, но его
+        # длительность зависит от объёма данных, а не от нагрузки
+        started = time.perf_counter()
+        latency = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal latency
+            if message["type"] == "http.response.start" and latency is None:
+                latency = time.perf_counter() - started if message["status"] < 500 else None
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(latency)
+
+
+def default_limiters() -> dict[str, AdaptiveLimiter]:
+    def limiter(name: str, limit: int, max_limit: int, max_queue: int) -> AdaptiveLimiter:
+        return AdaptiveLimiter(
+            name,
+            limit=limit,
+            max_limit=max_limit,
+            max_queue=max_queue,
+            queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT,
+            tolerance=settings.CONCURRENCY_LATENCY_TOLERANCE,
+        )
+
+    return {
+        "auth": limiter("auth", settings.CONCURRENCY_AUTH_LIMIT, settings.CONCURRENCY_AUTH_MAX_LIMIT, settings.CONCURRENCY_AUTH_QUEUE),
+        "read": limiter("read", settings.CONCURRENCY_READ_LIMIT, settings.CONCURRENCY_READ_MAX_LIMIT, settings.CONCURRENCY_READ_QUEUE),
+        "write": limiter("write", settings.CONCURRENCY_WRITE_LIMIT, settings.CONCURRENCY_WRITE_MAX_LIMIT, settings.CONCURRENCY_WRITE_QUEUE),
+    }
+
+
+# Маршруты класса auth — те же, что ограничиваются по частоте (bcrypt и отправка писем)
+def auth_paths() -> tuple[str, ...]:
+    return tuple(path for rule in default_rules() for path in rule.paths)
+
+
+concurrency_limiters = default_limiters()
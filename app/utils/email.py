@@ -1,21 +1,112 @@
+import datetime
+import logging
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 
-# Функция для отправки email
-def send_email(to_email: str, subject: str, body: str, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str):
-    print(f"[send_email] Попытка отправить письмо на {to_email} через {smtp_server}:{smtp_port} от {smtp_user}")
+logger = logging.getLogger(__name__)
+
+
+# Формирование письма
+def build_message(from_email: str, to_email: str, subject: str, body: str) -> MIMEMultipart:
     msg = MIMEMultipart()
-    msg['From'] = smtp_user
+    msg['From'] = from_email
     msg['To'] = to_email
     msg['Subject'] = subject
     msg.attach(MIMEText(body, 'plain', 'utf-8'))
+    return msg
+
+
+# Письмо-напоминание: одно на пользователя со всеми сработавшими за пачку задачами
+def reminder_email(first_name: str | None, todos: list[tuple[str, datetime.datetime | None]]) -> tuple[str, str]:
+    if len(todos) == 1:
+        subject = f"Напоминание ToDoList: {todos[0][0]}"
+    else:
+        subject = f"Напоминание ToDoList: задач — {len(todos)}"
+    lines = [f"Здравствуйте, {first_name}!" if first_name else "Здравствуйте!", "", "Напоминаем о задачах:"]
+    for title, due_at in todos:
+        lines.append(f"- {title}" + (f" (срок: {due_at:%Y-%m-%d %H:%M} UTC)" if due_at else ""))
+    return subject, "\n".join(lines)
+
+
+# Функция для отправки email
+def send_email(to_email: str, subject: str, body: str, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str):
+    logger.info("Sending email to %s via %s:%s", to_email, smtp_server, smtp_port)
+    msg = build_message(smtp_user, to_email, subject, body)
     try:
         with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
             server.login(smtp_user, smtp_password)
             server.send_message(msg)
-        print("[send_email] Письмо успешно отправлено!")
-    except Exception as e:
-        print(f"[send_email] Ошибка отправки: {e}")
+    except Exception:
+        logger.exception("Failed to send email to %s", to_email)
         raise
+
+
+# Переиспользуемое SMTP-соединение: одно подключение и логин на много писем.
+# Соединение закрывается после простоя idle_timeout и переоткрывается при обрыве.
+# Не потокобезопасно — используется одним воркером очереди писем.
+class SMTPConnection:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str | None = None,
+        password: str | None = None,
+        use_ssl: bool = True,
+        idle_timeout: float = 60.0,
+        timeout: float = 30.0,
+        from_email: str | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.from_email = from_email or user
+        self.connects = 0
+        self._server: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        server = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.user:
+            server.login(self.user, self.password)
+        self.connects += 1
+        return server
+
+    def _get_server(self) -> smtplib.SMTP:
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    # Отправка одного письма; при обрыве соединения — одна попытка переподключиться
+    def send(self, to_email: str, subject: str, body: str) -> None:
+        msg = build_message(self.from_email, to_email, subject, body)
+        try:
+            self._get_server().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._get_server().send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+            # Отказ по конкретному письму — соединение остаётся рабочим
+            raise
+        except (smtplib.SMTPException, OSError):
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._server = None
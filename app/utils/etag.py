@@ -0,0 +1,33 @@
+import hashlib
+import os
+
+from fastapi import Request
+
+from app.utils.templates import TEMPLATES_DIR
+
+
+# Отпечаток шаблонов: ETag меняется после выкладки новой версии разметки
+def template_fingerprint(*names: str) -> str:
+    digest = hashlib.sha1()
+    for name in names:
+        try:
+            with open(os.path.join(TEMPLATES_DIR, name), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            continue
+    return digest.hexdigest()[:12]
+
+
+# Сильный ETag из частей, от которых зависит содержимое ответа
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+# Совпадает ли ETag с одним из значений If-None-Match (сравнение слабое, как требует RFC 9110)
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates or "*" in candidates
@@ -0,0 +1,145 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+from pydantic_core import to_json
+
+from app.core.config import settings
+from app.database.sharding import shard_router
+from app.database.crud.todo import get_todo_stats
+from app.schemas.todo import ToDoRead
+from app.utils.templates import templates
+
+
+# Событие в формате text/event-stream; кодируется один раз и раздаётся всем подписчикам
+def format_event(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + to_json(data) + b"\n\n"
+
+
+HEARTBEAT = b": ping\n\n"
+RELOAD = format_event("reload", {})
+
+
+# Подписчик: очередь ограниченного размера. Если клиент не успевает читать и очередь
+# заполнена, накопленные события выбрасываются и остаётся одно reload: клиент перезагрузит
+# страницу и переподключится, поэтому дальнейшие события этой подписке уже не нужны
+class Subscription:
+    def __init__(self, user_id: int, queue_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    # Постановка события в очередь без ожидания; None — сигнал завершения потока.
+    # False — событие не доставлено
+    def offer(self, message: bytes | None) -> bool:
+        if self.overflowed and message is not None:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RELOAD if message is not None else None)
+        self.overflowed = True
+        return False
+
+
+# Внутрипроцессный pub/sub событий по пользователям. Публикация не ждёт подписчиков
+# и не блокирует маршрут; число подключений одного пользователя ограничено
+class EventHub:
+    def __init__(self, queue_size: int, max_subscribers_per_user: int, heartbeat: float):
+        self.queue_size = queue_size
+        self.max_subscribers_per_user = max_subscribers_per_user
+        self.heartbeat = heartbeat
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    # Новая подписка; None — у пользователя уже максимум подключений
+    def subscribe(self, user_id: int) -> Subscription | None:
+        subscribers = self._subscribers.setdefault(user_id, set())
+        if len(subscribers) >= self.max_subscribers_per_user:
+            self.rejected += 1
+            return None
+        subscription = Subscription(user_id, self.queue_size)
+        subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    def publish(self, user_id: int, event: str, data) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+        message = format_event(event, data)
+        self.published += 1
+        for subscription in subscribers:
+            if not subscription.offer(message):
+                self.dropped += 1
+
+    # Поток событий для одного подписчика: heartbeat-комментарий, если событий не было
+    # heartbeat секунд (держит соединение через прокси); None в очереди — конец потока
+    async def stream(self, subscription: Subscription) -> AsyncIterator[bytes]:
+        try:
+            yield f"retry: {int(self.heartbeat * 1000)}\n\n".encode()
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), self.heartbeat)
+                except TimeoutError:
+                    message = HEARTBEAT
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    # Завершение всех потоков (остановка приложения), чтобы открытые соединения не держали выключение
+    def close(self) -> None:
+        for subscribers in list(self._subscribers.values()):
+            for subscription in subscribers:
+                subscription.offer(None)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+todo_events = EventHub(
+    queue_size=settings.SSE_QUEUE_SIZE,
+    max_subscribers_per_user=settings.SSE_MAX_SUBSCRIBERS_PER_USER,
+    heartbeat=settings.SSE_HEARTBEAT,
+)
+
+
+# Изменение задачи для открытых страниц пользователя: строка списка, отрендеренная тем же
+# partials/todo_item.html, и свежие счётчики. Без подписчиков ничего не рендерится и не читается
+async def publish_todo_event(user_id: int, event: str, todo: ToDoRead | None = None, todo_id: int | None = None) -> None:
+    if not todo_events.has_subscribers(user_id):
+        return
+    shard = await shard_router.shard_for_user(user_id)
+    async with shard.read_session() as session:
+        stats = await get_todo_stats(session, user_id)
+    data = {"id": todo.id if todo is not None else todo_id, "stats": {"total": stats.total, "completed": stats.completed}}
+    if todo is not None:
+        data["html"] = templates.env.get_template("partials/todo_item.html").render(todo=todo)
+    todo_events.publish(user_id, event, data)
+
+
+# Пакетные изменения (импорт, пакетные операции, архивация) — страница перечитывает список целиком
+def publish_todo_reload(user_id: int) -> None:
+    todo_events.publish(user_id, "reload", {})
@@ -0,0 +1,253 @@
+import bisect
+import contextvars
+import logging
+import time
+from collections import Counter as _StatementCounter
+from collections.abc import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+logger = logging.getLogger(__name__)
+
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей.
+# Все обновления идут из потока цикла событий (события SQLAlchemy, рендер шаблонов и
+# колбэки пула хэширования выполняются в нём же), поэтому блокировки не нужны.
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._values: dict[tuple, float] = {}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+# Гистограмма с фиксированными границами: на наблюдение — один bisect и два сложения
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets or (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+        self._series: dict[tuple, list] = {}  # labels -> [счётчики по корзинам, сумма, количество]
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format("+Inf" if bound == float("inf") else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+# Сборщик значений на момент опроса: (имя, тип, описание, {метки: значение})
+Collector = Callable[[], Iterable[tuple[str, str, str, dict[tuple[tuple[str, str], ...], float]]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, type_, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value in samples.items():
+                    label_names = tuple(key for key, _ in labels)
+                    label_values = tuple(value for _, value in labels)
+                    lines.append(f"{name}{_labels(label_names, label_values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter("http_requests_total", "HTTP requests", ("method", "route", "status")))
+HTTP_DURATION = registry.register(Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+HTTP_IN_PROGRESS = registry.register(Gauge("http_requests_in_progress", "HTTP requests being processed"))
+DB_QUERIES = registry.register(Counter("db_queries_total", "SQL statements executed", ("engine",)))
+DB_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ("engine",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+))
+REQUEST_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements per HTTP request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+))
+REQUEST_DB_TIME = registry.register(Histogram("http_request_db_seconds", "SQL time per HTTP request", ("route",)))
+N_PLUS_ONE = registry.register(Counter(
+    "db_n_plus_one_total", "Requests repeating one SQL statement at least METRICS_N_PLUS_ONE_THRESHOLD times", ("route",)
+))
+TEMPLATE_RENDER = registry.register(Histogram("template_render_seconds", "Jinja2 template render time", ("template",)))
+PASSWORD_HASH = registry.register(Histogram(
+    "password_hash_duration_seconds", "bcrypt time in the process pool, including queueing", ("operation",),
+))
+
+
+# Запросы SQL в рамках текущего HTTP-запроса
+class RequestStats:
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements: _StatementCounter[str] = _StatementCounter()
+
+
+_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("request_stats", default=None)
+
+
+# Хуки SQLAlchemy на движке: число и время запросов, в том числе в разрезе HTTP-запроса.
+# Контекст asyncio-задачи доступен в обработчиках — SQLAlchemy переносит его в свой greenlet
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    sync_engine = engine.sync_engine
+
+    # На соединении одновременно выполняется один запрос, поэтому хватает одного значения:
+    # следующий запрос его перезапишет, а упавший — сбрасывает в handle_error
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(ctx):
+        if ctx.connection is not None:
+            ctx.connection.info.pop("query_started", None)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        DB_QUERIES.inc(name)
+        DB_DURATION.observe(elapsed, name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            stats.statements[statement] += 1
+
+
+# ASGI-middleware: задержка, статусы и запросы в работе по шаблону маршрута (не по пути —
+# иначе /todos/1, /todos/2 ... размножили бы ряды метрик). Повторы одного SQL-запроса
+# в пределах HTTP-запроса считаются признаком N+1 и пишутся в лог
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int = 10, exclude: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.exclude = exclude
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_PROGRESS.dec()
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(scope["method"], route, str(status))
+            HTTP_DURATION.observe(elapsed, scope["method"], route)
+            REQUEST_QUERIES.observe(stats.queries, route)
+            REQUEST_DB_TIME.observe(stats.db_time, route)
+            self._check_n_plus_one(route, stats)
+
+    def _check_n_plus_one(self, route: str, stats: RequestStats) -> None:
+        if stats.queries < self.n_plus_one_threshold:
+            return
+        statement, repeats = stats.statements.most_common(1)[0]
+        if repeats >= self.n_plus_one_threshold:
+            N_PLUS_ONE.inc(route)
+            logger.warning("Possible N+1 in %s: %d executions of %s", route, repeats, " ".join(statement.split())[:200])
+
@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+import logging
+import smtplib
+from datetime import UTC
+
+from app.core.config import settings
+from app.database.db import shards
+from app.database.crud.outbox import claim_due_emails, mark_emails_sent, mark_emails_failed
+from app.utils.email import SMTPConnection
+
+
+logger = logging.getLogger(__name__)
+
+
+# Фоновый воркер доставки писем из таблицы email_outbox.
+# Забирает пачку готовых писем, отправляет их через одно SMTP-соединение в отдельном потоке
+# и планирует повтор с экспоненциальной задержкой для неудачных.
+# Очередь своя в каждом шарде (письмо ставится в одной транзакции с данными пользователя) — воркер обходит все.
+class OutboxWorker:
+    def __init__(
+        self,
+        connection: SMTPConnection,
+        session_factories=tuple(shard.session for shard in shards),
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        poll_interval: float = settings.OUTBOX_POLL_INTERVAL,
+        max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS,
+        retry_base: float = settings.OUTBOX_RETRY_BASE,
+        retry_max: float = settings.OUTBOX_RETRY_MAX,
+        lease: float = settings.OUTBOX_LEASE,
+    ):
+        self.connection = connection
+        self.session_factories = session_factories
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = datetime.timedelta(seconds=lease)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.connection.close)
+
+    # Разбудить воркер, не дожидаясь очередного опроса (после постановки письма в очередь)
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.deliver_batch()
+            except Exception:
+                logger.exception("Outbox batch failed")
+                processed = 0
+            # Полная пачка — сразу берём следующую, иначе ждём уведомления или таймаута
+            if processed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    # Задержка перед следующей попыткой: retry_base * 2^(attempts-1), не больше retry_max
+    def retry_delay(self, attempts: int) -> datetime.timedelta:
+        return datetime.timedelta(seconds=min(self.retry_base * 2 ** (attempts - 1), self.retry_max))
+
+    # Одна итерация: по пачке из очереди каждого шарда. Возвращает число обработанных писем
+    async def deliver_batch(self) -> int:
+        processed = 0
+        for session_factory in self.session_factories:
+            processed += await self._deliver_shard_batch(session_factory)
+        return processed
+
+    # Захват пачки в одном шарде, отправка, фиксация результатов
+    async def _deliver_shard_batch(self, session_factory) -> int:
+        async with session_factory() as session:
+            messages = await claim_due_emails(session, self.batch_size, self.lease)
+        if not messages:
+            return 0
+        errors = await asyncio.to_thread(self._send_all, messages)
+        now = datetime.datetime.now(UTC)
+        failures = []
+        for message in messages:
+            if message.id in errors:
+                next_attempt_at = None
+                if message.attempts < self.max_attempts:
+                    next_attempt_at = now + self.retry_delay(message.attempts)
+                failures.append((message.id, errors[message.id], next_attempt_at))
+        # Итоги пачки — одной транзакцией, как и её захват
+        async with session_factory() as session:
+            await mark_emails_sent(session, [m.id for m in messages if m.id not in errors], commit=False)
+            await mark_emails_failed(session, failures, commit=False)
+            await session.commit()
+        return len(messages)
+
+    # Синхронная отправка пачки (выполняется в потоке); возвращает ошибки по id письма
+    def _send_all(self, messages) -> dict[int, str]:
+        errors = {}
+        for index, message in enumerate(messages):
+            try:
+                self.connection.send(message.to_email, message.subject, message.body)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                errors[message.id] = str(e)
+            except Exception as e:
+                # Сервер недоступен — остаток пачки откладываем с той же ошибкой
+                for rest in messages[index:]:
+                    errors[rest.id] = str(e)
+                break
+        return errors
+
+
+outbox_worker = OutboxWorker(
+    SMTPConnection(
+        host=settings.SMTP_SERVER,
+        port=settings.SMTP_PORT,
+        user=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD,
+        use_ssl=settings.SMTP_USE_SSL,
+        idle_timeout=settings.SMTP_IDLE_TIMEOUT,
+    )
+)
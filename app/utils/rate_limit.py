@@ -0,0 +1,190 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Protocol
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+
+# Ограничение частоты запросов к тяжёлым маршрутам (bcrypt, отправка писем) по алгоритму
+# token bucket: корзина на ключ вмещает limit токенов и пополняется на limit за period секунд.
+# Ключи — IP клиента и значение поля запроса (имя пользователя, email).
+
+
+# Хранилище корзин. Интерфейс асинхронный, чтобы общий для нескольких процессов бэкенд
+# (например, Redis) подключался без изменения middleware
+class RateLimitBackend(Protocol):
+    # Забирает токен из корзины key; возвращает 0, если запрос разрешён, иначе секунды до появления токена
+    async def acquire(self, key: Hashable, limit: int, period: float) -> float: ...
+
+
+# Корзины в памяти процесса: key -> (токены, время обновления, время заполнения)
+# в порядке последнего обращения. Заполнившиеся корзины ничем не отличаются от новых и удаляются;
+# при переполнении вытесняются самые давние (это лишь ослабляет ограничение для вытесненного ключа)
+class MemoryRateLimitBackend:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[Hashable, tuple[float, float, float]] = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+
+    async def acquire(self, key: Hashable, limit: int, period: float) -> float:
+        now = time.monotonic()
+        rate = limit / period
+        tokens, updated_at, _ = self._buckets.pop(key, (limit, now, now))
+        tokens = min(limit, tokens + (now - updated_at) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+            self.allowed += 1
+        else:
+            retry_after = (1 - tokens) / rate
+            self.rejected += 1
+        self._buckets[key] = (tokens, now, now + (limit - tokens) / rate)
+        self._evict(now)
+        return retry_after
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now and len(self._buckets) <= self.maxsize:
+                break
+            del self._buckets[key]
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# Правило для группы маршрутов (только POST). Общий name — общие корзины для HTML- и API-маршрута.
+# Лимит 0 отключает соответствующий ключ
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    paths: tuple[str, ...]
+    per_ip: int
+    per_field: int = 0
+    field: str | None = None
+
+
+def default_rules() -> list[RateLimitRule]:
+    return [
+        RateLimitRule(
+            "login",
+            ("/users/login", "/api/v1/auth/token"),
+            per_ip=settings.RATE_LIMIT_LOGIN_PER_IP,
+            per_field=settings.RATE_LIMIT_LOGIN_PER_USER,
+            field="username",
+        ),
+        RateLimitRule("register", ("/users/create", "/api/v1/users"), per_ip=settings.RATE_LIMIT_REGISTER_PER_IP),
+        RateLimitRule(
+            "recovery",
+            ("/auth/recovery.html",),
+            per_ip=settings.RATE_LIMIT_RECOVERY_PER_IP,
+            per_field=settings.RATE_LIMIT_RECOVERY_PER_EMAIL,
+            field="email",
+        ),
+        RateLimitRule("reset", ("/auth/reset-password",), per_ip=settings.RATE_LIMIT_RESET_PER_IP),
+    ]
+
+
+# Значение поля из тела формы или JSON; None, если тело другого типа или поля нет
+def _field_value(content_type: str, body: bytes, field: str) -> str | None:
+    try:
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            values = parse_qs(body.decode())
+            value = values[field][0] if field in values else None
+        elif content_type.startswith("application/json"):
+            data = json.loads(body)
+            value = data.get(field) if isinstance(data, dict) else None
+        else:
+            return None
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+# ASGI-middleware: проверяет корзину IP до чтения тела, затем корзину поля.
+# Прочитанное тело отдаётся приложению повторно. IP берётся из scope — за прокси
+# uvicorn подставляет его из X-Forwarded-For при запуске с --proxy-headers
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        backend: RateLimitBackend,
+        rules: list[RateLimitRule],
+        period: float = 60.0,
+        max_body: int = 64 * 1024,
+    ):
+        self.app = app
+        self.backend = backend
+        self.period = period
+        self.max_body = max_body
+        self._rules = {path: rule for rule in rules for path in rule.paths}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        rule = self._rules.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        if rule.per_ip:
+            retry_after = await self.backend.acquire((rule.name, "ip", client_ip), rule.per_ip, self.period)
+            if retry_after:
+                await self._reject(scope, receive, send, retry_after)
+                return
+        if rule.per_field and rule.field:
+            messages, body = await self._read_body(receive)
+            receive = self._replay(messages, receive)
+            headers = dict(scope["headers"])
+            value = _field_value(headers.get(b"content-type", b"").decode("latin-1"), body, rule.field)
+            if value is not None:
+                retry_after = await self.backend.acquire((rule.name, rule.field, value), rule.per_field, self.period)
+                if retry_after:
+                    await self._reject(scope, receive, send, retry_after)
+                    return
+        await self.app(scope, receive, send)
+
+    # Чтение тела целиком, но не больше max_body: у слишком большого тела поле не разбирается
+    async def _read_body(self, receive: Receive) -> tuple[list[Message], bytes]:
+        messages = []
+        size = 0
+        while size <= self.max_body:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        else:
+            return messages, b""
+        return messages, b"".join(m.get("body", b"") for m in messages if m["type"] == "http.request")
+
+    @staticmethod
+    def _replay(messages: list[Message], receive: Receive) -> Receive:
+        async def replay() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+        return replay
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, retry_after: float) -> None:
+        response = JSONResponse(
+            {"detail": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+        await response(scope, receive, send)
+
+
+rate_limit_backend = MemoryRateLimitBackend(maxsize=settings.RATE_LIMIT_MAX_KEYS)
@@ -0,0 +1,188 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from datetime import UTC
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database.db import ASYNC_SESSION, shards
+from app.database.crud.todo import enqueue_todo_reminders, get_pending_reminders
+from app.utils.outbox import outbox_worker
+
+
+logger = logging.getLogger(__name__)
+
+
+# Текущее время в UTC без пояса — в таком виде хранятся remind_at
+def utcnow() -> datetime.datetime:
+    return datetime.datetime.now(UTC).replace(tzinfo=None)
+
+
+# Планировщик напоминаний. В памяти — только ближайшее окно: min-куча (remind_at, id) не больше
+# capacity напоминаний со сроком до now + horizon. Окно дочитывается по индексу ix_todos_remind_at
+# от курсора (remind_at, id) по мере срабатывания, без опроса всей таблицы. Правки задач в этом
+# процессе приходят через notify; изменения из других процессов подхватывает полная
+# пересинхронизация раз в resync_interval секунд. Сработавшие напоминания пачкой до batch_size
+# превращаются в письма (по одному на пользователя), которые отправляет очередь писем
+class ReminderScheduler:
+    def __init__(
+        self,
+        session_factory=ASYNC_SESSION,
+        horizon: float = settings.REMINDER_HORIZON,
+        capacity: int = settings.REMINDER_HEAP_SIZE,
+        batch_size: int = settings.REMINDER_BATCH_SIZE,
+        resync_interval: float = settings.REMINDER_RESYNC_INTERVAL,
+        on_enqueued=outbox_worker.notify,
+    ):
+        self.session_factory = session_factory
+        self.horizon = datetime.timedelta(seconds=horizon)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.resync_interval = resync_interval
+        self.on_enqueued = on_enqueued
+        self.fired = 0
+        self.emails = 0
+        self.refills = 0
+        self._heap: list[tuple[datetime.datetime, int]] = []
+        # Актуальное время напоминания для id в куче; записи кучи с другим временем устарели
+        self._scheduled: dict[int, datetime.datetime] = {}
+        self._cursor: tuple[datetime.datetime, int] | None = None
+        self._window_end: datetime.datetime | None = None
+        self._exhausted = False
+        self._resync_requested = True
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    # Загружено ли из БД всё, что срабатывает не позже (remind_at, id)
+    def _covers(self, remind_at: datetime.datetime, todo_id: int) -> bool:
+        if self._exhausted and remind_at <= self._window_end:
+            return True
+        return self._cursor is not None and (remind_at, todo_id) <= self._cursor
+
+    def _push(self, remind_at: datetime.datetime, todo_id: int) -> None:
+        self._scheduled[todo_id] = remind_at
+        heapq.heappush(self._heap, (remind_at, todo_id))
+
+    # Напоминание задачи изменилось (None — снято или задача удалена). Старая запись кучи
+    # просто перестаёт совпадать с _scheduled; новая попадает в кучу, только если лежит
+    # в уже загруженной части окна — иначе её в свой черёд дочитает refill
+    def notify(self, todo_id: int, remind_at: datetime.datetime | None) -> None:
+        self._scheduled.pop(todo_id, None)
+        if remind_at is None or not self._covers(remind_at, todo_id):
+            return
+        self._push(remind_at, todo_id)
+        if self._heap[0] == (remind_at, todo_id):
+            self._wakeup.set()
+
+    # Пакетные изменения (импорт): окно перечитывается целиком на следующей итерации
+    def request_resync(self) -> None:
+        self._resync_requested = True
+        self._wakeup.set()
+
+    async def resync(self) -> None:
+        self._heap.clear()
+        self._scheduled.clear()
+        self._cursor = None
+        self._exhausted = False
+        self._resync_requested = False
+        await self.refill()
+
+    # Дочитывание окна: следующие напоминания после курсора, пока в куче есть место.
+    # Если все напоминания окна уже загружены, окно сдвигается вперёд к now + horizon
+    async def refill(self, now: datetime.datetime | None = None) -> int:
+        now = now or utcnow()
+        free = self.capacity - len(self._scheduled)
+        if free <= 0:
+            return 0
+        self._window_end = now + self.horizon
+        async with self.session_factory() as session:
+            rows = await get_pending_reminders(session, self._window_end, self._cursor, free)
+        for remind_at, todo_id in rows:
+            if todo_id not in self._scheduled:
+                self._push(remind_at, todo_id)
+        if rows:
+            self._cursor = rows[-1]
+        self._exhausted = len(rows) < free
+        self.refills += 1
+        return len(rows)
+
+    # Отправка наступивших напоминаний: не больше batch_size за раз. Возвращает число сработавших
+    async def run_due(self, now: datetime.datetime | None = None) -> int:
+        now = now or utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            remind_at, todo_id = heapq.heappop(self._heap)
+            if self._scheduled.get(todo_id) != remind_at:
+                continue
+            del self._scheduled[todo_id]
+            due.append(todo_id)
+        if not due:
+            return 0
+        async with self.session_factory() as session:
+            emails = await enqueue_todo_reminders(session, due, now)
+        self.fired += len(due)
+        self.emails += emails
+        if emails:
+            self.on_enqueued()
+        return len(due)
+
+    # Сколько ждать до следующего события: ближайшее напоминание, дочитывание окна или пересинхронизация
+    def _sleep_time(self, now: datetime.datetime, resync_in: float) -> float:
+        timeout = resync_in
+        if self._heap:
+            timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+        if self._exhausted and self._window_end is not None:
+            timeout = min(timeout, (self._window_end - self.horizon / 2 - now).total_seconds())
+        return max(timeout, 0.0)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_resync = loop.time()
+        while True:
+            try:
+                if self._resync_requested or loop.time() >= next_resync:
+                    await self.resync()
+                    next_resync = loop.time() + self.resync_interval
+                while await self.run_due() >= self.batch_size:
+                    pass
+                now = utcnow()
+                if not self._exhausted or self._window_end - now <= self.horizon / 2:
+                    await self.refill(now)
+            except Exception:
+                logger.exception("Reminder scheduler iteration failed")
+            timeout = self._sleep_time(utcnow(), max(next_resync - loop.time(), 0.0))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def stats(self) -> dict:
+        return {"scheduled": len(self._scheduled), "fired": self.fired, "emails": self.emails, "refills": self.refills}
+
+
+# Планировщик на каждый шард: окно и курсор refill относятся к индексу одного файла БД
+reminder_schedulers = [ReminderScheduler(shard.session) for shard in shards]
+
+
+# Планировщик шарда, в который пишет сессия маршрута (номер шарда — в session.info)
+def reminders_for(session: AsyncSession) -> ReminderScheduler:
+    return reminder_schedulers[session.info.get("shard", 0)]
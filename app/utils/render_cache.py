@@ -0,0 +1,91 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from app.core.config import settings
+
+
+# Кэш отрендеренных фрагментов (список задач пользователя): LRU с ограничением по памяти.
+# Ключ содержит версию данных пользователя, поэтому устаревший фрагмент не может быть отдан;
+# invalidate_user лишь освобождает память после изменений.
+class RenderCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[Hashable, tuple[str, int, float]] = OrderedDict()
+        self._by_user: dict[int, set[Hashable]] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.render_time = 0.0
+        self.saved_time = 0.0
+
+    def get(self, key: Hashable) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        # Сэкономлено столько, сколько занял исходный рендер
+        self.saved_time += entry[2]
+        return entry[0]
+
+    def put(self, user_id: int, key: Hashable, html: str, render_time: float) -> None:
+        self.render_time += render_time
+        size = sys.getsizeof(html)
+        if size > self.max_entry_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (html, size, render_time)
+        self._by_user.setdefault(user_id, set()).add(key)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    # Удалить все фрагменты пользователя (вызывается маршрутами, изменяющими задачи)
+    def invalidate_user(self, user_id: int) -> None:
+        for key in self._by_user.pop(user_id, ()):
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        user_id = key[0]
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "render_ms": self.render_time * 1000,
+            "saved_ms": self.saved_time * 1000,
+        }
+
+
+# Ключи кэша — кортежи, первый элемент которых id пользователя
+render_cache = RenderCache(
+    max_bytes=settings.RENDER_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.RENDER_CACHE_MAX_ENTRY_BYTES,
+)
+
+
+# Рендер фрагмента с замером времени
+def render_fragment(env, name: str, context: dict) -> tuple[str, float]:
+    started = time.perf_counter()
+    html = env.get_template(name).render(context)
+    return html, time.perf_counter() - started
@@ -0,0 +1,11 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+
+# Быстрый JSON-ответ: pydantic-модели и списки моделей кодируются сериализатором
+# pydantic-core напрямую в байты, минуя jsonable_encoder и json.dumps
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
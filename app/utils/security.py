@@ -1,6 +1,15 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.config import settings
+from app.utils.metrics import PASSWORD_HASH
+
+# min_rounds — хэши с меньшей стоимостью считаются устаревшими и перехэшируются при входе
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__min_rounds=12)
 
 # Хэширует простой пароль
 def get_password_hash(password: str) -> str:
@@ -9,3 +18,106 @@ def get_password_hash(password: str) -> str:
 # Проверяет, соответствует ли простой пароль хэшированному
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+# Проверяет пароль и сообщает, нужно ли перехэшировать (устаревшая схема или стоимость)
+def verify_password_and_check(plain_password: str, hashed_password: str) -> tuple[bool, bool]:
+    valid = pwd_context.verify(plain_password, hashed_password)
+    return valid, valid and pwd_context.needs_update(hashed_password)
+
+
+# Ошибка: очередь хэширования переполнена, операция не уложилась в таймаут или пул сломан
+class HashingUnavailableError(Exception):
+    pass
+
+
+# Асинхронный сервис хэширования паролей на пуле процессов,
+# чтобы bcrypt не блокировал цикл событий uvicorn
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._count = 0
+        self._rejected = 0
+        self._total_time = 0.0
+        self._max_time = 0.0
+
+    # Пул создаётся лениво при первом обращении
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    # Запуск функции в пуле с ограничением глубины очереди и таймаутом
+    async def _run(self, operation: str, func, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise HashingUnavailableError("Очередь хэширования переполнена")
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            future = loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingUnavailableError("Пул хэширования недоступен")
+        self._pending += 1
+        # Слот освобождается, только когда воркер действительно закончил работу
+        future.add_done_callback(lambda _: self._finish(operation, started))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except TimeoutError:
+            self._rejected += 1
+            raise HashingUnavailableError("Превышено время ожидания хэширования")
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingUnavailableError("Пул хэширования недоступен")
+
+    # Воркер пула умер (OOM, сигнал) — пул больше не принимает задачи. Он закрывается без
+    # ожидания, следующий запрос создаст новый (если другой запрос ещё не сделал этого)
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        self._rejected += 1
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, operation: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        PASSWORD_HASH.observe(elapsed, operation)
+        self._pending -= 1
+        self._count += 1
+        self._total_time += elapsed
+        self._max_time = max(self._max_time, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    async def verify_and_check(self, plain_password: str, hashed_password: str) -> tuple[bool, bool]:
+        return await self._run("verify", verify_password_and_check, plain_password, hashed_password)
+
+    # Статистика времени хэширования (включая ожидание в очереди пула)
+    def stats(self) -> dict:
+        return {
+            "count": self._count,
+            "pending": self._pending,
+            "rejected": self._rejected,
+            "avg_ms": self._total_time / self._count * 1000 if self._count else 0.0,
+            "max_ms": self._max_time * 1000,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(
+    workers=settings.HASH_WORKERS,
+    max_pending=settings.HASH_MAX_PENDING,
+    timeout=settings.HASH_TIMEOUT,
+)
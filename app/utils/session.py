@@ -0,0 +1,100 @@
+import datetime
+from collections.abc import AsyncGenerator
+from datetime import UTC
+
+from fastapi import Depends, HTTPException, Request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database.db import Shard, directory_shard
+from app.database.models import User
+from app.database.sharding import shard_router
+from app.schemas.user import UserRead
+from app.utils.cache import TTLCache
+
+
+SESSION_COOKIE = "session"
+
+_serializer = URLSafeTimedSerializer(settings.SECRET_KEY, salt="session")
+
+# Кэш пользователей по id: (UserRead, версия сессий) — снимает запрос к БД с каждого
+# авторизованного запроса. Сбрасывается в crud/user.py при изменении и удалении пользователя
+# и при смене версии сессий; другие процессы видят новую версию не позже USER_CACHE_TTL.
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+# Выпуск подписанного сессионного токена. version — версия сессий пользователя
+# (users.session_version, у нового пользователя 0)
+def create_session_token(user_id: int, remember: bool = False, version: int = 0) -> str:
+    return _serializer.dumps({"uid": user_id, "v": version, "r": remember})
+
+# Проверка подписи и срока токена; возвращает (id пользователя, версия сессий) или None.
+# Токены без "Запомнить меня" живут SESSION_SHORT_MAX_AGE
+def read_session_token(token: str) -> tuple[int, int] | None:
+    try:
+        data, issued_at = _serializer.loads(token, max_age=settings.SESSION_MAX_AGE, return_timestamp=True)
+    except BadSignature:
+        return None
+    if not data.get("r") and datetime.datetime.now(UTC) - issued_at > datetime.timedelta(seconds=settings.SESSION_SHORT_MAX_AGE):
+        return None
+    if not isinstance(data.get("uid"), int):
+        return None
+    return data["uid"], data.get("v", 0)
+
+# Установка сессионной куки в ответ
+def set_session_cookie(response, user_id: int, remember: bool = False, version: int = 0) -> None:
+    token = create_session_token(user_id, remember, version)
+    if remember:
+        response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="lax", max_age=settings.SESSION_MAX_AGE)
+    else:
+        response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="lax")
+
+
+# Зависимость для FastAPI — текущий пользователь по сессионной куке или None.
+# Пользователь читается из своего шарда; токен с устаревшей версией сессий не действует
+async def get_current_user(request: Request) -> UserRead | None:
+    token = request.cookies.get(SESSION_COOKIE)
+    # Клиенты API могут передавать тот же токен в заголовке Authorization: Bearer <token>
+    authorization = request.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not token:
+        return None
+    session_token = read_session_token(token)
+    if session_token is None:
+        return None
+    user_id, version = session_token
+    cached = user_cache.get(user_id)
+    if cached is None:
+        shard = await shard_router.shard_for_user(user_id)
+        async with shard.read_session() as session:
+            db_user = await session.get(User, user_id)
+        if db_user is None:
+            return None
+        cached = (UserRead.model_validate(db_user), db_user.session_version)
+        user_cache.set(user_id, cached)
+    user, current_version = cached
+    return user if version == current_version else None
+
+# Зависимость для JSON-маршрутов — текущий пользователь или 401
+async def require_user(user: UserRead | None = Depends(get_current_user)) -> UserRead:
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+# Зависимость для FastAPI — шард текущего пользователя; без входа — шард 0
+async def get_user_shard(user: UserRead | None = Depends(get_current_user)) -> Shard:
+    if user is None:
+        return directory_shard
+    return await shard_router.shard_for_user(user.id)
+
+# Зависимость для FastAPI — сессия записи в шарде пользователя (с групповой фиксацией, если она включена)
+async def get_session(shard: Shard = Depends(get_user_shard)) -> AsyncGenerator[AsyncSession, None]:
+    async with shard.request_session() as session:
+        yield session
+
+# Зависимость для FastAPI — сессия только для чтения в шарде пользователя (маршруты без записи)
+async def get_read_session(shard: Shard = Depends(get_user_shard)) -> AsyncGenerator[AsyncSession, None]:
+    async with shard.read_session() as session:
+        yield session
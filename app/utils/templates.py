@@ -1,4 +1,53 @@
+import logging
+import os
+import time
+
+import jinja2
 from fastapi.templating import Jinja2Templates
 
+from app.core.config import settings
+from app.utils.metrics import TEMPLATE_RENDER
+
+
+logger = logging.getLogger(__name__)
+
+
+TEMPLATES_DIR = "app/templates"
+
+
+# Кэш байткода на диске: скомпилированные шаблоны переживают перезапуск воркеров.
+# Каталог создаётся при старте; если создать его нельзя, шаблоны работают без кэша байткода
+def _bytecode_cache() -> jinja2.BytecodeCache | None:
+    if not settings.TEMPLATE_BYTECODE_CACHE:
+        return None
+    if settings.TEMPLATE_CACHE_DIR:
+        try:
+            os.makedirs(settings.TEMPLATE_CACHE_DIR, exist_ok=True)
+        except OSError as exc:
+            logger.warning("Template bytecode cache disabled: cannot create %s: %s", settings.TEMPLATE_CACHE_DIR, exc)
+            return None
+    return jinja2.FileSystemBytecodeCache(settings.TEMPLATE_CACHE_DIR)
+
+
+# Шаблон с замером времени рендера для /metrics (вложенные include входят во время страницы)
+class TimedTemplate(jinja2.Template):
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER.observe(time.perf_counter() - started, self.name)
+
+
+def _environment() -> jinja2.Environment:
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=_bytecode_cache(),
+    )
+    env.template_class = TimedTemplate
+    return env
+
+
 # Инициализация шаблонов Jinja2
-templates = Jinja2Templates(directory="app/templates")
\ No newline at end of file
+templates = Jinja2Templates(env=_environment())
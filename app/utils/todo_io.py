@@ -0,0 +1,172 @@
+import codecs
+import csv
+import io
+import json
+from collections.abc import AsyncIterable, AsyncIterator
+
+from pydantic import ValidationError
+from pydantic_core import to_json
+
+from app.core.config import settings
+from app.schemas.todo import ToDoCreate
+
+
+# Форматы экспорта/импорта задач: NDJSON (объект на строку) и CSV с заголовком
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+CSV_FIELDS = ("id", "title", "description", "completed", "due_at", "remind_at", "completed_at", "archived", "tags")
+
+
+# Строка импорта длиннее IMPORT_MAX_LINE_LENGTH символов: импорт прерывается, а не копит её в памяти
+class ImportLineTooLongError(ValueError):
+    def __init__(self, line: int):
+        super().__init__(f"Line {line} is longer than {settings.IMPORT_MAX_LINE_LENGTH} characters")
+        self.line = line
+
+
+# Определение формата по параметру, имени файла или Content-Type; None — формат не распознан
+def detect_format(explicit: str | None, filename: str | None = None, content_type: str | None = None) -> str | None:
+    if explicit:
+        return explicit if explicit in FORMATS else None
+    if filename:
+        suffix = filename.rsplit(".", 1)[-1].lower()
+        if suffix in ("ndjson", "jsonl"):
+            return "ndjson"
+        if suffix == "csv":
+            return "csv"
+    if content_type:
+        media = content_type.split(";", 1)[0].strip().lower()
+        if media in ("application/x-ndjson", "application/jsonl", "application/json-lines"):
+            return "ndjson"
+        if media in ("text/csv", "application/csv"):
+            return "csv"
+    return None
+
+
+# Экспорт: каждая пачка строк из crud кодируется в один кусок ответа
+async def encode_ndjson(partitions: AsyncIterable[list[dict]]) -> AsyncIterator[bytes]:
+    async for rows in partitions:
+        yield b"".join(to_json(dict(row)) + b"\n" for row in rows)
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, list):
+        # Теги через запятую, как в формах: запятых в именах тегов не бывает
+        return ",".join(value)
+    return str(value)
+
+
+async def encode_csv(partitions: AsyncIterable[list[dict]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_FIELDS)
+    async for rows in partitions:
+        writer.writerows([_csv_value(row[field]) for field in CSV_FIELDS] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+# Импорт: байты тела запроса режутся на строки по мере поступления, без чтения файла целиком.
+# Возвращает пары (номер строки, текст строки без перевода строки). Строка длиннее max_length
+# символов — ImportLineTooLongError: без перевода строки тело иначе копилось бы в памяти целиком
+async def iter_lines(
+    chunks: AsyncIterable[bytes], max_length: int = settings.IMPORT_MAX_LINE_LENGTH
+) -> AsyncIterator[tuple[int, str]]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    number = 0
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            number += 1
+            if len(line) > max_length:
+                raise ImportLineTooLongError(number)
+            yield number, line.removesuffix("\r")
+        if len(tail) > max_length:
+            raise ImportLineTooLongError(number + 1)
+    tail += decoder.decode(b"", final=True)
+    if len(tail) > max_length:
+        raise ImportLineTooLongError(number + 1)
+    if tail:
+        yield number + 1, tail.removesuffix("\r")
+
+
+# Ошибка валидации одной строкой: первая ошибка pydantic с именем поля
+def _validation_message(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _validate(data) -> ToDoCreate | str:
+    if not isinstance(data, dict):
+        return "Expected an object"
+    try:
+        return ToDoCreate.model_validate(data)
+    except ValidationError as exc:
+        return _validation_message(exc)
+
+
+# Разбор NDJSON: на каждую непустую строку — (номер, задача) или (номер, текст ошибки)
+async def parse_ndjson(lines: AsyncIterable[tuple[int, str]]) -> AsyncIterator[tuple[int, ToDoCreate | str]]:
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield number, "Invalid JSON"
+            continue
+        yield number, _validate(data)
+
+
+# Разбор CSV с заголовком. Запись с переводом строки внутри кавычек занимает несколько
+# физических строк: копим их, пока число кавычек не станет чётным. Пустое описание — None,
+# неизвестные колонки (id, archived и т. п. из экспорта) игнорируются
+async def parse_csv(lines: AsyncIterable[tuple[int, str]]) -> AsyncIterator[tuple[int, ToDoCreate | str]]:
+    header = None
+    pending: list[str] = []
+    start = 0
+    async for number, line in lines:
+        if not pending:
+            start = number
+        pending.append(line)
+        if sum(part.count('"') for part in pending) % 2:
+            continue
+        record = "\n".join(pending)
+        pending = []
+        if not record.strip():
+            continue
+        try:
+            values = next(csv.reader([record]))
+        except csv.Error as exc:
+            yield start, f"Invalid CSV: {exc}"
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            if "title" not in header:
+                yield start, "CSV header must contain a title column"
+                return
+            continue
+        if len(values) > len(header):
+            yield start, "Too many columns"
+            continue
+        data = {name: value for name, value in zip(header, values) if name in ToDoCreate.model_fields}
+        if data.get("description") == "":
+            data["description"] = None
+        for name in ("completed", "due_at", "remind_at"):
+            if data.get(name) == "":
+                del data[name]
+        yield start, _validate(data)
+    if pending:
+        yield start, "Unterminated quoted field"
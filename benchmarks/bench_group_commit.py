@@ -0,0 +1,87 @@
+# Бенчмарк записи: фиксация на каждый запрос (ASYNC_SESSION) против групповой фиксации
+# (GROUP_COMMIT_SESSION). concurrency задач параллельно создают задачи через create_todo,
+# как обработчики форм. Выигрыш растёт с ценой fsync: при DB_SYNCHRONOUS=FULL каждый COMMIT
+# синхронизирует WAL, при NORMAL — только контрольные точки.
+#
+# Запуск: DB_SYNCHRONOUS=FULL python -m benchmarks.bench_group_commit --writes 2000 --concurrency 32
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+# Отдельная временная БД, чтобы не трогать рабочую
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="todo-bench-"), "bench.db"))
+for name, value in {"SMTP_SERVER": "localhost", "SMTP_PORT": "25", "SMTP_USER": "bench", "SMTP_PASSWORD": "bench"}.items():
+    os.environ.setdefault(name, value)
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.database.db import ASYNC_SESSION, GROUP_COMMIT_SESSION, dispose_engines, init_db, write_coordinator
+from app.database.crud.todo import create_todo
+from app.database.models import User
+from app.schemas.todo import ToDoCreate
+
+
+async def seed() -> int:
+    await init_db()
+    async with ASYNC_SESSION() as session:
+        result = await session.execute(
+            insert(User).values(username="bench", email="bench@example.com", hashed_password="x").returning(User.id)
+        )
+        user_id = result.scalar_one()
+        await session.commit()
+    return user_id
+
+
+# writes вызовов create_todo из concurrency задач; возвращает (секунды, задержки в мс)
+async def run(session_factory, user_id: int, writes: int, concurrency: int) -> tuple[float, list[float]]:
+    latencies = []
+    counter = iter(range(writes))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            async with session_factory() as session:
+                await create_todo(session, ToDoCreate(title=f"Task {i}"), user_id=user_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies
+
+
+def report(name: str, elapsed: float, latencies: list[float]) -> None:
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(
+        f"{name:28} {len(latencies) / elapsed:9.0f} writes/s   "
+        f"median {statistics.median(latencies):7.2f} ms   p99 {p99:7.2f} ms"
+    )
+
+
+async def main(writes: int, concurrency: int) -> None:
+    user_id = await seed()
+    await run(ASYNC_SESSION, user_id, 50, 1)  # прогрев
+    per_request = await run(ASYNC_SESSION, user_id, writes, concurrency)
+    grouped = await run(GROUP_COMMIT_SESSION, user_id, writes, concurrency)
+    stats = write_coordinator.stats()
+    await dispose_engines()
+    print(
+        f"writes={writes} concurrency={concurrency} synchronous={settings.DB_SYNCHRONOUS} "
+        f"window={settings.DB_GROUP_COMMIT_WINDOW * 1000:g} ms max_batch={settings.DB_GROUP_COMMIT_MAX_BATCH}"
+    )
+    report("commit per request", *per_request)
+    report("group commit", *grouped)
+    print(f"group commit: {stats['jobs']} sessions in {stats['batches']} transactions")
+    print(f"speedup x{per_request[0] / grouped[0]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main(args.writes, args.concurrency))
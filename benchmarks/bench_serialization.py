@@ -0,0 +1,137 @@
+# Микробенчмарк чтения и сериализации списка задач тремя путями:
+# - legacy: ORM-объекты, from_orm на каждую задачу, jsonable_encoder + json.dumps;
+# - adapter: выборка колонок, TypeAdapter по RowMapping (модель pydantic на строку), FastJSONResponse;
+# - rows: выборка колонок сразу в dataclass со __slots__, FastJSONResponse — так читают get_all_todos,
+#   страницы списка и архива и поиск (здесь — через get_all_todos).
+# Время — медиана повторов; память — пик выделений tracemalloc за один проход (отдельным
+# прогоном, потому что tracemalloc сам замедляет выполнение).
+#
+# Запуск: python -m benchmarks.bench_serialization --rows 100000 --repeat 5
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+# Отдельная временная БД, чтобы не трогать рабочую
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="todo-bench-"), "bench.db"))
+for name, value in {"SMTP_SERVER": "localhost", "SMTP_PORT": "25", "SMTP_USER": "bench", "SMTP_PASSWORD": "bench"}.items():
+    os.environ.setdefault(name, value)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+
+from app.database.db import ASYNC_SESSION, READ_SESSION, dispose_engines, init_db
+from app.database.models import ToDo, User
+from app.database.crud.todo import get_all_todos
+from app.schemas.todo import ToDoRead
+from app.utils.responses import FastJSONResponse
+
+
+async def seed(rows: int) -> int:
+    await init_db()
+    async with ASYNC_SESSION() as session:
+        result = await session.execute(
+            insert(User).values(username="bench", email="bench@example.com", hashed_password="x").returning(User.id)
+        )
+        user_id = result.scalar_one()
+        for start in range(0, rows, 5000):
+            await session.execute(
+                insert(ToDo),
+                [
+                    {"title": f"Task {i}", "description": f"Description {i}", "completed": i % 3 == 0, "user_id": user_id}
+                    for i in range(start, min(start + 5000, rows))
+                ],
+            )
+        await session.commit()
+    return user_id
+
+
+# Прежний путь: ORM-объекты и from_orm на каждую задачу
+async def legacy_path(user_id: int) -> bytes:
+    async with READ_SESSION() as session:
+        result = await session.execute(select(ToDo).where(ToDo.user_id == user_id))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            todos = [ToDoRead.from_orm(todo) for todo in result.scalars().all()]
+    return JSONResponse(jsonable_encoder(todos)).body
+
+
+_TODO_LIST = TypeAdapter(list[ToDoRead])
+
+
+# Колонки и пакетная валидация TypeAdapter: словарь строки и модель pydantic на каждую задачу
+async def adapter_path(user_id: int) -> bytes:
+    async with READ_SESSION() as session:
+        result = await session.execute(
+            select(ToDo.id, ToDo.title, ToDo.description, ToDo.completed, ToDo.due_at, ToDo.remind_at)
+            .where(ToDo.user_id == user_id)
+            .order_by(ToDo.id)
+        )
+        todos = _TODO_LIST.validate_python(result.mappings().all())
+    return FastJSONResponse(todos).body
+
+
+# Путь приложения: кортежи строк сразу в ToDoRow
+async def rows_path(user_id: int) -> bytes:
+    async with READ_SESSION() as session:
+        todos = await get_all_todos(session, user_id=user_id)
+    return FastJSONResponse(todos).body
+
+
+async def measure(func, user_id: int, repeat: int) -> list[float]:
+    await func(user_id)  # прогрев
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func(user_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+# Пик памяти, выделенной за один проход (МиБ)
+async def peak_memory(func, user_id: int) -> float:
+    tracemalloc.start()
+    try:
+        await func(user_id)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+PATHS = (
+    ("legacy (from_orm + jsonable_encoder)", legacy_path),
+    ("adapter (TypeAdapter + pydantic-core)", adapter_path),
+    ("rows (slots dataclass + pydantic-core)", rows_path),
+)
+
+
+async def main(rows: int, repeat: int) -> None:
+    user_id = await seed(rows)
+    bodies = [await func(user_id) for _, func in PATHS]
+    assert all(body.count(b'"id"') == rows for body in bodies)
+    # Оба быстрых пути отдают одинаковые задачи (порядок ключей у модели и dataclass разный)
+    assert json.loads(bodies[1]) == json.loads(bodies[2])
+    results = [(name, await measure(func, user_id, repeat), await peak_memory(func, user_id)) for name, func in PATHS]
+    await dispose_engines()
+    print(f"rows={rows} repeat={repeat}")
+    for name, timings, peak in results:
+        print(f"{name:40} median {statistics.median(timings):9.2f} ms   min {min(timings):9.2f} ms   peak {peak:8.1f} MiB")
+    legacy, *_, fast = results
+    print(f"rows vs legacy: speedup x{statistics.median(legacy[1]) / statistics.median(fast[1]):.2f}, memory x{legacy[2] / fast[2]:.2f}")
+    adapter = results[1]
+    print(f"rows vs adapter: speedup x{statistics.median(adapter[1]) / statistics.median(fast[1]):.2f}, memory x{adapter[2] / fast[2]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
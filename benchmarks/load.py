@@ -0,0 +1,364 @@
+# Нагрузочный бенчмарк: засевает синтетические данные и параллельно гоняет все маршруты
+# приложения через httpx.ASGITransport (без сети и сервера). Для каждого маршрута считает
+# пропускную способность и задержки p50/p95/p99; результат пишется в JSON.
+# С --compare сравнивает p95 с прошлым прогоном и завершается с кодом 1 при регрессии.
+#
+# Запуск: python -m benchmarks.load --users 1000 --todos 100000 --concurrency 32 --duration 30
+# Повторно на той же базе: DB_PATH=/tmp/bench.db python -m benchmarks.load --skip-seed
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import benchmarks.seed  # noqa: F401 — временная БД и настройки окружения до импорта приложения
+# Все запросы идут с одного адреса — ограничение частоты исказило бы результаты
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from httpx import ASGITransport, AsyncClient
+
+from app.main import app
+from app.database.db import DB_PATH, dispose_engines, init_db, run_online_migrations
+from app.utils.security import hasher
+from app.utils.session import SESSION_COOKIE, create_session_token
+from benchmarks.seed import PASSWORD, WORDS, BenchUser, load_dataset, seed_dataset
+
+
+# Процентиль по отсортированному списку (метод ближайшего ранга)
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    statuses: dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    errors: int = 0
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "count": len(latencies),
+            "errors": self.errors,
+            "statuses": dict(sorted(self.statuses.items())),
+            "rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        }
+
+
+# Состояние виртуального пользователя: клиент с сессией и задачи, созданные им самим
+class VirtualUser:
+    def __init__(self, client: AsyncClient, user: BenchUser, rng: random.Random, stats: dict[str, EndpointStats]):
+        self.client = client
+        self.user = user
+        self.rng = rng
+        self.stats = stats
+        self.token = create_session_token(user.id)
+        self.created: list[int] = []
+        self.etag: str | None = None
+        self.login()
+
+    def login(self) -> None:
+        self.client.cookies.set(SESSION_COOKIE, self.token)
+
+    @property
+    def auth(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def todo_id(self) -> int:
+        if self.user.first_todo_id is None or self.rng.random() < 0.3 and self.created:
+            return self.rng.choice(self.created) if self.created else 0
+        return self.rng.randint(self.user.first_todo_id, self.user.last_todo_id)
+
+    def words(self, count: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(count))
+
+    # Замер одного запроса под именем маршрута; 5xx и исключения считаются ошибками
+    async def request(self, name: str, method: str, url: str, client: AsyncClient | None = None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await (client or self.client).request(method, url, **kwargs)
+        except Exception:
+            self.stats[name].errors += 1
+            return None
+        self.stats[name].latencies.append((time.perf_counter() - started) * 1000)
+        self.stats[name].statuses[response.status_code] += 1
+        if response.status_code >= 500:
+            self.stats[name].errors += 1
+        return response
+
+
+# Сценарии: имя маршрута -> (вес, функция). Функция возвращает False, если выполнить
+# сценарий сейчас нельзя (например, нечего удалять) — тогда выбирается другой
+async def s_root(vu: VirtualUser):
+    await vu.request("GET /", "GET", "/")
+
+async def s_todos_html(vu: VirtualUser):
+    params = {}
+    if vu.user.first_todo_id is not None and vu.rng.random() < 0.5:
+        params["after"] = vu.rng.randint(vu.user.first_todo_id, vu.user.last_todo_id)
+    response = await vu.request("GET /todos/html", "GET", "/todos/html", params=params)
+    if response is not None and not params:
+        vu.etag = response.headers.get("etag")
+
+async def s_todos_html_conditional(vu: VirtualUser):
+    if not vu.etag:
+        return False
+    await vu.request("GET /todos/html (If-None-Match)", "GET", "/todos/html", headers={"If-None-Match": vu.etag})
+
+async def s_todos_search(vu: VirtualUser):
+    await vu.request("GET /todos/search", "GET", "/todos/search", params={"q": vu.words(vu.rng.randint(1, 2))[:-1]})
+
+async def s_todo_create(vu: VirtualUser):
+    await vu.request("POST /todos/create", "POST", "/todos/create", data={"title": vu.words(3), "description": vu.words(6)})
+
+async def s_todo_update(vu: VirtualUser):
+    data = {"title": vu.words(3), "description": vu.words(6)}
+    if vu.rng.random() < 0.5:
+        data["completed"] = "on"
+    await vu.request("POST /todos/update/{id}", "POST", f"/todos/update/{vu.todo_id()}", data=data)
+
+async def s_todo_delete(vu: VirtualUser):
+    if not vu.created:
+        return False
+    await vu.request("POST /todos/delete/{id}", "POST", f"/todos/delete/{vu.created.pop()}")
+
+async def s_todo_delete_completed(vu: VirtualUser):
+    await vu.request("POST /todos/delete-completed", "POST", "/todos/delete-completed")
+
+async def s_bulk_create(vu: VirtualUser):
+    items = [{"title": vu.words(3), "description": vu.words(5)} for _ in range(10)]
+    response = await vu.request("POST /todos/bulk/create", "POST", "/todos/bulk/create", json={"items": items})
+    if response is not None and response.status_code == 200:
+        vu.created.extend(response.json()["ids"])
+
+async def s_bulk_complete(vu: VirtualUser):
+    ids = [vu.todo_id() for _ in range(10)]
+    await vu.request("POST /todos/bulk/complete", "POST", "/todos/bulk/complete", json={"ids": ids})
+
+async def s_bulk_delete(vu: VirtualUser):
+    if len(vu.created) < 5:
+        return False
+    ids = [vu.created.pop() for _ in range(5)]
+    await vu.request("POST /todos/bulk/delete", "POST", "/todos/bulk/delete", json={"ids": ids})
+
+async def s_bulk_delete_completed(vu: VirtualUser):
+    await vu.request("POST /todos/bulk/delete-completed", "POST", "/todos/bulk/delete-completed")
+
+async def s_pages(vu: VirtualUser):
+    name = vu.rng.choice(
+        ["/users/auth/register.html", "/users/auth/login.html", "/auth/login.html", "/auth/register.html", "/auth/recovery.html"]
+    )
+    await vu.request(f"GET {name}", "GET", name)
+
+async def s_register(vu: VirtualUser):
+    username = f"bench_new_{secrets.token_hex(6)}"
+    await vu.request("POST /users/create", "POST", "/users/create", data={
+        "first_name": "New", "last_name": "User", "username": username, "email": f"{username}@example.com",
+        "password": PASSWORD, "confirm_password": PASSWORD,
+    })
+
+async def s_login(vu: VirtualUser):
+    await vu.request("POST /users/login", "POST", "/users/login", data={"username": vu.user.username, "password": PASSWORD})
+    vu.login()
+
+async def s_logout(vu: VirtualUser):
+    await vu.request("POST /users/logout", "POST", "/users/logout")
+    vu.login()
+
+async def s_recovery(vu: VirtualUser):
+    await vu.request("POST /auth/recovery.html", "POST", "/auth/recovery.html", data={"email": vu.user.email})
+
+async def s_reset_get(vu: VirtualUser):
+    await vu.request("GET /auth/reset-password", "GET", "/auth/reset-password", params={"token": secrets.token_urlsafe(16)})
+
+async def s_reset_post(vu: VirtualUser):
+    await vu.request("POST /auth/reset-password", "POST", "/auth/reset-password", data={
+        "token": secrets.token_urlsafe(16), "password": PASSWORD, "confirm_password": PASSWORD,
+    })
+
+async def s_api_token(vu: VirtualUser):
+    await vu.request("POST /api/v1/auth/token", "POST", "/api/v1/auth/token", json={"username": vu.user.username, "password": PASSWORD})
+
+async def s_api_create_user(vu: VirtualUser):
+    username = f"bench_api_{secrets.token_hex(6)}"
+    await vu.request("POST /api/v1/users", "POST", "/api/v1/users", json={
+        "first_name": "Api", "last_name": "User", "username": username, "email": f"{username}@example.com", "password": PASSWORD,
+    })
+
+async def s_api_me(vu: VirtualUser):
+    await vu.request("GET /api/v1/users/me", "GET", "/api/v1/users/me", headers=vu.auth)
+
+# Смена email (first_name UserUpdate не принимает): новый адрес уникален, и сценарий
+# восстановления пароля дальше отправляет уже его
+async def s_api_update_me(vu: VirtualUser):
+    email = f"bench_{vu.user.id}_{secrets.token_hex(4)}@example.com"
+    response = await vu.request("PATCH /api/v1/users/me", "PATCH", "/api/v1/users/me", headers=vu.auth, json={"email": email})
+    if response is not None and response.status_code == 200:
+        vu.user.email = email
+
+# Удаляется временный пользователь, созданный без замера. Отдельный клиент без куки:
+# кука сессии имеет приоритет над заголовком Authorization и удалила бы самого виртуального пользователя
+async def s_api_delete_me(vu: VirtualUser):
+    username = f"bench_tmp_{secrets.token_hex(6)}"
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        created = await client.post("/api/v1/users", json={
+            "first_name": "Tmp", "last_name": "User", "username": username, "email": f"{username}@example.com", "password": PASSWORD,
+        })
+        if created.status_code != 201:
+            return False
+        headers = {"Authorization": f"Bearer {create_session_token(created.json()['id'])}"}
+        await vu.request("DELETE /api/v1/users/me", "DELETE", "/api/v1/users/me", client=client, headers=headers)
+
+async def s_api_todos(vu: VirtualUser):
+    params = {"limit": vu.rng.choice([20, 50, 100])}
+    if vu.user.first_todo_id is not None and vu.rng.random() < 0.5:
+        params["after"] = vu.rng.randint(vu.user.first_todo_id, vu.user.last_todo_id)
+    await vu.request("GET /api/v1/todos", "GET", "/api/v1/todos", headers=vu.auth, params=params)
+
+async def s_api_search(vu: VirtualUser):
+    await vu.request("GET /api/v1/todos/search", "GET", "/api/v1/todos/search", headers=vu.auth, params={"q": vu.words(1)})
+
+async def s_api_get_todo(vu: VirtualUser):
+    await vu.request("GET /api/v1/todos/{id}", "GET", f"/api/v1/todos/{vu.todo_id()}", headers=vu.auth)
+
+async def s_api_create_todo(vu: VirtualUser):
+    response = await vu.request("POST /api/v1/todos", "POST", "/api/v1/todos", headers=vu.auth, json={"title": vu.words(3)})
+    if response is not None and response.status_code == 201:
+        vu.created.append(response.json()["id"])
+
+async def s_api_update_todo(vu: VirtualUser):
+    json_body = {"completed": vu.rng.random() < 0.5}
+    await vu.request("PATCH /api/v1/todos/{id}", "PATCH", f"/api/v1/todos/{vu.todo_id()}", headers=vu.auth, json=json_body)
+
+async def s_api_delete_todo(vu: VirtualUser):
+    if not vu.created:
+        return False
+    await vu.request("DELETE /api/v1/todos/{id}", "DELETE", f"/api/v1/todos/{vu.created.pop()}", headers=vu.auth)
+
+
+# Веса примерно соответствуют ожидаемой нагрузке: чтение списков преобладает,
+# маршруты с bcrypt и массовым удалением редки
+SCENARIOS = {
+    s_root: 1, s_todos_html: 20, s_todos_html_conditional: 5, s_todos_search: 5,
+    s_todo_create: 5, s_todo_update: 5, s_todo_delete: 3, s_todo_delete_completed: 0.2,
+    s_bulk_create: 2, s_bulk_complete: 2, s_bulk_delete: 1, s_bulk_delete_completed: 0.2,
+    s_pages: 3, s_register: 0.5, s_login: 1, s_logout: 0.5, s_recovery: 0.5, s_reset_get: 0.5, s_reset_post: 0.5,
+    s_api_token: 1, s_api_create_user: 0.5, s_api_me: 3, s_api_update_me: 1, s_api_delete_me: 0.3,
+    s_api_todos: 10, s_api_search: 3, s_api_get_todo: 5, s_api_create_todo: 3, s_api_update_todo: 3, s_api_delete_todo: 2,
+}
+
+
+async def worker(index: int, dataset: list[BenchUser], stats, deadline: float, budget: list[int], seed: int) -> None:
+    rng = random.Random(seed + index)
+    scenarios, weights = list(SCENARIOS), list(SCENARIOS.values())
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        vu = VirtualUser(client, dataset[index % len(dataset)], rng, stats)
+        while time.perf_counter() < deadline and budget[0] > 0:
+            scenario = rng.choices(scenarios, weights)[0]
+            if await scenario(vu) is not False:
+                budget[0] -= 1
+
+
+async def run(args) -> dict:
+    await init_db()
+    await run_online_migrations()
+    started = time.perf_counter()
+    dataset = await load_dataset() if args.skip_seed else await seed_dataset(args.users, args.todos, seed=args.seed)
+    seed_seconds = time.perf_counter() - started
+    if not dataset:
+        raise SystemExit("В базе нет пользователей бенчмарка — запустите без --skip-seed")
+    stats: dict[str, EndpointStats] = defaultdict(EndpointStats)
+    budget = [args.requests or sys.maxsize]
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(i, dataset, stats, started + args.duration, budget, args.seed) for i in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    await dispose_engines()
+    overall = EndpointStats()
+    for endpoint in stats.values():
+        overall.latencies.extend(endpoint.latencies)
+        overall.errors += endpoint.errors
+        for status, count in endpoint.statuses.items():
+            overall.statuses[status] += count
+    return {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "db_path": DB_PATH,
+            "users": len(dataset),
+            "seed_seconds": round(seed_seconds, 2),
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 2),
+        },
+        "overall": overall.summary(elapsed),
+        "endpoints": {name: stats[name].summary(elapsed) for name in sorted(stats)},
+    }
+
+
+# Маршруты, у которых p95 вырос больше чем на threshold (доля) по сравнению с прошлым прогоном
+def find_regressions(previous: dict, current: dict, threshold: float) -> dict[str, tuple[float, float]]:
+    regressions = {}
+    for name, result in current["endpoints"].items():
+        before = previous.get("endpoints", {}).get(name)
+        if before and before["p95_ms"] > 0 and result["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions[name] = (before["p95_ms"], result["p95_ms"])
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f"{'endpoint':42} {'count':>7} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'err':>5}")
+    for name, result in [*report["endpoints"].items(), ("TOTAL", report["overall"])]:
+        print(
+            f"{name:42} {result['count']:7} {result['rps']:8.1f} {result['p50_ms']:9.2f} "
+            f"{result['p95_ms']:9.2f} {result['p99_ms']:9.2f} {result['errors']:5}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--todos", type=int, default=10000)
+    parser.add_argument("--skip-seed", action="store_true", help="использовать уже засеянную базу (DB_PATH)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность нагрузки, сек.")
+    parser.add_argument("--requests", type=int, default=0, help="остановиться после N запросов (0 — без ограничения)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", f"load-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения p95")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост p95 (доля)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = find_regressions(json.load(f), report, args.threshold)
+        for name, (before, after) in regressions.items():
+            print(f"РЕГРЕССИЯ {name}: p95 {before:.2f} -> {after:.2f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
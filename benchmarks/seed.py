@@ -0,0 +1,119 @@
+# Генератор синтетических данных для бенчмарков: пользователи и задачи пакетными вставками.
+# Все пользователи получают один пароль (хэшируется один раз), задачи пользователя идут
+# подряд, поэтому их id образуют непрерывный диапазон.
+#
+# Запуск: DB_PATH=/tmp/bench.db python -m benchmarks.seed --users 10000 --todos 1000000
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="todo-bench-"), "bench.db"))
+for name, value in {"SMTP_SERVER": "localhost", "SMTP_PORT": "25", "SMTP_USER": "bench", "SMTP_PASSWORD": "bench"}.items():
+    os.environ.setdefault(name, value)
+
+from sqlalchemy import func, insert, select
+
+from app.database.db import ASYNC_SESSION, READ_SESSION, DB_PATH, dispose_engines, init_db, run_online_migrations
+from app.database.models import ToDo, User
+from app.utils.security import get_password_hash
+
+
+USERNAME_PREFIX = "bench_user_"
+PASSWORD = "bench-password"
+
+WORDS = [
+    "купить", "молоко", "отчёт", "встреча", "позвонить", "проект", "оплатить", "счёт", "report", "meeting",
+    "deploy", "release", "review", "invoice", "groceries", "dentist", "backup", "server", "draft", "email",
+    "починить", "велосипед", "книга", "прочитать", "спорт", "тренировка", "ремонт", "кухня", "travel", "tickets",
+]
+
+
+@dataclass
+class BenchUser:
+    id: int
+    username: str
+    email: str
+    first_todo_id: int | None
+    last_todo_id: int | None
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+# Заполнение базы: users пользователей и todos задач, распределённых между ними поровну
+async def seed_dataset(users: int, todos: int, batch_size: int = 10000, seed: int = 42) -> list[BenchUser]:
+    await init_db()
+    await run_online_migrations()
+    rng = random.Random(seed)
+    hashed_password = get_password_hash(PASSWORD)
+    async with ASYNC_SESSION() as session:
+        start = await session.scalar(select(func.count()).select_from(User).where(User.username.like(f"{USERNAME_PREFIX}%")))
+        user_ids = []
+        for offset in range(0, users, batch_size):
+            result = await session.execute(
+                insert(User).returning(User.id),
+                [
+                    {
+                        "first_name": "Bench",
+                        "last_name": str(i),
+                        "username": f"{USERNAME_PREFIX}{i}",
+                        "email": f"{USERNAME_PREFIX}{i}@example.com",
+                        "hashed_password": hashed_password,
+                    }
+                    for i in range(start + offset, start + min(offset + batch_size, users))
+                ],
+            )
+            user_ids.extend(result.scalars())
+        await session.commit()
+        rows = []
+        for index, user_id in enumerate(user_ids):
+            count = todos // users + (1 if index < todos % users else 0)
+            for _ in range(count):
+                rows.append({
+                    "title": _sentence(rng, rng.randint(2, 5)),
+                    "description": _sentence(rng, rng.randint(0, 12)) or None,
+                    "completed": rng.random() < 0.3,
+                    "user_id": user_id,
+                })
+                if len(rows) >= batch_size:
+                    await session.execute(insert(ToDo), rows)
+                    await session.commit()
+                    rows = []
+        if rows:
+            await session.execute(insert(ToDo), rows)
+            await session.commit()
+    return await load_dataset()
+
+
+# Пользователи бенчмарка из базы вместе с диапазонами id их задач
+async def load_dataset() -> list[BenchUser]:
+    async with READ_SESSION() as session:
+        result = await session.execute(
+            select(User.id, User.username, User.email, func.min(ToDo.id), func.max(ToDo.id))
+            .outerjoin(ToDo, ToDo.user_id == User.id)
+            .where(User.username.like(f"{USERNAME_PREFIX}%"))
+            .group_by(User.id)
+            .order_by(User.id)
+        )
+        return [BenchUser(*row) for row in result.all()]
+
+
+async def main(users: int, todos: int, batch_size: int) -> None:
+    started = time.perf_counter()
+    dataset = await seed_dataset(users, todos, batch_size)
+    await dispose_engines()
+    print(f"{DB_PATH}: {len(dataset)} bench users, +{todos} todos in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--todos", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.todos, args.batch_size))
@@ -1,7 +1,19 @@
+import asyncio
+import os
+import socketserver
+import threading
+
 import pytest
 from httpx import AsyncClient
 
+# Настройки SMTP по умолчанию, чтобы тесты запускались без .env
+os.environ.setdefault("SMTP_SERVER", "localhost")
+os.environ.setdefault("SMTP_PORT", "2525")
+os.environ.setdefault("SMTP_USER", "test@example.com")
+os.environ.setdefault("SMTP_PASSWORD", "test")
+
 from app.main import app
+from app.database.db import dispose_engines, init_db, run_online_migrations
 
 
 
@@ -14,3 +26,56 @@ def anyio_backend():
 async def async_client():
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
+
+# Миграции схемы перед тестами (ASGITransport не запускает lifespan)
+@pytest.fixture(scope="session", autouse=True)
+def prepare_database():
+    async def _prepare():
+        await init_db()
+        await run_online_migrations()
+        await dispose_engines()
+    asyncio.run(_prepare())
+
+
+# Минимальный SMTP-сервер для тестов: принимает письма без авторизации и TLS
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self._reply("220 localhost ESMTP stub")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 localhost")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                self.server.messages.append(b"".join(data).decode())
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+    def _reply(self, text: str):
+        self.wfile.write(f"{text}\r\n".encode())
+
+
+@pytest.fixture
+def smtp_stub():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -1,15 +1,48 @@
+import asyncio
 import datetime
 from datetime import UTC
+import json
+import os
 import secrets
+import types
 
+import bcrypt
 import pytest
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy import select
+from pydantic import ValidationError
+from sqlalchemy import event, func, select, text, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from app.main import app
-from app.database.db import ASYNC_SESSION
-from app.database.models import User, PasswordResetToken
-from app.utils.security import get_password_hash
+from app.core.config import Settings, settings
+from app.database.db import ASYNC_SESSION, GROUP_COMMIT_SESSION, READ_SESSION, USER_ID_RANGE, Shard, engine, init_db, run_online_migrations, shards
+from app.database.group_commit import GroupCommitCoordinator, GroupCommitLeaseExpired, GroupCommitSession, WriterConflictError
+from app.database.migrations import LATEST_VERSION, MIGRATIONS, Migration, _check_migration, migrate
+from app.database.query_plans import check_query_plans
+from app.database.rebalance import move_user
+from app.database.sharding import shard_router
+from app.database.models import User, PasswordResetToken, ToDo, EmailOutbox
+from app.utils.security import HashingUnavailableError, PasswordHasher, get_password_hash, hasher
+from app.utils.email import SMTPConnection
+from app.utils.outbox import OutboxWorker
+from app.database.crud.outbox import enqueue_email
+from app.database.crud.user import register_user, update_user, delete_user
+from app.database.crud.todo import create_todo, get_all_todos, get_todos_page, update_todo, search_todos, find_todo_counter_drift, repair_todo_counters
+from app.database.crud.user import get_all_users
+from app.schemas.todo import ToDoCreate, ToDoFilter, ToDoRead, ToDoRow, ToDoUpdate
+from app.schemas.user import UserRow
+from app.utils.responses import FastJSONResponse
+from app.schemas.user import UserCreate, UserUpdate
+from app.utils.session import SESSION_COOKIE, create_session_token, user_cache
+from app.utils.render_cache import RenderCache, render_cache
+from app.utils.templates import _bytecode_cache, templates
+from app.utils.rate_limit import MemoryRateLimitBackend
+from app.utils.concurrency import AdaptiveLimiter, ConcurrencyLimitMiddleware
+from app.utils.metrics import MetricsMiddleware, N_PLUS_ONE, REQUEST_QUERIES
+from app.utils.archiver import TodoArchiver
+from app.utils.events import todo_events
+from app.utils.reminders import ReminderScheduler, reminder_schedulers
 
 
 
@@ -83,6 +116,14 @@ async def test_password_recovery_and_reset():
         assert response.status_code == 200
         # Сообщение может быть в HTML, ищем по подстроке
         assert ("сброса пароля отправлена" in response.text.lower())
+    # Токен и письмо со ссылкой на него зафиксированы вместе
+    async with ASYNC_SESSION() as session:
+        result = await session.execute(
+            select(PasswordResetToken.token).where(PasswordResetToken.user_id == user.id).order_by(PasswordResetToken.id.desc())
+        )
+        issued = result.scalars().first()
+        result = await session.execute(select(EmailOutbox.body).where(EmailOutbox.to_email == email))
+        assert any(issued in body for body in result.scalars())
     # Создаём токен вручную (эмулируем письмо)
     token = secrets.token_urlsafe(32)
     expires_at = datetime.datetime.now(UTC) + datetime.timedelta(hours=1)
@@ -129,3 +170,1114 @@ async def test_password_recovery_and_reset():
         })
         assert response.status_code == 200
         assert ("пароли не совпадают" in response.text.lower())
+
+
+# Проверяем курсорную пагинацию списка задач
+@pytest.mark.asyncio
+async def test_todos_keyset_pagination():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(
+            first_name="Page",
+            last_name="User",
+            username=f"pageuser_{suffix}",
+            email=f"pageuser_{suffix}@example.com",
+            hashed_password="not-used",
+        )
+        session.add(user)
+        await session.flush()
+        session.add_all([ToDo(title=f"Task {i:02d}", user_id=user.id) for i in range(5)])
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        response = await ac.get("/todos/html", params={"limit": 2})
+        assert response.status_code == 200
+        assert "Task 00" in response.text and "Task 01" in response.text
+        assert "Task 02" not in response.text
+        assert "after=" in response.text and "before=" not in response.text
+        # Переходим на последнюю страницу
+        async with ASYNC_SESSION() as session:
+            ids = (await session.execute(select(ToDo.id).where(ToDo.user_id == user_id).order_by(ToDo.id))).scalars().all()
+        response = await ac.get("/todos/html", params={"limit": 2, "after": ids[3]})
+        assert "Task 04" in response.text and "Task 03" not in response.text
+        assert "before=" in response.text and "after=" not in response.text
+        response = await ac.get("/todos/html", params={"limit": 2, "before": ids[2]})
+        assert "Task 00" in response.text and "Task 01" in response.text
+        response = await ac.get("/todos/html", params={"limit": 1000})
+        assert response.status_code == 422
+
+
+# Проверяем теги, фильтры и сортировки списка задач: курсоры каждой сортировки, счётчики тегов
+@pytest.mark.asyncio
+async def test_todo_tags_filters_and_sorting():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(username=f"taguser_{suffix}", email=f"taguser_{suffix}@example.com", hashed_password="not-used")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        todos = {}
+        for title, tags in (("Delta", ["work"]), ("Alpha", ["work", "home"]), ("Charlie", []), ("Bravo", "work, urgent")):
+            response = await ac.post("/api/v1/todos", json={"title": title, "tags": tags})
+            assert response.status_code == 201
+            todos[title] = response.json()
+        assert todos["Alpha"]["tags"] == ["home", "work"] and todos["Bravo"]["tags"] == ["urgent", "work"]
+        assert (await ac.post("/api/v1/todos", json={"title": "Bad", "tags": ["x" * 51]})).status_code == 422
+        await ac.patch(f"/api/v1/todos/{todos['Alpha']['id']}", json={"completed": True})
+        await ac.patch(f"/api/v1/todos/{todos['Delta']['id']}", json={"title": "Echo"})
+
+        async def titles(**params):
+            items, cursor = [], None
+            while True:
+                response = await ac.get("/api/v1/todos", params={**params, "limit": 1, **({"after": cursor} if cursor else {})})
+                assert response.status_code == 200
+                page = response.json()
+                items += [item["title"] for item in page["items"]]
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    return items
+
+        assert await titles() == ["Echo", "Alpha", "Charlie", "Bravo"]
+        assert await titles(sort="title") == ["Alpha", "Bravo", "Charlie", "Echo"]
+        assert await titles(sort="title", order="desc", completed="false") == ["Echo", "Charlie", "Bravo"]
+        assert await titles(sort="updated", order="desc") == ["Echo", "Alpha", "Bravo", "Charlie"]
+        assert await titles(tag="work", sort="title") == ["Alpha", "Bravo", "Echo"]
+        assert await titles(tag=["work", "urgent"]) == ["Bravo"]
+        assert await titles(tag="work", completed="true") == ["Alpha"]
+        assert await titles(tag="missing") == []
+        # Назад по курсору страницы в той же сортировке
+        page = (await ac.get("/api/v1/todos", params={"sort": "title", "limit": 2, "after": (await ac.get("/api/v1/todos", params={"sort": "title", "limit": 2})).json()["next_cursor"]})).json()
+        assert [item["title"] for item in page["items"]] == ["Charlie", "Echo"]
+        back = (await ac.get("/api/v1/todos", params={"sort": "title", "limit": 2, "before": page["prev_cursor"]})).json()
+        assert [item["title"] for item in back["items"]] == ["Alpha", "Bravo"]
+        assert (await ac.get("/api/v1/todos", params={"sort": "title", "after": "garbage"})).status_code == 422
+
+        # Счётчики тегов ведут триггеры: смена тегов, выполнение и удаление задачи
+        await ac.patch(f"/api/v1/todos/{todos['Bravo']['id']}", json={"tags": ["home"], "completed": True})
+        await ac.delete(f"/api/v1/todos/{todos['Alpha']['id']}")
+        assert (await ac.get("/api/v1/tags")).json() == [
+            {"name": "home", "total": 1, "completed": 1},
+            {"name": "urgent", "total": 0, "completed": 0},
+            {"name": "work", "total": 1, "completed": 0},
+        ]
+        assert (await ac.get(f"/api/v1/todos/{todos['Bravo']['id']}")).json()["tags"] == ["home"]
+
+        response = await ac.get("/todos/html", params={"tag": "home", "status": "done", "sort": "title"})
+        assert response.status_code == 200
+        assert "Bravo" in response.text and "Echo" not in response.text and "data-filtered" in response.text
+        await ac.post(f"/todos/update/{todos['Charlie']['id']}", data={"title": "Charlie", "tags": "home, work"})
+        response = await ac.get("/todos/html", params={"tag": "home"})
+        assert "Charlie" in response.text and "Bravo" in response.text
+
+
+# Проверяем путь чтения без ORM: страницы, поиск и полный список отдают строки-dataclass
+# со __slots__, которые дают тот же JSON и ту же разметку шаблона, что и модели ToDoRead
+@pytest.mark.asyncio
+async def test_read_rows_without_orm():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(username=f"rows_{suffix}", email=f"rows_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        await ac.post("/api/v1/todos", json={"title": "Plain"})
+        await ac.post("/api/v1/todos", json={"title": "Tagged", "tags": ["b", "a"], "completed": True})
+        page = (await ac.get("/api/v1/todos")).json()
+        found = (await ac.get("/api/v1/todos/search", params={"q": "Tagged"})).json()
+    assert found["items"] == page["items"][1:] and found["items"][0]["completed"] is True
+    async with READ_SESSION() as session:
+        todos = await get_all_todos(session, user_id=user_id)
+        users = await get_all_users(session)
+        page_rows = (await get_todos_page(session, user_id, filters=ToDoFilter(sort="title"))).items
+        search_rows = (await search_todos(session, user_id, "Tagged")).items
+    assert all(type(todo) is ToDoRow for todo in todos + page_rows + search_rows) and not hasattr(todos[0], "__dict__")
+    assert [todo.title for todo in page_rows] == ["Plain", "Tagged"] and page_rows[1].tags == ["a", "b"]
+    assert json.loads(FastJSONResponse(todos).body) == page["items"]
+    assert [todo.tags for todo in todos] == [[], ["a", "b"]]
+    assert UserRow(user_id, f"rows_{suffix}", f"rows_{suffix}@example.com") in users
+    template = templates.env.get_template("partials/todo_list.html")
+    models = [ToDoRead.model_validate(item) for item in page["items"]]
+    assert template.render(todos=todos, page=None) == template.render(todos=models, page=None)
+
+
+# Проверяем асинхронное хэширование и перехэширование устаревшего хэша при входе
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_hash():
+    suffix = secrets.token_hex(4)
+    weak_hash = bcrypt.hashpw(b"weakpass", bcrypt.gensalt(4)).decode()
+    assert await hasher.verify_and_check("weakpass", weak_hash) == (True, True)
+    assert await hasher.verify_and_check("wrong", weak_hash) == (False, False)
+    async with ASYNC_SESSION() as session:
+        user = User(
+            first_name="Hash",
+            last_name="User",
+            username=f"hashuser_{suffix}",
+            email=f"hashuser_{suffix}@example.com",
+            hashed_password=weak_hash,
+        )
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/users/login", data={"username": f"hashuser_{suffix}", "password": "weakpass"}, follow_redirects=False)
+        assert response.status_code == 303
+    async with ASYNC_SESSION() as session:
+        user = await session.get(User, user_id)
+        assert user.hashed_password != weak_hash
+        assert user.hashed_password.startswith("$2b$12$")
+    assert hasher.stats()["count"] >= 3
+    # Умерший воркер ломает пул: запрос получает HashingUnavailableError, следующий — новый пул
+    pool = PasswordHasher(workers=1, max_pending=4, timeout=30)
+    try:
+        with pytest.raises(HashingUnavailableError):
+            await pool._run("hash", os._exit, 1)
+        assert await pool.verify("weakpass", weak_hash) is True
+    finally:
+        pool.shutdown()
+
+
+# Проверяем доставку очереди писем пачкой через одно SMTP-соединение
+@pytest.mark.asyncio
+async def test_outbox_delivers_batch_over_one_connection(smtp_stub):
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        ids = [(await enqueue_email(session, f"outbox_{suffix}_{i}@example.com", "Тема", f"Письмо {i}")).id for i in range(3)]
+    host, port = smtp_stub.server_address
+    worker = OutboxWorker(SMTPConnection(host, port, use_ssl=False, from_email="noreply@example.com"), batch_size=100)
+    while await worker.deliver_batch():
+        pass
+    await worker.stop()
+    assert smtp_stub.connections == 1
+    assert all(any(f"outbox_{suffix}_{i}@example.com" in m for m in smtp_stub.messages) for i in range(3))
+    async with ASYNC_SESSION() as session:
+        result = await session.execute(select(EmailOutbox).where(EmailOutbox.id.in_(ids)))
+        assert {m.status for m in result.scalars()} == {"sent"}
+
+
+# Проверяем повтор с задержкой, когда SMTP-сервер недоступен
+@pytest.mark.asyncio
+async def test_outbox_retries_with_backoff(smtp_stub):
+    async with ASYNC_SESSION() as session:
+        message_id = (await enqueue_email(session, "retry@example.com", "Тема", "Текст")).id
+        # Письмо на последней попытке: в той же пачке отмечается окончательной ошибкой
+        last_id = (await enqueue_email(session, "last@example.com", "Тема", "Текст")).id
+        await session.execute(update(EmailOutbox).where(EmailOutbox.id == last_id).values(attempts=4))
+        await session.commit()
+    host, port = smtp_stub.server_address
+    smtp_stub.shutdown()
+    smtp_stub.server_close()
+    worker = OutboxWorker(SMTPConnection(host, port, use_ssl=False, timeout=1, from_email="noreply@example.com"), batch_size=100, retry_base=60)
+    started = datetime.datetime.now(UTC)
+    await worker.deliver_batch()
+    async with ASYNC_SESSION() as session:
+        message = await session.get(EmailOutbox, message_id)
+        assert message.status == "pending"
+        assert message.attempts == 1
+        assert message.last_error
+        assert message.next_attempt_at.replace(tzinfo=UTC) >= started + datetime.timedelta(seconds=59)
+        last = await session.get(EmailOutbox, last_id)
+        assert (last.status, last.attempts) == ("failed", 5) and last.last_error
+    assert worker.retry_delay(3) == datetime.timedelta(seconds=240)
+
+
+# Проверяем профиль SQLite: WAL у писателя и запрет записи у читателей
+@pytest.mark.asyncio
+async def test_sqlite_profile_pragmas():
+    async with ASYNC_SESSION() as session:
+        assert (await session.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await session.execute(text("PRAGMA busy_timeout"))).scalar() > 0
+    async with READ_SESSION() as session:
+        assert (await session.execute(text("PRAGMA query_only"))).scalar() == 1
+        with pytest.raises(OperationalError):
+            await session.execute(text("DELETE FROM todos WHERE id = -1"))
+
+
+# Проверяем подписанные сессии и сброс кэша пользователя при изменении
+@pytest.mark.asyncio
+async def test_signed_session_and_user_cache():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(
+            first_name="Session",
+            last_name="User",
+            username=f"sessuser_{suffix}",
+            email=f"sessuser_{suffix}@example.com",
+            hashed_password=get_password_hash("sesspass"),
+        )
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/users/login", data={"username": f"sessuser_{suffix}", "password": "sesspass"}, follow_redirects=False)
+        assert response.status_code == 303
+        assert SESSION_COOKIE in response.cookies
+        response = await ac.get("/todos/html")
+        assert f"sessuser_{suffix}" in response.text
+        assert user_cache.get(user_id) is not None
+        # Изменение пользователя через crud сбрасывает кэш и переносит имя в каталоге
+        await update_user(user_id, UserUpdate(username=f"renamed_{suffix}"))
+        assert user_cache.get(user_id) is None
+        assert (await shard_router.find(username=f"renamed_{suffix}"))[0] == user_id
+        assert await shard_router.find(username=f"sessuser_{suffix}") is None
+        response = await ac.get("/todos/html")
+        assert f"renamed_{suffix}" in response.text
+    # Поддельный токен и голая кука user_id не дают доступа
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: "forged.token.value"}) as ac:
+        response = await ac.get("/todos/html")
+        assert f"renamed_{suffix}" not in response.text
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={"user_id": str(user_id)}) as ac:
+        response = await ac.post("/todos/create", data={"title": "Hijack"}, follow_redirects=False)
+        assert response.headers["location"] == "/auth/login.html"
+    # Без SECRET_KEY вне режима отладки приложение не настраивается; в отладке ключ создаётся
+    with pytest.raises(ValidationError):
+        Settings(DEBUG=False, SECRET_KEY=None)
+    assert Settings(DEBUG=True, SECRET_KEY=None).SECRET_KEY
+    assert Settings(DEBUG=False, SECRET_KEY="fixed").SECRET_KEY == "fixed"
+
+
+# Проверяем версию сессий: выход на всех устройствах и сброс пароля завершают выпущенные
+# токены; одним токеном сброса пароль меняют один раз, даже при одновременных запросах
+@pytest.mark.asyncio
+async def test_session_version_revokes_tokens():
+    suffix = secrets.token_hex(4)
+    user = await register_user(UserCreate(username=f"revoke_{suffix}", email=f"revoke_{suffix}@example.com", password="oldpass"))
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        async def issue(password: str) -> dict:
+            response = await ac.post("/api/v1/auth/token", json={"username": f"revoke_{suffix}", "password": password})
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        first, second = await issue("oldpass"), await issue("oldpass")
+        assert (await ac.get("/api/v1/users/me", headers=first)).status_code == 200
+        assert (await ac.post("/api/v1/auth/logout-all", headers=first)).status_code == 204
+        assert (await ac.get("/api/v1/users/me", headers=first)).status_code == 401
+        assert (await ac.get("/api/v1/users/me", headers=second)).status_code == 401
+        headers = await issue("oldpass")
+        assert (await ac.get("/api/v1/users/me", headers=headers)).status_code == 200
+
+        token = secrets.token_urlsafe(32)
+        async with ASYNC_SESSION() as session:
+            session.add(PasswordResetToken(user_id=user.id, token=token, expires_at=datetime.datetime.now(UTC) + datetime.timedelta(hours=1)))
+            await session.commit()
+        form = {"token": token, "password": "newpass", "confirm_password": "newpass"}
+        responses = await asyncio.gather(*(ac.post("/auth/reset-password", data=form) for _ in range(2)))
+        assert sorted("успешно" in response.text for response in responses) == [False, True]
+        assert (await ac.get("/api/v1/users/me", headers=headers)).status_code == 401
+        assert (await ac.post("/api/v1/auth/token", json={"username": f"revoke_{suffix}", "password": "oldpass"})).status_code == 401
+        assert (await ac.get("/api/v1/users/me", headers=await issue("newpass"))).status_code == 200
+    async with READ_SESSION() as session:
+        assert await session.scalar(select(func.count()).select_from(PasswordResetToken).where(PasswordResetToken.token == token)) == 0
+    await delete_user(user.id)
+
+# Проверяем пакетные операции над задачами и проверку владельца
+@pytest.mark.asyncio
+async def test_bulk_todo_operations():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        owner = User(first_name="Bulk", last_name="User", username=f"bulk_{suffix}", email=f"bulk_{suffix}@example.com", hashed_password="x")
+        other = User(first_name="Other", last_name="User", username=f"other_{suffix}", email=f"other_{suffix}@example.com", hashed_password="x")
+        session.add_all([owner, other])
+        await session.flush()
+        foreign = ToDo(title="Foreign", user_id=other.id)
+        session.add(foreign)
+        await session.commit()
+        owner_id, foreign_id = owner.id, foreign.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(owner_id)}) as ac:
+        response = await ac.post("/todos/bulk/create", json={"items": [{"title": f"Bulk {i}"} for i in range(5)]})
+        assert response.status_code == 200
+        ids = response.json()["ids"]
+        assert response.json()["count"] == 5
+        response = await ac.post("/todos/bulk/complete", json={"ids": ids[:3] + [foreign_id]})
+        assert response.json()["count"] == 3
+        response = await ac.post("/todos/bulk/delete", json={"ids": [ids[4], foreign_id]})
+        assert response.json()["count"] == 1
+        response = await ac.post("/todos/bulk/delete-completed")
+        assert response.json()["count"] == 3
+    async with ASYNC_SESSION() as session:
+        remaining = (await session.execute(select(ToDo.id).where(ToDo.user_id == owner_id))).scalars().all()
+        assert remaining == [ids[3]]
+        assert await session.get(ToDo, foreign_id) is not None
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/todos/bulk/delete-completed")
+        assert response.status_code == 401
+
+
+# Проверяем изменение и удаление через UPDATE/DELETE ... RETURNING
+@pytest.mark.asyncio
+async def test_returning_mutations():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Ret", last_name="User", username=f"ret_{suffix}", email=f"ret_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.flush()
+        todo = ToDo(title="Before", user_id=user.id)
+        session.add(todo)
+        await session.commit()
+        user_id, todo_id = user.id, todo.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        response = await ac.post(f"/todos/update/{todo_id}", data={"title": "After", "completed": "true"}, follow_redirects=False)
+        assert response.status_code == 303
+        response = await ac.post("/todos/update/999999999", data={"title": "Missing"}, follow_redirects=False)
+        assert response.status_code == 404
+    async with ASYNC_SESSION() as session:
+        updated = await update_todo(session, todo_id, ToDoUpdate(description="desc"), user_id=user_id)
+        assert (updated.title, updated.description, updated.completed) == ("After", "desc", True)
+        assert await update_todo(session, todo_id, ToDoUpdate(title="Nope"), user_id=user_id + 1) is None
+    # Удаление через crud освобождает имя в каталоге — его можно занять снова
+    assert await delete_user(user_id) is True
+    assert await delete_user(user_id) is False
+    assert await shard_router.find(username=f"ret_{suffix}") is None
+    async with ASYNC_SESSION() as session:
+        assert await session.get(ToDo, todo_id) is None
+    again = await register_user(UserCreate(username=f"ret_{suffix}", email=f"ret_{suffix}@example.com", password="retpass"))
+    assert (await shard_router.find(username=f"ret_{suffix}"))[0] == again.id
+    assert await delete_user(again.id) is True
+
+
+# Проверяем полнотекстовый поиск: ранжирование, префиксы, синхронизация и границы пользователя
+@pytest.mark.asyncio
+async def test_full_text_search():
+    suffix = secrets.token_hex(4)
+    word = f"zebra{suffix}"
+    async with ASYNC_SESSION() as session:
+        owner = User(first_name="Fts", last_name="User", username=f"fts_{suffix}", email=f"fts_{suffix}@example.com", hashed_password="x")
+        other = User(first_name="Fts", last_name="Other", username=f"fts2_{suffix}", email=f"fts2_{suffix}@example.com", hashed_password="x")
+        session.add_all([owner, other])
+        await session.flush()
+        in_description = ToDo(title="Первая", description=f"про {word}", user_id=owner.id)
+        in_title = ToDo(title=f"Купить {word}", description="", user_id=owner.id)
+        foreign = ToDo(title=f"Чужая {word}", user_id=other.id)
+        session.add_all([in_description, in_title, foreign])
+        await session.commit()
+        owner_id = owner.id
+    async with READ_SESSION() as session:
+        results = await search_todos(session, owner_id, word)
+        assert [t.title for t in results.items] == [f"Купить {word}", "Первая"]
+        results = await search_todos(session, owner_id, word[:-2])
+        assert len(results.items) == 2
+        assert (await search_todos(session, owner_id, f"u{owner_id}")).items == []
+        assert (await search_todos(session, owner_id, '" * (')).items == []
+    async with ASYNC_SESSION() as session:
+        await update_todo(session, in_title.id, ToDoUpdate(title="Переименована"))
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(owner_id)}) as ac:
+        response = await ac.get("/todos/search", params={"q": word})
+        assert response.status_code == 200
+        assert "Первая" in response.text
+        assert "Переименована" not in response.text and "Чужая" not in response.text
+
+
+# Проверяем JSON API v1: токен, CRUD задач и изоляцию пользователей
+@pytest.mark.asyncio
+async def test_json_api_v1():
+    suffix = secrets.token_hex(4)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/v1/users", json={"username": f"api_{suffix}", "email": f"api_{suffix}@example.com", "password": "apipass"})
+        assert response.status_code == 201
+        user_id = response.json()["id"]
+        response = await ac.post("/api/v1/users", json={"username": f"api_{suffix}", "email": f"api2_{suffix}@example.com", "password": "apipass"})
+        assert response.status_code == 409
+        response = await ac.post("/api/v1/auth/token", json={"username": f"api_{suffix}", "password": "wrong"})
+        assert response.status_code == 401
+        response = await ac.post("/api/v1/auth/token", json={"username": f"api_{suffix}", "password": "apipass"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        assert (await ac.get("/api/v1/todos")).status_code == 401
+        response = await ac.get("/api/v1/users/me", headers=headers)
+        assert response.json() == {"id": user_id, "username": f"api_{suffix}", "email": f"api_{suffix}@example.com"}
+        response = await ac.post("/api/v1/todos", json={"title": "Api task"}, headers=headers)
+        assert response.status_code == 201
+        todo = response.json()
+        assert todo == {"id": todo["id"], "title": "Api task", "description": None, "completed": False, "due_at": None, "remind_at": None, "tags": []}
+        response = await ac.patch(f"/api/v1/todos/{todo['id']}", json={"completed": True}, headers=headers)
+        assert response.json()["completed"] is True
+        response = await ac.get("/api/v1/todos", headers=headers)
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == {"items": [{**todo, "completed": True}], "next_cursor": None, "prev_cursor": None}
+        assert (await ac.delete(f"/api/v1/todos/{todo['id']}", headers=headers)).status_code == 204
+        assert (await ac.get(f"/api/v1/todos/{todo['id']}", headers=headers)).status_code == 404
+        # Пул хэширования переполнен: смена пароля — 503 с Retry-After, новое имя не занимается
+        max_pending, hasher.max_pending = hasher.max_pending, 0
+        try:
+            response = await ac.patch("/api/v1/users/me", json={"username": f"api2_{suffix}", "password": "newpass"}, headers=headers)
+        finally:
+            hasher.max_pending = max_pending
+        assert response.status_code == 503 and int(response.headers["Retry-After"]) >= 1
+        assert await shard_router.find(username=f"api2_{suffix}") is None
+        assert (await ac.get("/api/v1/users/me", headers=headers)).json()["username"] == f"api_{suffix}"
+        # Имя занято пользователем без записи в каталоге: конфликт в шарде, когда сессия запроса
+        # уже держит писателя, — откат каталога не должен ждать того же соединения
+        async with ASYNC_SESSION() as session:
+            session.add(User(first_name="Api", last_name="Taken", username=f"taken_{suffix}", email=f"taken_{suffix}@example.com", hashed_password="x"))
+            await session.commit()
+        response = await asyncio.wait_for(ac.patch("/api/v1/users/me", json={"username": f"taken_{suffix}"}, headers=headers), 10)
+        assert response.status_code == 409
+        assert (await shard_router.find(username=f"api_{suffix}"))[0] == user_id
+        assert (await ac.delete("/api/v1/users/me", headers=headers)).status_code == 204
+        assert (await ac.get("/api/v1/users/me", headers=headers)).status_code == 401
+
+
+# Проверяем условный GET: 304 при неизменном списке и новый ETag после изменения
+@pytest.mark.asyncio
+async def test_todos_conditional_get():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Etag", last_name="User", username=f"etag_{suffix}", email=f"etag_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        response = await ac.get("/todos/html")
+        etag = response.headers["etag"]
+        response = await ac.get("/todos/html", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert (await ac.get("/todos/html", params={"limit": 5}, headers={"If-None-Match": etag})).status_code == 200
+        await ac.post("/todos/create", data={"title": "Etag task"})
+        response = await ac.get("/todos/html", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert "Etag task" in response.text
+        etag = response.headers["etag"]
+        await ac.post("/todos/bulk/create", json={"items": [{"title": "More"}]})
+        assert (await ac.get("/todos/html", headers={"If-None-Match": etag})).status_code == 200
+
+
+# Проверяем кэш отрендеренного списка: попадания, сброс при изменении и предел памяти
+@pytest.mark.asyncio
+async def test_render_cache():
+    assert templates.env.bytecode_cache is not None
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Cache", last_name="User", username=f"cache_{suffix}", email=f"cache_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        await ac.post("/todos/create", data={"title": "Cached task"})
+        hits = render_cache.hits
+        first = await ac.get("/todos/html")
+        second = await ac.get("/todos/html")
+        assert render_cache.hits == hits + 1
+        assert first.text == second.text and "Cached task" in second.text
+        await ac.post("/todos/create", data={"title": "Fresh task"})
+        assert not any(key[0] == user_id for key in render_cache._entries)
+        assert "Fresh task" in (await ac.get("/todos/html")).text
+    cache = RenderCache(max_bytes=2000, max_entry_bytes=1500)
+    for i in range(5):
+        cache.put(1, (1, i), "x" * 800, 0.01)
+    assert cache.size <= 2000 and cache.get((1, 0)) is None and cache.get((1, 4)) is not None
+    cache.put(2, (2, 0), "x" * 5000, 0.01)
+    assert cache.get((2, 0)) is None
+    assert cache.stats()["saved_ms"] == pytest.approx(10)
+
+
+# Проверяем каталог кэша байткода: отсутствующий создаётся, а если создать его нельзя,
+# шаблоны работают без кэша
+def test_bytecode_cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "fresh" / "jinja"
+    monkeypatch.setattr(settings, "TEMPLATE_CACHE_DIR", str(cache_dir))
+    assert _bytecode_cache() is not None
+    assert cache_dir.is_dir()
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    monkeypatch.setattr(settings, "TEMPLATE_CACHE_DIR", str(blocker / "jinja"))
+    assert _bytecode_cache() is None
+
+
+# Проверяем миграции: все версии записаны, повторный запуск ничего не применяет,
+# а основные запросы используют индексы
+@pytest.mark.asyncio
+async def test_migrations_and_query_plans():
+    assert await init_db() == []
+    async with engine.connect() as conn:
+        versions = (await conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))).scalars().all()
+    assert versions == list(range(1, LATEST_VERSION + 1))
+    assert await check_query_plans() == {}
+
+
+# Проверяем миграции на отдельном файле БД: блокирующие применимы повторно, фоновые берут
+# соединение писателя на каждый индекс, а не на весь прогон, а ONLINE-миграция не может задать upgrade
+@pytest.mark.asyncio
+async def test_online_migrations_release_writer(tmp_path):
+    shard = Shard(len(shards), str(tmp_path / "migrations.db"))
+    try:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(migrate, shard.number)
+            # Блокирующие миграции применимы повторно, а каталог пользователей заполняется только в шарде 0
+            await conn.execute(text("INSERT INTO users (username, email, hashed_password) VALUES ('dir', 'dir@example.com', 'x')"))
+            for migration in MIGRATIONS:
+                if not migration.online:
+                    await conn.run_sync(migration.upgrade)
+            assert (await conn.execute(text("SELECT count(*) FROM user_directory"))).scalar() == 0
+            await conn.execute(text("DELETE FROM users"))
+        online = [m for m in MIGRATIONS if m.online]
+        checkouts = []
+        listener = lambda *args: checkouts.append(1)
+        event.listen(shard.engine.sync_engine, "checkout", listener)
+        try:
+            assert await run_online_migrations([shard]) == [m.version for m in online]
+        finally:
+            event.remove(shard.engine.sync_engine, "checkout", listener)
+        # Список ожидающих, по соединению на инструкцию и на запись каждой версии
+        assert len(checkouts) == 1 + sum(len(m.steps) + 1 for m in online)
+        async with shard.engine.connect() as conn:
+            indexes = set((await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))).scalars())
+            versions = (await conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))).scalars().all()
+        assert {"ix_todos_user_title_id", "ix_todos_remind_at"} <= indexes
+        assert versions == list(range(1, LATEST_VERSION + 1))
+        assert await run_online_migrations([shard]) == []
+    finally:
+        await shard.dispose()
+    module = types.ModuleType("m9999_bad")
+    module.ONLINE, module.STATEMENTS, module.upgrade = True, [], lambda conn: None
+    with pytest.raises(RuntimeError):
+        _check_migration(Migration(9999, "bad", module))
+
+
+# Проверяем ограничение частоты входа: по имени пользователя и по IP, ответ 429 с Retry-After
+@pytest.mark.asyncio
+async def test_login_rate_limit():
+    suffix = secrets.token_hex(4)
+    transport = ASGITransport(app=app, client=(f"10.13.{secrets.randbelow(250)}.{secrets.randbelow(250)}", 1234))
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        form = {"username": f"Limited_{suffix}", "password": "wrong"}
+        statuses = [(await ac.post("/users/login", data=form)).status_code for _ in range(6)]
+        assert statuses == [200] * 5 + [429]
+        # Тот же пользователь через API — общая корзина, имя сравнивается без учёта регистра
+        response = await ac.post("/api/v1/auth/token", json={"username": f"limited_{suffix}", "password": "wrong"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        # Другое имя с того же IP пока проходит
+        response = await ac.post("/users/login", data={"username": f"other_{suffix}", "password": "wrong"})
+        assert response.status_code == 200
+    backend = MemoryRateLimitBackend(maxsize=2)
+    assert await backend.acquire("a", 1, 60) == 0
+    assert await backend.acquire("a", 1, 60) == pytest.approx(60, rel=0.01)
+    for key in ("b", "c", "d"):
+        await backend.acquire(key, 1, 60)
+    assert len(backend) == 2 and backend.rejected == 1
+
+
+# Проверяем ограничение одновременных запросов: перегруженный вход получает 503 с Retry-After,
+# чтение в своём классе при этом отвечает; лимит растёт при ровной задержке и падает при её росте
+@pytest.mark.asyncio
+async def test_concurrency_limit_sheds_overloaded_class():
+    release_login = asyncio.Event()
+
+    async def backend(scope, receive, send):
+        if scope["path"] == "/users/login":
+            await release_login.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    limiters = {
+        "auth": AdaptiveLimiter("auth", limit=1, max_limit=1, max_queue=1, queue_timeout=5),
+        "read": AdaptiveLimiter("read", limit=1, max_limit=4, max_queue=4, queue_timeout=5),
+    }
+    middleware = ConcurrencyLimitMiddleware(backend, limiters=limiters, auth_paths=("/users/login",))
+    async with AsyncClient(transport=ASGITransport(app=middleware), base_url="http://test") as ac:
+        running = asyncio.create_task(ac.post("/users/login"))
+        queued = asyncio.create_task(ac.post("/users/login"))
+        while limiters["auth"].queued < 1:
+            await asyncio.sleep(0.001)
+        response = await ac.post("/users/login")
+        assert response.status_code == 503 and int(response.headers["Retry-After"]) >= 1
+        # Чтение и статика не ждут вход
+        assert (await ac.get("/todos/html")).status_code == 200
+        assert (await ac.get("/static/style.css")).status_code == 200
+        release_login.set()
+        assert [r.status_code for r in await asyncio.gather(running, queued)] == [200, 200]
+    assert limiters["auth"].stats() == {"limit": 1, "in_flight": 0, "queued": 0, "admitted": 2, "rejected": 1}
+
+    # Ожидание в очереди дольше queue_timeout — отказ, место не теряется
+    limiter = AdaptiveLimiter("test", limit=1, max_limit=8, max_queue=2, queue_timeout=0.01)
+    assert await limiter.acquire()
+    assert not await limiter.acquire()
+    limiter.release()
+    assert limiter.in_flight == 0 and limiter.queued == 0
+    # Загруженный лимит при ровной задержке растёт до max_limit, при росте задержки — снижается
+    limiter.in_flight = 8
+    for _ in range(100):
+        limiter.observe(0.01)
+    assert limiter.capacity == 8
+    for _ in range(20):
+        limiter.observe(0.2)
+    assert limiter.capacity < 4
+    limiter.in_flight = 0
+
+
+# Проверяем /metrics: задержки по шаблону маршрута, SQL в разрезе запроса, рендер шаблонов и признак N+1
+@pytest.mark.asyncio
+async def test_metrics_endpoint(monkeypatch):
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Metrics", last_name="User", username=f"metrics_{suffix}", email=f"metrics_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        queries = REQUEST_QUERIES.count("/todos/html")
+        await ac.get("/todos/html")
+        await ac.get("/api/v1/todos/999999999")
+        assert REQUEST_QUERIES.count("/todos/html") == queries + 1
+        # Без токена метрики не отдаются никому
+        monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+        assert (await ac.get("/metrics")).status_code == 404
+        monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+        assert (await ac.get("/metrics")).status_code == 401
+        assert (await ac.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+        response = await ac.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/v1/todos/{todo_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/todos/html",le="+Inf"}' in body
+    assert 'db_queries_total{engine="reader"}' in body
+    assert 'template_render_seconds_count{template="index.html"}' in body
+    assert "render_cache_lookups_total" in body and "/metrics" not in body
+
+    # Один и тот же запрос в цикле внутри HTTP-запроса — признак N+1
+    async def n_plus_one_app(scope, receive, send):
+        async with READ_SESSION() as session:
+            for todo_id in range(12):
+                await session.execute(select(ToDo.title).where(ToDo.id == todo_id))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    before = N_PLUS_ONE.value("unmatched")
+    async with AsyncClient(transport=ASGITransport(app=MetricsMiddleware(n_plus_one_app)), base_url="http://test") as ac:
+        await ac.get("/loop")
+    assert N_PLUS_ONE.value("unmatched") == before + 1
+
+    # Упавший запрос не оставляет время начала на соединении
+    async with READ_SESSION() as session:
+        connection = await session.connection()
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                await session.execute(text("SELECT * FROM no_such_table"))
+        assert "query_started" not in connection.info
+
+
+# Проверяем счётчики задач: обновление в той же транзакции, эндпоинт статистики и исправление расхождений
+@pytest.mark.asyncio
+async def test_todo_counters():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Count", last_name="User", username=f"count_{suffix}", email=f"count_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        ids = (await ac.post("/todos/bulk/create", json={"items": [{"title": f"Item {i}"} for i in range(4)]})).json()["ids"]
+        await ac.post("/todos/bulk/complete", json={"ids": ids[:3]})
+        await ac.post(f"/todos/update/{ids[0]}", data={"title": "Item 0"})
+        await ac.post(f"/todos/delete/{ids[1]}")
+        stats = (await ac.get("/api/v1/todos/stats")).json()
+        assert (stats["total"], stats["completed"]) == (3, 1)
+        assert "Выполнено 1 из 3" in (await ac.get("/todos/html")).text
+    async with ASYNC_SESSION() as session:
+        await session.execute(text("UPDATE user_todo_stats SET total = 100 WHERE user_id = :id"), {"id": user_id})
+        await session.commit()
+        drift = await find_todo_counter_drift(session)
+        assert [(d.user_id, d.stored_total, d.actual_total) for d in drift] == [(user_id, 100, 3)]
+        assert len(await repair_todo_counters(session)) == 1
+        assert await find_todo_counter_drift(session) == []
+
+
+# Проверяем архивацию: старые выполненные задачи уходят из горячей таблицы пачками и видны в архиве
+@pytest.mark.asyncio
+async def test_archive_completed_todos():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Archive", last_name="User", username=f"archive_{suffix}", email=f"archive_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        ids = (await ac.post("/todos/bulk/create", json={"items": [{"title": f"Old {i}"} for i in range(5)] + [{"title": "Fresh", "completed": True}]})).json()["ids"]
+        await ac.post("/todos/bulk/complete", json={"ids": ids[:3]})
+        async with ASYNC_SESSION() as session:
+            completed_at = (await session.execute(select(ToDo.completed_at).where(ToDo.id == ids[0]))).scalar_one()
+            assert completed_at is not None
+            await session.execute(
+                text("UPDATE todos SET completed_at = datetime('now', '-40 days') WHERE id IN (:a, :b, :c)"),
+                {"a": ids[0], "b": ids[1], "c": ids[2]},
+            )
+            await session.commit()
+        assert await TodoArchiver(age_days=30, batch_size=2).run_once() >= 3
+        hot = (await ac.get("/api/v1/todos")).json()["items"]
+        assert [t["title"] for t in hot] == ["Old 3", "Old 4", "Fresh"]
+        assert (await ac.get("/api/v1/todos/stats")).json()["total"] == 3
+        archived = (await ac.get("/api/v1/todos/archived", params={"limit": 2})).json()
+        assert [t["id"] for t in archived["items"]] == ids[:2] and archived["next_cursor"] == ids[1]
+        assert archived["items"][0]["archived_at"]
+        back = (await ac.get("/api/v1/todos/archived", params={"before": ids[2]})).json()
+        assert [t["id"] for t in back["items"]] == ids[:2] and back["prev_cursor"] is None and back["next_cursor"] == ids[1]
+        page = await ac.get("/todos/archived", params={"after": ids[1]})
+        assert "Old 2" in page.text and "Old 3" not in page.text
+
+
+# Проверяем экспорт потоком (NDJSON, CSV) и импорт пачками с ошибками по строкам
+@pytest.mark.asyncio
+async def test_export_and_import_todos():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Export", last_name="User", username=f"export_{suffix}", email=f"export_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        items = [
+            {"title": "Plain"},
+            {"title": 'Quoted "name", comma', "description": "line 1\nline 2", "completed": True, "tags": ["work", "home; garden"]},
+        ]
+        await ac.post("/todos/bulk/create", json={"items": items})
+        ndjson = await ac.get("/api/v1/todos/export")
+        assert ndjson.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in ndjson.text.splitlines()]
+        assert [(r["title"], r["description"], r["completed"], r["archived"], r["tags"]) for r in rows] == [
+            ("Plain", None, False, False, []),
+            ('Quoted "name", comma', "line 1\nline 2", True, False, ["home; garden", "work"]),
+        ]
+        exported_csv = (await ac.get("/api/v1/todos/export", params={"format": "csv"})).text
+        assert exported_csv.startswith("id,title,description,completed,due_at,remind_at,completed_at,archived,tags\n")
+
+        # CSV из экспорта загружается обратно как есть, вместе с тегами
+        result = await ac.post("/api/v1/todos/import", files={"file": ("todos.csv", exported_csv.encode(), "text/csv")})
+        assert result.json() == {"imported": 2, "failed": 0, "chunks": 1, "errors": []}
+        tags = {t["name"]: t["total"] for t in (await ac.get("/api/v1/tags")).json()}
+        assert tags == {"home; garden": 2, "work": 2}
+        rows = [json.loads(line) for line in (await ac.get("/api/v1/todos/export")).text.splitlines()]
+        assert [r["tags"] for r in rows[2:]] == [[], ["home; garden", "work"]]
+        # Строка длиннее IMPORT_MAX_LINE_LENGTH отклоняется целиком
+        too_long = b'{"title": "' + b"x" * settings.IMPORT_MAX_LINE_LENGTH + b'"}\n'
+        result = await ac.post("/api/v1/todos/import", params={"format": "ndjson"}, content=too_long)
+        assert result.status_code == 413 and result.json()["detail"].startswith("Line 1 ")
+        body = b'{"title": "A"}\n\nnot json\n{"description": "no title"}\n{"title": "B", "completed": true}'
+        result = await ac.post(
+            "/api/v1/todos/import", params={"format": "ndjson"}, content=body, headers={"Content-Type": "application/octet-stream"}
+        )
+        summary = result.json()
+        assert (summary["imported"], summary["failed"]) == (2, 2)
+        assert [e["line"] for e in summary["errors"]] == [3, 4] and summary["errors"][1]["error"].startswith("title")
+        assert (await ac.post("/api/v1/todos/import", content=b"x")).status_code == 415
+        stats = (await ac.get("/api/v1/todos/stats")).json()
+        assert (stats["total"], stats["completed"]) == (6, 3)
+        titles = [t["title"] for t in (await ac.get("/api/v1/todos", params={"limit": 10})).json()["items"]]
+        assert titles[2:] == ["Plain", 'Quoted "name", comma', "A", "B"]
+
+
+# Проверяем групповую фиксацию: параллельные сессии попадают в одну транзакцию,
+# а ошибка одной из них откатывает только её SAVEPOINT
+@pytest.mark.asyncio
+async def test_group_commit_sessions():
+    suffix = secrets.token_hex(4)
+    coordinator = GroupCommitCoordinator(engine, window=0.05, max_batch=10)
+    factory = async_sessionmaker(
+        bind=engine,
+        class_=GroupCommitSession,
+        expire_on_commit=False,
+        join_transaction_mode="create_savepoint",
+        info={"group_commit": coordinator},
+    )
+
+    async def register(name: str):
+        async with factory() as session:
+            session.add(User(first_name="Group", last_name="Commit", username=name, email=f"{name}@example.com", hashed_password="x"))
+            try:
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                return False
+            return True
+
+    names = [f"group_{suffix}_{i}" for i in range(5)] + [f"group_{suffix}_0"]
+    results = await asyncio.gather(*(register(name) for name in names))
+    await coordinator.stop()
+    assert results == [True] * 5 + [False]
+    assert coordinator.stats() == {"batches": 1, "jobs": 6, "failed_batches": 0, "expired_leases": 0}
+    async with READ_SESSION() as session:
+        count = await session.scalar(select(func.count()).select_from(User).where(User.username.like(f"group_{suffix}_%")))
+    assert count == 5
+
+
+# Проверяем чтение после commit() в сессии групповой фиксации: теги в update_todo читаются
+# из пула читателей, а не занимают писателя второй раз
+@pytest.mark.asyncio
+async def test_group_commit_reads_after_commit():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="After", last_name="Commit", username=f"after_{suffix}", email=f"after_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        todo = await create_todo(session, ToDoCreate(title="Tagged", tags=["x"]), user_id=user.id)
+    coordinator = shards[0].coordinator
+    jobs = coordinator.stats()["jobs"]
+    async with GROUP_COMMIT_SESSION() as session:
+        updated = await update_todo(session, todo.id, ToDoUpdate(completed=True), user_id=user.id)
+    assert updated.completed and updated.tags == ["x"]
+    assert coordinator.stats()["jobs"] == jobs + 1
+    await coordinator.stop()
+    await delete_user(user.id)
+
+# Проверяем аренду места в пачке: сессия, задержавшая соединение писателя, теряет свои
+# изменения, а следующая сессия пишет не дожидаясь её; смешение сессий в одной задаче — ошибка
+@pytest.mark.asyncio
+async def test_group_commit_lease():
+    suffix = secrets.token_hex(4)
+    coordinator = GroupCommitCoordinator(engine, window=0.05, max_batch=10, lease=0.1)
+    factory = async_sessionmaker(
+        bind=engine,
+        class_=GroupCommitSession,
+        expire_on_commit=False,
+        join_transaction_mode="create_savepoint",
+        info={"group_commit": coordinator},
+    )
+
+    def new_user(name: str) -> User:
+        return User(first_name="Lease", last_name="User", username=name, email=f"{name}@example.com", hashed_password="x")
+
+    async def slow():
+        async with factory() as session:
+            session.add(new_user(f"lease_{suffix}_slow"))
+            await session.flush()
+            await asyncio.sleep(0.3)
+            with pytest.raises(GroupCommitLeaseExpired):
+                await session.commit()
+
+    async def fast():
+        await asyncio.sleep(0.01)
+        async with factory() as session:
+            session.add(new_user(f"lease_{suffix}_fast"))
+            await session.commit()
+
+    await asyncio.wait_for(asyncio.gather(slow(), fast()), 2)
+
+    async with factory() as session:
+        await session.execute(select(1))
+        with pytest.raises(WriterConflictError):
+            await coordinator.acquire()
+        await session.rollback()
+    await coordinator.stop()
+    assert coordinator.stats()["expired_leases"] == 1
+    async with READ_SESSION() as session:
+        names = set(await session.scalars(select(User.username).where(User.username.like(f"lease_{suffix}_%"))))
+    assert names == {f"lease_{suffix}_fast"}
+
+
+# Проверяем выход из сессий групповой фиксации: IntegrityError доходит до вызывающего и не
+# держит место в пачке, выход без commit() (только чтение или исключение после flush)
+# откатывает SAVEPOINT сессии, и общий COMMIT её изменения не фиксирует
+@pytest.mark.asyncio
+async def test_group_commit_session_exits():
+    suffix = secrets.token_hex(4)
+    coordinator = GroupCommitCoordinator(engine, window=0.01, max_batch=10, lease=0.5)
+    factory = async_sessionmaker(
+        bind=engine,
+        class_=GroupCommitSession,
+        expire_on_commit=False,
+        join_transaction_mode="create_savepoint",
+        info={"group_commit": coordinator},
+    )
+
+    def new_user(name: str) -> User:
+        return User(first_name="Exit", last_name="User", username=name, email=f"{name}@example.com", hashed_password="x")
+
+    async with factory() as session:
+        session.add(new_user(f"exit_{suffix}_kept"))
+        await session.commit()
+    async with factory() as session:
+        session.add(new_user(f"exit_{suffix}_kept"))
+        with pytest.raises(IntegrityError):
+            await asyncio.wait_for(session.commit(), 2)
+        await session.rollback()
+
+    async with factory() as session:
+        assert await session.scalar(select(func.count()).select_from(User).where(User.username == f"exit_{suffix}_kept")) == 1
+
+    with pytest.raises(ValueError):
+        async with factory() as session:
+            session.add(new_user(f"exit_{suffix}_aborted"))
+            await session.flush()
+            raise ValueError("abort")
+
+    async with factory() as session:
+        session.add(new_user(f"exit_{suffix}_after"))
+        await asyncio.wait_for(session.commit(), 2)
+    await coordinator.stop()
+    assert coordinator.stats()["expired_leases"] == 0
+    async with READ_SESSION() as session:
+        names = set(await session.scalars(select(User.username).where(User.username.like(f"exit_{suffix}_%"))))
+    assert names == {f"exit_{suffix}_kept", f"exit_{suffix}_after"}
+
+
+# Проверяем живые обновления: маршруты публикуют события со строкой списка,
+# переполненная очередь сворачивается в reload, число подключений ограничено
+@pytest.mark.asyncio
+async def test_todo_live_events():
+    suffix = secrets.token_hex(4)
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Live", last_name="User", username=f"live_{suffix}", email=f"live_{suffix}@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    subscription = todo_events.subscribe(user_id)
+    stream = todo_events.stream(subscription)
+    assert (await anext(stream)).startswith(b"retry:")
+
+    async def next_event():
+        event, data = (await asyncio.wait_for(anext(stream), 1)).decode().strip().split("\n")
+        return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+    headers = {"X-Requested-With": "fetch"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        assert (await ac.post("/todos/create", data={"title": "Live <b>row</b>"}, headers=headers)).status_code == 204
+        event, data = await next_event()
+        todo_id = data["id"]
+        assert event == "todo-created" and data["stats"] == {"total": 1, "completed": 0}
+        assert f'data-id="{todo_id}"' in data["html"] and "Live &lt;b&gt;row&lt;/b&gt;" in data["html"]
+        await ac.patch(f"/api/v1/todos/{todo_id}", json={"completed": True})
+        event, data = await next_event()
+        assert event == "todo-updated" and data["stats"]["completed"] == 1 and "completed" in data["html"]
+        response = await ac.post(f"/todos/delete/{todo_id}")
+        assert response.status_code == 303
+        assert await next_event() == ("todo-deleted", {"id": todo_id, "stats": {"total": 0, "completed": 0}})
+
+        extra = [todo_events.subscribe(user_id) for _ in range(todo_events.max_subscribers_per_user - 1)]
+        assert (await ac.get("/todos/events")).status_code == 429
+        for other in extra:
+            todo_events.unsubscribe(other)
+
+    for i in range(todo_events.queue_size + 5):
+        todo_events.publish(user_id, "todo-deleted", {"id": i})
+    assert subscription.overflowed and subscription.queue.qsize() == 1
+    event, _ = await next_event()
+    assert event == "reload"
+    todo_events.close()
+    with pytest.raises(StopAsyncIteration):
+        while True:
+            await anext(stream)
+    assert not todo_events.has_subscribers(user_id)
+
+
+# Проверяем напоминания: окно планировщика, реакцию на правки через формы и API,
+# письма пачкой (одно на пользователя) и дочитывание окна по индексу
+@pytest.mark.asyncio
+async def test_todo_reminders():
+    suffix = secrets.token_hex(4)
+    email = f"remind_{suffix}@example.com"
+    async with ASYNC_SESSION() as session:
+        user = User(first_name="Remind", last_name="User", username=f"remind_{suffix}", email=email, hashed_password="x")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+
+    async def outbox():
+        async with ASYNC_SESSION() as session:
+            result = await session.execute(select(EmailOutbox.subject, EmailOutbox.body).where(EmailOutbox.to_email == email))
+            return result.all()
+
+    now = datetime.datetime.now(UTC).replace(tzinfo=None, second=0, microsecond=0)
+    past = (now - datetime.timedelta(minutes=5)).isoformat()
+    reminder_scheduler = reminder_schedulers[0]
+    await reminder_scheduler.resync()
+    scheduled = len(reminder_scheduler)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", cookies={SESSION_COOKIE: create_session_token(user_id)}) as ac:
+        await ac.post("/todos/create", data={"title": "Call", "remind_at": (now + datetime.timedelta(minutes=30)).isoformat()})
+        call = (await ac.get("/api/v1/todos")).json()["items"][0]
+        assert len(reminder_scheduler) == scheduled + 1
+        # Правка через форму переносит напоминание на уже наступившее время
+        await ac.post(f"/todos/update/{call['id']}", data={"title": "Call", "due_at": "2030-01-02T10:00", "remind_at": past})
+        later = (await ac.post("/api/v1/todos", json={"title": "Later", "remind_at": (now + datetime.timedelta(hours=5)).isoformat()})).json()
+        done = (await ac.post("/api/v1/todos", json={"title": "Done", "completed": True, "remind_at": past})).json()
+        assert len(reminder_scheduler) == scheduled + 2
+
+        assert await reminder_scheduler.run_due() >= 2
+        assert await outbox() == [("Напоминание ToDoList: Call", "Здравствуйте, Remind!\n\nНапоминаем о задачах:\n- Call (срок: 2030-01-02 10:00 UTC)")]
+        assert (await ac.get(f"/api/v1/todos/{call['id']}")).json()["remind_at"] is None
+        assert (await ac.get(f"/api/v1/todos/{done['id']}")).json()["remind_at"] is None
+        assert (await ac.get(f"/api/v1/todos/{later['id']}")).json()["remind_at"] is not None
+
+        # Окно на одно напоминание: второе дочитывается по индексу после срабатывания первого
+        await ac.patch(f"/api/v1/todos/{later['id']}", json={"remind_at": past})
+        await ac.patch(f"/api/v1/todos/{call['id']}", json={"remind_at": past})
+    notified = []
+    scheduler = ReminderScheduler(capacity=1, on_enqueued=lambda: notified.append(True))
+    await scheduler.resync()
+    assert len(scheduler) == 1
+    assert await scheduler.run_due() == 1
+    assert await scheduler.refill() == 1
+    assert await scheduler.run_due() == 1
+    assert len(notified) == 2 and len(await outbox()) == 3
+    await reminder_scheduler.resync()
+
+
+# Проверяем шардирование на втором файле БД: регистрация в шарде по хэшу имени с id из его
+# диапазона, уникальность имени через каталог, запросы в шард пользователя и перенос в шард 0
+# Проверяем выдачу id: после удаления пользователя с наибольшим id следующая регистрация
+# получает новый id, а не освободившийся (он остаётся занятым в каталоге и старых сессиях)
+@pytest.mark.asyncio
+async def test_user_ids_not_reused():
+    suffix = secrets.token_hex(4)
+    first = await register_user(UserCreate(username=f"ids_{suffix}_a", email=f"ids_{suffix}_a@example.com", password="x"))
+    assert await delete_user(first.id)
+    second = await register_user(UserCreate(username=f"ids_{suffix}_b", email=f"ids_{suffix}_b@example.com", password="x"))
+    third = await register_user(UserCreate(username=f"ids_{suffix}_c", email=f"ids_{suffix}_c@example.com", password="x"))
+    assert first.id < second.id < third.id
+    for user in (second, third):
+        await delete_user(user.id)
+
+
+@pytest.mark.asyncio
+async def test_user_sharding(tmp_path):
+    extra = Shard(len(shards), str(tmp_path / "DataBase.shard.db"))
+    shards.append(extra)
+    reminder_schedulers.append(ReminderScheduler(extra.session))
+    user_id = next_id = None
+    try:
+        await init_db()
+        username = next(name for name in (f"shard_{secrets.token_hex(4)}" for _ in range(100)) if shard_router.place(name) is extra)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.post("/api/v1/users", json={"username": username, "email": f"{username}@example.com", "password": "shardpass"})
+            assert response.status_code == 201
+            user_id = response.json()["id"]
+            assert extra.user_ids[0] < user_id <= extra.user_ids[1] and user_id > USER_ID_RANGE
+            response = await ac.post("/api/v1/users", json={"username": username, "email": f"other_{username}@example.com", "password": "x"})
+            assert response.status_code == 409
+            token = (await ac.post("/api/v1/auth/token", json={"username": username, "password": "shardpass"})).json()["access_token"]
+            ac.headers["Authorization"] = f"Bearer {token}"
+            for title in ("First", "Second", "Third"):
+                await ac.post("/api/v1/todos", json={"title": title, "completed": title == "First", "tags": ["shard"] if title != "Second" else []})
+            version = (await ac.get("/api/v1/todos/stats")).json()["version"]
+            assert (await ac.get("/api/v1/users/me")).json()["username"] == username
+            assert [item["title"] for item in (await ac.get("/api/v1/todos")).json()["items"]] == ["First", "Second", "Third"]
+            async with extra.read_session() as session:
+                assert (await session.execute(select(func.count()).select_from(ToDo).where(ToDo.user_id == user_id))).scalar_one() == 3
+            async with READ_SESSION() as session:
+                assert await session.get(User, user_id) is None
+
+            assert await move_user(user_id, shards[0]) == 3
+            assert await shard_router.shard_for_user(user_id) is shards[0]
+            user_cache.invalidate(user_id)
+            assert [item["title"] for item in (await ac.get("/api/v1/todos")).json()["items"]] == ["First", "Second", "Third"]
+            stats = (await ac.get("/api/v1/todos/stats")).json()
+            assert (stats["total"], stats["completed"]) == (3, 1) and stats["version"] > version
+            assert (await ac.get("/api/v1/tags")).json() == [{"name": "shard", "total": 2, "completed": 1}]
+            # Наибольший id шарда ушёл вместе с пользователем — следующая регистрация не получает его снова
+            next_name = next(name for name in (f"shard_{secrets.token_hex(4)}" for _ in range(100)) if shard_router.place(name) is extra)
+            response = await ac.post("/api/v1/users", json={"username": next_name, "email": f"{next_name}@example.com", "password": "x"})
+            assert response.status_code == 201
+            next_id = response.json()["id"]
+            assert user_id < next_id <= extra.user_ids[1]
+            assert [item["title"] for item in (await ac.get("/api/v1/todos", params={"tag": "shard"})).json()["items"]] == ["First", "Third"]
+            async with extra.read_session() as session:
+                assert await session.get(User, user_id) is None
+                assert (await session.execute(select(func.count()).select_from(ToDo))).scalar_one() == 0
+            assert (await ac.post("/api/v1/auth/token", json={"username": username, "password": "shardpass"})).status_code == 200
+            assert (await ac.delete("/api/v1/users/me")).status_code == 204
+        assert await shard_router.find(username=username) is None
+    finally:
+        # Временный файл шарда исчезнет — запись каталога на него не должна остаться
+        for registered in (user_id, next_id):
+            if registered is not None:
+                await shard_router.unregister(registered)
+        reminder_schedulers.pop()
+        shards.remove(extra)
+        await extra.dispose()